@@ -1,7 +1,7 @@
 """
 VYL Code Generator - Generates x86-64 assembly from AST
 """
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields, is_dataclass
 from typing import Dict, List, Optional, Tuple
 
 try:
@@ -78,11 +78,49 @@ except ImportError:  # pragma: no cover - fallback for direct execution
     )
 
 
+# Seconds a vyl_tcp_connect resolver cache entry stays valid
+DNS_CACHE_TTL_SECONDS = 60
+
+# Bytes of bump-allocated scratch space shared by the HTTP helpers
+HTTP_ARENA_SIZE = 131072
+
+# Bounce buffer used by vyl_copy_file when copy_file_range is unavailable
+COPY_BUFFER_SIZE = 65536
+
+# vyl_alloc serves requests up to SLAB_MAX_SIZE bytes from SLAB_SIZE-byte slabs
+SLAB_MAX_SIZE = 256
+SLAB_SIZE = 65536
+
+# SHA-256 initial hash value and round constants (FIPS 180-4, 5.3.3 / 4.2.2)
+SHA256_IV = (
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+    0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+)
+SHA256_K = (
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5,
+    0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3,
+    0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc,
+    0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7,
+    0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13,
+    0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3,
+    0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5,
+    0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208,
+    0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+)
+
+
 class CodegenError(Exception):
     """Raised when code generation fails."""
 
 
-@dataclass
+@dataclass(slots=True)
 class Symbol:
     name: str
     typ: str
@@ -91,9 +129,25 @@ class Symbol:
     is_param: bool = False
     reg: Optional[str] = None
     size: int = 8
+    location: str = field(init=False)  # assembly operand, formatted once
+
+    def __post_init__(self):
+        if self.reg:
+            self.location = self.reg
+        elif self.is_global:
+            self.location = f"{self.name}(%rip)"
+        else:
+            self.location = f"{self.offset}(%rbp)"
 
 
 class CodeGenerator:
+    # Runtime assembly shared by every program, pre-joined; filled on first use
+    _runtime_text: Optional[str] = None
+    # AST node type -> child field names, for the generic tree walks
+    _node_fields: Dict[type, Tuple[str, ...]] = {}
+    # System V integer argument registers, in order
+    _ARG_REGS = ("%rdi", "%rsi", "%rdx", "%rcx", "%r8", "%r9")
+
     def __init__(self):
         self.output: List[str] = []
         self.label_counter = 0
@@ -104,28 +158,158 @@ class CodeGenerator:
         self.params: Dict[str, Symbol] = {}
         self.globals: Dict[str, Symbol] = {}
         self.function_defs: Dict[str, FunctionDef] = {}  # Store function definitions for default params
-        self.string_literals: List[Tuple[str, str]] = []
+        self.string_literals: Dict[str, str] = {}  # content -> label
         self.struct_layouts: Dict[str, dict] = {}
         self.enum_values: Dict[str, Dict[str, int]] = {}
         self.defer_stack: List[DeferStmt] = []  # Stack of deferred statements
 
+        # Dispatch on the node's exact type: one dict lookup per node instead
+        # of walking an isinstance chain.
+        self._stmt_handlers = {
+            Assignment: lambda stmt, end_label: self.generate_assignment(stmt),
+            VarDecl: self.generate_var_decl,
+            TupleUnpack: self.generate_tuple_unpack,
+            FunctionCall: lambda stmt, end_label: self.generate_function_call(stmt),
+            IfStmt: self.generate_if,
+            WhileStmt: self.generate_while,
+            ForStmt: self.generate_for,
+            DeferStmt: self.generate_defer,
+            Block: self.generate_block,
+            ReturnStmt: self.generate_return,
+            StructDef: lambda stmt, end_label: None,
+        }
+        self._expr_handlers = {
+            Literal: self.generate_literal,
+            Identifier: self.generate_identifier,
+            FieldAccess: self.generate_field_access,
+            IndexExpr: self.generate_index_expr,
+            FunctionCall: self.generate_function_call,
+            NewExpr: self.generate_new_expr,
+            ArrayLiteral: self.generate_array_literal,
+            TupleLiteral: self.generate_tuple_literal,
+            InterpString: self.generate_interp_string,
+            TryExpr: self.generate_try_expr,
+            UnaryExpr: self.generate_unary_expr,
+            BinaryExpr: self.generate_binary_expr,
+            SelfExpr: self.generate_self_expr,
+            NullLiteral: self.generate_null_literal,
+            AddressOf: self.generate_address_of,
+            Dereference: self.generate_dereference,
+            EnumAccess: self.generate_enum_access,
+            MethodCall: self.generate_method_call,
+        }
+
     # ---------- helpers ----------
     def emit(self, line: str):
         self.output.append(line)
 
+    def emit_block(self, block: str):
+        """Emit the non-blank lines of a multi-line *block*, indentation stripped."""
+        self.output.extend(line.strip() for line in block.splitlines() if line.strip())
+
+    def _emit_epilogue(self, *saved: str):
+        """Return from a runtime function whose prologue pushed %rbp, then *saved*.
+
+        Points %rsp back at the saved registers instead of unwinding the
+        locals with addq, then pops them in reverse order.
+        """
+        if not saved:
+            self.emit("leave")
+            self.emit("ret")
+            return
+        self.emit(f"leaq -{8 * len(saved)}(%rbp), %rsp")
+        for reg in reversed(saved):
+            self.emit(f"pop {reg}")
+        self.emit("pop %rbp")
+        self.emit("ret")
+
+    def _emit_decimal_digits(self, prefix: str):
+        """Write the signed value in %rdi as decimal digits ending just below %rsi.
+
+        Leaves %rsi at the first character. Divides by 10 as a multiply by
+        its reciprocal; clobbers %rax, %rcx, %rdx and %r8.
+        """
+        self.emit("movq %rdi, %rax")
+        self.emit("testq %rdi, %rdi")
+        self.emit(f"jns {prefix}_digits")
+        self.emit("negq %rax")                # INT64_MIN stays 2^63 unsigned
+        self.emit(f"{prefix}_digits:")
+        self.emit("movabsq $0xCCCCCCCCCCCCCCCD, %r8")
+        self.emit(f"{prefix}_digit:")
+        self.emit("movq %rax, %rcx")
+        self.emit("mulq %r8")
+        self.emit("shrq $3, %rdx")            # quotient
+        self.emit("leaq (%rdx,%rdx,4), %rax")
+        self.emit("addq %rax, %rax")
+        self.emit("subq %rax, %rcx")          # remainder
+        self.emit("addl $48, %ecx")
+        self.emit("decq %rsi")
+        self.emit("movb %cl, (%rsi)")
+        self.emit("movq %rdx, %rax")
+        self.emit("testq %rax, %rax")
+        self.emit(f"jnz {prefix}_digit")
+        self.emit("testq %rdi, %rdi")
+        self.emit(f"jns {prefix}_signed")
+        self.emit("decq %rsi")
+        self.emit("movb $45, (%rsi)")
+        self.emit(f"{prefix}_signed:")
+
+    def _emit_zero(self, reg: str = "%rax"):
+        """Zero a 64-bit register with the 32-bit xor idiom (clobbers flags)."""
+        if reg[2:].isdigit():
+            low = f"{reg}d"
+        else:
+            low = "%e" + reg[2:]
+        self.emit(f"xorl {low}, {low}")
+
+    def _emit_setcc(self, cc: str):
+        """Turn condition *cc* of the current flags into 0/1 in %rax.
+
+        The movl zeroes %rax without touching the flags, so setcc writes
+        into an already-clean register and needs no movzbq afterwards.
+        """
+        self.emit("movl $0, %eax")
+        self.emit(f"set{cc} %al")
+
+    def _emit_size_class(self, reg: str):
+        """Turn the vyl_alloc size (<= SLAB_MAX_SIZE) in *reg* into its class.
+
+        Classes hold 16 << class data bytes, so class = max(0, ceil(log2(size)) - 4).
+        Clobbers the flags only.
+        """
+        self.emit(f"subq $1, {reg}")
+        self.emit(f"adcq $0, {reg}")     # size 0 stays 0 instead of wrapping
+        self.emit(f"orq $15, {reg}")
+        self.emit(f"bsrq {reg}, {reg}")
+        self.emit(f"subq $3, {reg}")
+
+    def _emit_cold_begin(self):
+        """Send the following rare-path block to .text.unlikely.
+
+        The block must only be entered by jumps and must leave by one, since
+        it no longer sits next to the code around it.
+        """
+        self.emit('.pushsection .text.unlikely,"ax",@progbits')
+
+    def _emit_cold_end(self):
+        self.emit(".popsection")
+
+    def _emit_aligned_label(self, label: str):
+        """Emit *label* at a 16-byte boundary (function entries, loop heads)."""
+        self.emit(".p2align 4, 0x90")
+        self.emit(f"{label}:")
+
     def get_label(self, prefix: str = ".L") -> str:
         lbl = f"{prefix}{self.label_counter}"
         self.label_counter += 1
         return lbl
 
-    def escape_string(self, content: str) -> str:
-        return (
-            content.replace("\\", "\\\\")
-            .replace("\"", "\\\"")
-            .replace("\n", "\\n")
-            .replace("\t", "\\t")
-            .replace("\r", "\\r")
-        )
+    # .asciz escapes, applied in one str.translate pass
+    _ASCIZ_ESCAPES = str.maketrans({"\\": "\\\\", "\"": "\\\"", "\n": "\\n", "\t": "\\t", "\r": "\\r"})
+
+    @staticmethod
+    def escape_string(content: str) -> str:
+        return content.translate(CodeGenerator._ASCIZ_ESCAPES)
 
     def get_variable_symbol(self, name: str) -> Optional[Symbol]:
         if name in self.locals:
@@ -134,13 +318,6 @@ class CodeGenerator:
             return self.params[name]
         return self.globals.get(name)
 
-    def get_variable_location(self, symbol: Symbol) -> str:
-        if symbol.reg:
-            return symbol.reg
-        if symbol.is_global:
-            return f"{symbol.name}(%rip)"
-        return f"{symbol.offset}(%rbp)"
-
     def _infer_type_from_expr(self, expr) -> str:
         """Infer the type of an expression for variable declarations."""
         if isinstance(expr, Literal):
@@ -181,7 +358,7 @@ class CodeGenerator:
     # ---------- entry ----------
     def generate(self, program: Program) -> str:
         self.output = []
-        self.string_literals = []
+        self.string_literals = {}
         self.locals = {}
         self.params = {}
         self.globals = {}
@@ -225,20 +402,76 @@ class CodeGenerator:
             else:
                 self.generate_statement(stmt)
 
-        self.generate_main_stub()
         self.generate_builtin_functions()
 
         if self.string_literals:
-            self.emit(".section .data")
-            for label, content in self.string_literals:
+            self.emit(".section .rodata")
+            for content, label in self.string_literals.items():
                 escaped = self.escape_string(content)
                 self.emit(f"{label}: .asciz \"{escaped}\"")
 
-        # Add format string for int-to-string conversion
-        self.emit(".section .data")
-        self.emit(".int_fmt: .asciz \"%ld\"")
-
-        return "\n".join(self.output)
+        return "\n".join(self._peephole(self.output))
+
+    # Conditional jump -> jump on the opposite condition
+    _JCC_INVERSE = {
+        "je": "jne", "jne": "je", "jl": "jge", "jge": "jl", "jg": "jle", "jle": "jg",
+        "jb": "jae", "jae": "jb", "ja": "jbe", "jbe": "ja", "js": "jns", "jns": "js",
+    }
+
+    @classmethod
+    def _peephole(cls, lines: List[str]) -> List[str]:
+        """Drop redundant register shuffles and jumps between adjacent lines.
+
+        - push R / pop R          -> (nothing)
+        - push R / pop S          -> movq R, S
+        - push R / L / pop S      -> movq R, S / L   (L only loads %rax, not from S or the stack)
+        - movq A, B / movq B, A   -> movq A, B   (B not part of A's address)
+        - movq R, R               -> (nothing)
+        - jmp L / jmp M           -> jmp L   (also after ret)
+        - jmp L / labels.. / L:   -> labels.. / L:   (likewise jCC L)
+        - jCC L1 / jmp L2 / L1:   -> jNCC L2 / L1:
+        """
+        out: List[str] = []
+        for line in lines:
+            prev = out[-1] if out else ""
+            if line.startswith("pop ") and prev.startswith("push "):
+                src, dst = prev[5:], line[4:]
+                out.pop()
+                if src != dst:
+                    out.append(f"movq {src}, {dst}")
+                continue
+            if line.startswith("pop ") and len(out) > 1 and out[-2].startswith("push "):
+                src, dst = out[-2][5:], line[4:]
+                loads_rax = prev == "xorl %eax, %eax" or (
+                    prev.startswith("movq ") and prev.endswith(", %rax")
+                    and dst not in prev and "%rsp" not in prev)
+                if loads_rax and dst != "%rax":
+                    out[-2:] = [f"movq {src}, {dst}", prev]
+                    continue
+            if line.startswith("movq "):
+                c, _, d = line[5:].partition(", ")
+                if c == d:
+                    continue
+                if prev.startswith("movq "):
+                    a, _, b = prev[5:].partition(", ")
+                    if a == d and b == c and b not in a:
+                        continue
+            if line.startswith("jmp ") and (prev.startswith("jmp ") or prev == "ret"):
+                continue
+            if line.endswith(":"):
+                label = line[:-1]
+                i = len(out) - 1
+                while i >= 0 and out[i].endswith(":"):
+                    i -= 1
+                jump, _, target = out[i].partition(" ") if i >= 0 else ("", "", "")
+                if target == label and (jump == "jmp" or jump in cls._JCC_INVERSE):
+                    del out[i]
+                elif prev.startswith("jmp ") and len(out) > 1:
+                    jcc, _, target = out[-2].partition(" ")
+                    if target == label and jcc in cls._JCC_INVERSE:
+                        out[-2:] = [f"{cls._JCC_INVERSE[jcc]} {prev[4:]}"]
+            out.append(line)
+        return out
 
     # ---------- globals ----------
     def process_global_var(self, decl: VarDecl):
@@ -253,15 +486,37 @@ class CodeGenerator:
             self.emit(f".quad {data_label}")
         else:
             self.emit(f"{decl.name}:")
-            if decl.value and isinstance(decl.value, Literal) and decl.value.literal_type != "string":
-                self.emit(f".quad {decl.value.value}")
-            else:
-                self.emit(".quad 0")
+            value = self._fold(decl.value) if decl.value else None
+            if value is None and isinstance(decl.value, Literal) and decl.value.literal_type in ("bool", "dec"):
+                value = int(decl.value.value)
+            self.emit(f".quad {value or 0}")
         self.emit(".section .text")
         self.globals[decl.name] = Symbol(decl.name, var_type, True, 0, size=8)
 
     # ---------- functions ----------
     def generate_function(self, func: FunctionDef):
+        """Emit *func*, keeping its first parameters and hottest locals in registers.
+
+        The function is first generated as a leaf, with parameters in %r10 and
+        %r11 and locals in %r8/%r9 (plus any parameter register left over):
+        expression code never uses them as scratch, and they need no
+        save/restore. If the body turns out to call anything, the attempt is
+        discarded and the function regenerated with callee-saved %r14/%r15
+        for parameters and %r13 for locals.
+        """
+        start = len(self.output)
+        label_counter = self.label_counter
+        literal_count = len(self.string_literals)
+        self._generate_function(func, ["%r10", "%r11"], ["%r8", "%r9"], save_regs=False)
+        if any(line.startswith("call ") for line in self.output[start:]):
+            del self.output[start:]
+            for content in list(self.string_literals)[literal_count:]:
+                del self.string_literals[content]
+            self.label_counter = label_counter
+            self._generate_function(func, ["%r14", "%r15"], ["%r13"], save_regs=True)
+
+    def _generate_function(self, func: FunctionDef, param_reg_pool: List[str],
+                           local_reg_pool: List[str], save_regs: bool):
         self.current_function = func.name
         self.locals = {}
         self.params = {}
@@ -270,14 +525,18 @@ class CodeGenerator:
         # Collect locals
         decls = self.collect_var_decls(func.body) if func.body else []
 
-        arg_regs = ["%rdi", "%rsi", "%rdx", "%rcx", "%r8", "%r9"]
-        param_reg_pool = ["%r14", "%r15"]  # callee-saved to survive calls
         reg_param_count = min(len(func.params), len(param_reg_pool))
-        saved_regs = param_reg_pool[:reg_param_count]
+        param_names = [p[0] for p in func.params]
+        decls, local_regs = self._assign_local_regs(
+            func.body, decls, param_names, param_reg_pool[reg_param_count:] + local_reg_pool)
+        saved_regs = param_reg_pool[:reg_param_count] if save_regs else []
+        if save_regs:
+            saved_regs += [r for r in param_reg_pool + local_reg_pool
+                           if r in local_regs.values() and r not in saved_regs]
 
         # Stack slots for non-register params + locals
         total_slots = (len(func.params) - reg_param_count)
-        locals_size = sum(self.var_size(d.var_type or "int") for d in decls)
+        locals_size = sum(self.var_size(d.var_type or "int") for d in decls if d.name not in local_regs)
         stack_bytes = total_slots * 8 + locals_size
         
         # Account for stack alignment: after push rbp + saved_regs pushes
@@ -290,12 +549,18 @@ class CodeGenerator:
         if total_frame % 16 != 0:
             stack_bytes += 8  # add padding to align
         
-        offset = -stack_bytes if stack_bytes else 0
+        # Slots start below the saved registers pushed after %rbp
+        offset = -(saved_regs_bytes + stack_bytes) if stack_bytes else 0
+
+        # A leaf with nothing on the stack needs no frame at all; anything
+        # that calls keeps one so %rsp stays 16-byte aligned at the call.
+        needs_frame = bool(stack_bytes or saved_regs) or save_regs or func.name == "Main"
 
         self.emit(f".globl {func.name}")
-        self.emit(f"{func.name}:")
-        self.emit("push %rbp")
-        self.emit("movq %rsp, %rbp")
+        self._emit_aligned_label(func.name)
+        if needs_frame:
+            self.emit("push %rbp")
+            self.emit("movq %rsp, %rbp")
 
         for reg in saved_regs:
             self.emit(f"push {reg}")
@@ -320,18 +585,18 @@ class CodeGenerator:
         for idx, (pname, _, pdefault) in enumerate(func.params):
             sym = self.params[pname]
             if sym.reg:
-                if idx < len(arg_regs):
-                    self.emit(f"movq {arg_regs[idx]}, {sym.reg}")
+                if idx < len(self._ARG_REGS):
+                    self.emit(f"movq {self._ARG_REGS[idx]}, {sym.reg}")
                 else:
-                    src_offset = 16 + (idx - len(arg_regs)) * 8
+                    src_offset = 16 + (idx - len(self._ARG_REGS)) * 8
                     self.emit(f"movq {src_offset}(%rbp), {sym.reg}")
             else:
-                if idx < len(arg_regs):
-                    self.emit(f"movq {arg_regs[idx]}, {self.get_variable_location(sym)}")
+                if idx < len(self._ARG_REGS):
+                    self.emit(f"movq {self._ARG_REGS[idx]}, {sym.location}")
                 else:
-                    src_offset = 16 + (idx - len(arg_regs)) * 8
+                    src_offset = 16 + (idx - len(self._ARG_REGS)) * 8
                     self.emit(f"movq {src_offset}(%rbp), %rax")
-                    self.emit(f"movq %rax, {self.get_variable_location(sym)}")
+                    self.emit(f"movq %rax, {sym.location}")
 
         # Assign locals after params
         for d in decls:
@@ -342,6 +607,9 @@ class CodeGenerator:
                 var_type = self._infer_type_from_expr(d.value)
             else:
                 var_type = "int"
+            if d.name in local_regs:
+                self.locals[d.name] = Symbol(d.name, var_type, False, 0, reg=local_regs[d.name])
+                continue
             size = self.var_size(var_type)
             sym = Symbol(d.name, var_type, False, offset_cursor, size=size)
             self.locals[d.name] = sym
@@ -355,9 +623,9 @@ class CodeGenerator:
             var_type = d.var_type or "int"
             if var_type in self.struct_layouts:
                 size = self.struct_layouts[var_type]["size"]
-                loc = self.get_variable_location(self.locals[d.name])
+                loc = self.locals[d.name].location
                 self.emit(f"movq ${size}, %rdi")
-                self.emit("call vyl_alloc")
+                self.emit("call vyl_calloc")
                 self.emit(f"movq %rax, {loc}")
 
         if func.body:
@@ -365,7 +633,7 @@ class CodeGenerator:
                 self.generate_statement(stmt, end_label=end_lbl)
 
         if func.name == "Main":
-            self.emit("movq $0, %rax")
+            self._emit_zero()
         # Execute any remaining deferred statements for implicit return
         self._emit_deferred_statements()
         self.emit(f"{end_lbl}:")
@@ -373,7 +641,8 @@ class CodeGenerator:
             self.emit(f"addq ${stack_bytes}, %rsp")
         for reg in reversed(saved_regs):
             self.emit(f"pop {reg}")
-        self.emit("leave")
+        if needs_frame:
+            self.emit("leave")
         self.emit("ret")
         self.current_function = None
 
@@ -392,14 +661,16 @@ class CodeGenerator:
         # 'self' is the first argument (pointer to struct), then explicit params
         all_params = [("self", struct.name)] + list(method.params)
 
-        arg_regs = ["%rdi", "%rsi", "%rdx", "%rcx", "%r8", "%r9"]
         param_reg_pool = ["%r14", "%r15", "%r13"]  # callee-saved to survive calls
         reg_param_count = min(len(all_params), len(param_reg_pool))
-        saved_regs = param_reg_pool[:reg_param_count]
+        # Parameter registers left over hold the hottest locals instead
+        decls, local_regs = self._assign_local_regs(
+            method.body, decls, [p[0] for p in all_params], param_reg_pool[reg_param_count:])
+        saved_regs = param_reg_pool[:reg_param_count] + list(local_regs.values())
 
         # Stack slots for non-register params + locals
         total_slots = (len(all_params) - reg_param_count)
-        locals_size = sum(self.var_size(d.var_type or "int") for d in decls)
+        locals_size = sum(self.var_size(d.var_type or "int") for d in decls if d.name not in local_regs)
         stack_bytes = total_slots * 8 + locals_size
 
         saved_regs_bytes = len(saved_regs) * 8
@@ -407,10 +678,11 @@ class CodeGenerator:
         if total_frame % 16 != 0:
             stack_bytes += 8
 
-        offset = -stack_bytes if stack_bytes else 0
+        # Slots start below the saved registers pushed after %rbp
+        offset = -(saved_regs_bytes + stack_bytes) if stack_bytes else 0
 
         self.emit(f".globl {method_name}")
-        self.emit(f"{method_name}:")
+        self._emit_aligned_label(method_name)
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
 
@@ -437,18 +709,18 @@ class CodeGenerator:
         for idx, (pname, _) in enumerate(all_params):
             sym = self.params[pname]
             if sym.reg:
-                if idx < len(arg_regs):
-                    self.emit(f"movq {arg_regs[idx]}, {sym.reg}")
+                if idx < len(self._ARG_REGS):
+                    self.emit(f"movq {self._ARG_REGS[idx]}, {sym.reg}")
                 else:
-                    src_offset = 16 + (idx - len(arg_regs)) * 8
+                    src_offset = 16 + (idx - len(self._ARG_REGS)) * 8
                     self.emit(f"movq {src_offset}(%rbp), {sym.reg}")
             else:
-                if idx < len(arg_regs):
-                    self.emit(f"movq {arg_regs[idx]}, {self.get_variable_location(sym)}")
+                if idx < len(self._ARG_REGS):
+                    self.emit(f"movq {self._ARG_REGS[idx]}, {sym.location}")
                 else:
-                    src_offset = 16 + (idx - len(arg_regs)) * 8
+                    src_offset = 16 + (idx - len(self._ARG_REGS)) * 8
                     self.emit(f"movq {src_offset}(%rbp), %rax")
-                    self.emit(f"movq %rax, {self.get_variable_location(sym)}")
+                    self.emit(f"movq %rax, {sym.location}")
 
         # Assign locals after params
         for d in decls:
@@ -459,6 +731,9 @@ class CodeGenerator:
                 var_type = self._infer_type_from_expr(d.value)
             else:
                 var_type = "int"
+            if d.name in local_regs:
+                self.locals[d.name] = Symbol(d.name, var_type, False, 0, reg=local_regs[d.name])
+                continue
             size = self.var_size(var_type)
             sym = Symbol(d.name, var_type, False, offset_cursor, size=size)
             self.locals[d.name] = sym
@@ -472,9 +747,9 @@ class CodeGenerator:
             var_type = d.var_type or "int"
             if var_type in self.struct_layouts:
                 size = self.struct_layouts[var_type]["size"]
-                loc = self.get_variable_location(self.locals[d.name])
+                loc = self.locals[d.name].location
                 self.emit(f"movq ${size}, %rdi")
-                self.emit("call vyl_alloc")
+                self.emit("call vyl_calloc")
                 self.emit(f"movq %rax, {loc}")
 
         if method.body:
@@ -494,78 +769,75 @@ class CodeGenerator:
         self.params = {}
 
     def generate_main_stub(self):
-        self.emit(".globl main")
-        self.emit("main:")
-        self.emit("push %rbp")
-        self.emit("movq %rsp, %rbp")
-        self.emit("movq %rdi, argc_store(%rip)")
-        self.emit("movq %rsi, argv_store(%rip)")
-        self.emit("movq %rbp, stack_base(%rip)")
-        # After push rbp, rsp % 16 == 0. Keep aligned for calls.
-        self.emit("subq $16, %rsp")
-        # seed rand()
-        self.emit("movq $0, %rdi")
-        self.emit("call time")
-        self.emit("movq %rax, %rdi")
-        self.emit("call srand")
-        self.emit("call Main")
-        self.emit("movq %rax, %rdi")
-        self.emit("movq $60, %rax")
-        self.emit("syscall")
+        # After push rbp, rsp % 16 == 0; the subq keeps it aligned for calls.
+        self.emit_block("""
+            .globl main
+            main:
+            push %rbp
+            movq %rsp, %rbp
+            movq %rdi, argc_store(%rip)
+            movq %rsi, argv_store(%rip)
+            movq %rbp, stack_base(%rip)
+            subq $16, %rsp
+            xorl %edi, %edi
+            call time
+            movq %rax, %rdi
+            call srand
+            call Main
+            movq %rax, %rdi
+            movq $60, %rax
+            syscall
+        """)
 
     def generate_statement(self, stmt, end_label: Optional[str] = None):
-        if isinstance(stmt, Assignment):
-            self.generate_assignment(stmt)
-        elif isinstance(stmt, VarDecl):
-            sym = self.get_variable_symbol(stmt.name)
+        handler = self._stmt_handlers.get(type(stmt))
+        if handler is None:
+            self.generate_expression(stmt)
+        else:
+            handler(stmt, end_label)
+
+    def generate_var_decl(self, stmt: VarDecl, end_label: Optional[str] = None):
+        sym = self.get_variable_symbol(stmt.name)
+        if not sym:
+            raise CodegenError(f"Undefined local declaration for '{stmt.name}'")
+        if stmt.value:
+            self.generate_expression(stmt.value)
+            self.emit(f"movq %rax, {sym.location}")
+
+    def generate_tuple_unpack(self, stmt: TupleUnpack, end_label: Optional[str] = None):
+        # Generate the tuple expression - tuple values are laid out on stack
+        self.generate_expression(stmt.value)
+        # %rax now points to the tuple base address
+        # Unpack each element into its corresponding variable
+        for i, name in enumerate(stmt.names):
+            sym = self.get_variable_symbol(name)
             if not sym:
-                raise CodegenError(f"Undefined local declaration for '{stmt.name}'")
-            if stmt.value:
-                self.generate_expression(stmt.value)
-                self.emit(f"movq %rax, {self.get_variable_location(sym)}")
-        elif isinstance(stmt, TupleUnpack):
-            # Generate the tuple expression - tuple values are laid out on stack
+                raise CodegenError(f"Undefined local declaration for '{name}'")
+            # Each tuple element is 8 bytes
+            offset = i * 8
+            self.emit(f"movq {offset}(%rax), %rcx")
+            self.emit(f"movq %rcx, {sym.location}")
+
+    def generate_defer(self, stmt: DeferStmt, end_label: Optional[str] = None):
+        # Add defer to stack - will be executed when function returns
+        self.defer_stack.append(stmt)
+
+    def generate_block(self, stmt: Block, end_label: Optional[str] = None):
+        for s in stmt.statements:
+            self.generate_statement(s, end_label=end_label)
+
+    def generate_return(self, stmt: ReturnStmt, end_label: Optional[str] = None):
+        if stmt.value:
             self.generate_expression(stmt.value)
-            # %rax now points to the tuple base address
-            # Unpack each element into its corresponding variable
-            for i, name in enumerate(stmt.names):
-                sym = self.get_variable_symbol(name)
-                if not sym:
-                    raise CodegenError(f"Undefined local declaration for '{name}'")
-                # Each tuple element is 8 bytes
-                offset = i * 8
-                self.emit(f"movq {offset}(%rax), %rcx")
-                self.emit(f"movq %rcx, {self.get_variable_location(sym)}")
-        elif isinstance(stmt, FunctionCall):
-            self.generate_function_call(stmt)
-        elif isinstance(stmt, IfStmt):
-            self.generate_if(stmt, end_label=end_label)
-        elif isinstance(stmt, WhileStmt):
-            self.generate_while(stmt, end_label=end_label)
-        elif isinstance(stmt, ForStmt):
-            self.generate_for(stmt, end_label=end_label)
-        elif isinstance(stmt, DeferStmt):
-            # Add defer to stack - will be executed when function returns
-            self.defer_stack.append(stmt)
-        elif isinstance(stmt, Block):
-            for s in stmt.statements:
-                self.generate_statement(s, end_label=end_label)
-        elif isinstance(stmt, ReturnStmt):
-            if stmt.value:
-                self.generate_expression(stmt.value)
-            else:
-                self.emit("movq $0, %rax")
-            # Execute all deferred statements in LIFO order
-            self._emit_deferred_statements()
-            if end_label:
-                self.emit(f"jmp {end_label}")
-            else:
-                self.emit("leave")
-                self.emit("ret")
-        elif isinstance(stmt, StructDef):
-            return
         else:
-            self.generate_expression(stmt)
+            self._emit_zero()
+        # Execute all deferred statements in LIFO order
+        self._emit_deferred_statements()
+        if end_label:
+            self.emit(f"jmp {end_label}")
+        else:
+            self.emit("leave")
+            self.emit("ret")
 
     def _emit_deferred_statements(self):
         """Emit all deferred statements in LIFO order, preserving return value."""
@@ -613,300 +885,436 @@ class CodeGenerator:
                 decls.extend(self.collect_from_if(node.else_block))
         return decls
 
-    # ---------- expressions ----------
-    def generate_expression(self, expr):
-        if isinstance(expr, Literal):
-            if expr.literal_type == "int":
-                self.emit(f"movq ${expr.value}, %rax")
-            elif expr.literal_type == "dec":
-                self.emit(f"movq ${int(expr.value)}, %rax")
-            elif expr.literal_type == "string":
-                label = self.get_label(".str")
-                self.string_literals.append((label, expr.value))
-                self.emit(f"leaq {label}(%rip), %rax")
-            elif expr.literal_type == "bool":
-                self.emit(f"movq ${1 if expr.value else 0}, %rax")
-            return
+    def _assign_local_regs(self, body: Optional[Block], decls: List[VarDecl], param_names: List[str],
+                           pool: List[str]) -> Tuple[List[VarDecl], Dict[str, str]]:
+        """Pick which locals of a function body live in the registers of *pool*.
 
-        if isinstance(expr, Identifier):
-            if expr.name == "argc":
-                self.emit("movq argc_store(%rip), %rax")
-            elif expr.name == "argv":
-                self.emit("movq argv_store(%rip), %rax")
-            else:
-                sym = self.get_variable_symbol(expr.name)
-                if not sym:
-                    raise CodegenError(f"Undefined variable '{expr.name}'")
-                self.emit(f"movq {self.get_variable_location(sym)}, %rax")
-            return
+        Returns *decls* extended with the body's for-loop variables (which
+        need a home like any other local) and a name -> register map for the
+        most used locals. Locals whose address is taken stay on the stack.
+        """
+        uses: Dict[str, int] = {}
+        taken: set = set()
+        loop_vars: List[str] = []
+        self._count_local_uses(body, uses, taken, loop_vars)
+        declared = {d.name for d in decls}
+        for name in loop_vars:
+            if name not in declared and name not in param_names:
+                declared.add(name)
+                decls = decls + [VarDecl(name=name, var_type="int")]
+        candidates = [name for name in dict.fromkeys(d.name for d in decls)
+                      if uses.get(name) and name not in taken and name not in param_names]
+        candidates.sort(key=lambda name: -uses[name])
+        return decls, dict(zip(candidates, pool))
+
+    def _child_fields(self, node) -> Tuple[str, ...]:
+        """Names of the fields of AST *node* that can hold child nodes (none for non-nodes)."""
+        names = self._node_fields.get(type(node))
+        if names is None:
+            names = tuple(f.name for f in fields(node)
+                          if f.name not in ("line", "column")) if is_dataclass(node) else ()
+            self._node_fields[type(node)] = names
+        return names
+
+    def _has_side_effects(self, node) -> bool:
+        """Whether evaluating *node* may call user code or assign a variable."""
+        if isinstance(node, (list, tuple)):
+            return any(self._has_side_effects(item) for item in node)
+        # Interpolated parts are only parsed at generation time
+        if isinstance(node, (FunctionCall, MethodCall, Assignment, InterpString)):
+            return True
+        return any(self._has_side_effects(getattr(node, name)) for name in self._child_fields(node))
 
-        if isinstance(expr, FieldAccess):
-            # Check if this is an enum access (receiver is an identifier that names an enum)
-            if isinstance(expr.receiver, Identifier):
-                enum_name = expr.receiver.name
-                if enum_name in self.enum_values:
-                    variant = expr.field
-                    if variant not in self.enum_values[enum_name]:
-                        raise CodegenError(f"Unknown enum variant '{enum_name}.{variant}'")
-                    val = self.enum_values[enum_name][variant]
-                    self.emit(f"movq ${val}, %rax")
-                    return
-            self.generate_address(expr, dest="%rax")
-            self.emit("movq (%rax), %rax")
-            return
+    def _count_local_uses(self, node, uses: Dict[str, int], taken: set, loop_vars: List[str], weight: int = 1):
+        """Add up how often each name is read or written under *node*.
 
-        if isinstance(expr, IndexExpr):
-            # Save base while computing index; index expression may call functions
-            self.generate_expression(expr.receiver)
-            self.emit("push %rax")
-            self.generate_expression(expr.index)
-            self.emit("movq %rax, %rcx")
-            self.emit("pop %rbx")
-            bounds_fail = self.get_label("oob")
-            self.emit("cmpq $0, %rbx")
-            self.emit(f"je {bounds_fail}")
-            self.emit("cmpq $0, %rcx")
-            self.emit(f"jl {bounds_fail}")
-            self.emit("movq -8(%rbx), %rdx")
-            self.emit("cmpq %rdx, %rcx")
-            self.emit(f"jae {bounds_fail}")
-            self.emit("imulq $8, %rcx")
-            self.emit("addq %rcx, %rbx")
-            self.emit("movq (%rbx), %rax")
-            self.emit(f"jmp {bounds_fail}_done")
-            self.emit(f"{bounds_fail}:")
-            self.emit("call vyl_bounds_fail")
-            self.emit(f"{bounds_fail}_done:")
+        Anything inside a loop counts 8x per nesting level.
+        """
+        if isinstance(node, (list, tuple)):
+            for item in node:
+                self._count_local_uses(item, uses, taken, loop_vars, weight)
             return
-
-        if isinstance(expr, FunctionCall):
-            self.generate_function_call(expr)
+        names = self._child_fields(node)
+        if not names:
             return
-
-        if isinstance(expr, NewExpr):
-            self.generate_new_expr(expr)
+        if isinstance(node, Identifier):
+            uses[node.name] = uses.get(node.name, 0) + weight
+        elif isinstance(node, (Assignment, VarDecl)) and node.name:
+            uses[node.name] = uses.get(node.name, 0) + weight
+        elif isinstance(node, AddressOf) and isinstance(node.operand, Identifier):
+            taken.add(node.operand.name)
+        elif isinstance(node, ForStmt):
+            loop_vars.append(node.var_name)
+            # read, compared and bumped on every iteration
+            uses[node.var_name] = uses.get(node.var_name, 0) + weight * 24
+            self._count_local_uses([node.start, node.end], uses, taken, loop_vars, weight)
+            self._count_local_uses(node.body, uses, taken, loop_vars, weight * 8)
             return
-
-        if isinstance(expr, ArrayLiteral):
-            self.generate_array_literal(expr)
+        elif isinstance(node, WhileStmt):
+            self._count_local_uses([node.condition, node.body], uses, taken, loop_vars, weight * 8)
             return
+        for name in names:
+            self._count_local_uses(getattr(node, name), uses, taken, loop_vars, weight)
 
-        if isinstance(expr, TupleLiteral):
-            self.generate_tuple_literal(expr)
-            return
+    # ---------- expressions ----------
+    def generate_expression(self, expr):
+        handler = self._expr_handlers.get(type(expr))
+        if handler is None:
+            raise CodegenError(f"Unsupported expression type: {type(expr).__name__}")
+        handler(expr)
+
+    def _emit_int(self, value: int):
+        """Load the integer constant *value* into %rax."""
+        if value == 0:
+            self._emit_zero()
+        else:
+            self.emit(f"movq ${value}, %rax")
 
-        if isinstance(expr, InterpString):
-            self.generate_interp_string(expr)
-            return
+    def _string_label(self, content: str) -> str:
+        """Return the label of the read-only literal holding *content*.
+
+        Identical literals share one label.
+        """
+        label = self.string_literals.get(content)
+        if label is None:
+            label = self.get_label(".str")
+            self.string_literals[content] = label
+        return label
+
+    def generate_literal(self, expr: Literal):
+        if expr.literal_type == "int":
+            self._emit_int(expr.value)
+        elif expr.literal_type == "dec":
+            self.emit(f"movq ${int(expr.value)}, %rax")
+        elif expr.literal_type == "string":
+            self.emit(f"leaq {self._string_label(expr.value)}(%rip), %rax")
+        elif expr.literal_type == "bool":
+            self.emit(f"movq ${1 if expr.value else 0}, %rax")
+
+    def generate_identifier(self, expr: Identifier):
+        if expr.name == "argc":
+            self.emit("movq argc_store(%rip), %rax")
+        elif expr.name == "argv":
+            self.emit("movq argv_store(%rip), %rax")
+        else:
+            sym = self.get_variable_symbol(expr.name)
+            if not sym:
+                raise CodegenError(f"Undefined variable '{expr.name}'")
+            self.emit(f"movq {sym.location}, %rax")
+
+    def generate_field_access(self, expr: FieldAccess):
+        # Check if this is an enum access (receiver is an identifier that names an enum)
+        if isinstance(expr.receiver, Identifier):
+            enum_name = expr.receiver.name
+            if enum_name in self.enum_values:
+                variant = expr.field
+                if variant not in self.enum_values[enum_name]:
+                    raise CodegenError(f"Unknown enum variant '{enum_name}.{variant}'")
+                val = self.enum_values[enum_name][variant]
+                self.emit(f"movq ${val}, %rax")
+                return
+        self.generate_address(expr, dest="%rax")
+        self.emit("movq (%rax), %rax")
 
-        if isinstance(expr, TryExpr):
-            self.generate_try_expr(expr)
+    def generate_index_expr(self, expr: IndexExpr):
+        # Save base while computing index; index expression may call functions
+        self.generate_expression(expr.receiver)
+        self.emit("push %rax")
+        self.generate_expression(expr.index)
+        self.emit("movq %rax, %rcx")
+        self.emit("pop %rbx")
+        bounds_fail = self.get_label("oob")
+        self.emit("testq %rbx, %rbx")
+        self.emit(f"je {bounds_fail}")
+        self.emit("testq %rcx, %rcx")
+        self.emit(f"jl {bounds_fail}")
+        self.emit("movq -8(%rbx), %rdx")
+        self.emit("cmpq %rdx, %rcx")
+        self.emit(f"jae {bounds_fail}")
+        self.emit("imulq $8, %rcx")
+        self.emit("addq %rcx, %rbx")
+        self.emit("movq (%rbx), %rax")
+        self.emit(f"jmp {bounds_fail}_done")
+        self.emit(f"{bounds_fail}:")
+        self.emit("call vyl_bounds_fail")
+        self.emit(f"{bounds_fail}_done:")
+
+    def generate_unary_expr(self, expr: UnaryExpr):
+        value = self._fold(expr)
+        if value is not None:
+            self._emit_int(value)
+            return
+        self.generate_expression(expr.operand)
+        if expr.operator == "-":
+            self.emit("negq %rax")
+        elif expr.operator in ("!", "NOT"):
+            self.emit("testq %rax, %rax")
+            self._emit_setcc("e")
+
+    def _generate_operands(self, left, right):
+        """Evaluate a binary operator's operands into %rax (left) and %rbx (right).
+
+        A literal or variable on the right is loaded straight into %rbx;
+        otherwise the left value waits on the stack while the right is
+        evaluated.
+        """
+        self.generate_expression(left)
+        src = self._simple_operand(right)
+        if src == "$0":
+            self._emit_zero("%rbx")
             return
+        if src is not None:
+            self.emit(f"movq {src}, %rbx")
+            return
+        self.emit("push %rax")
+        self.generate_expression(right)
+        self.emit("movq %rax, %rbx")
+        self.emit("pop %rax")
 
-        if isinstance(expr, UnaryExpr):
-            self.generate_expression(expr.operand)
-            if expr.operator == "-":
+    def _generate_lea(self, expr: BinaryExpr) -> bool:
+        """Emit an int + or - as a single leaq when its operands allow it.
+
+        Handles a variable or expression plus/minus a 32-bit constant, the
+        sum of two register-held variables, and a + b * 2, 4 or 8 as a scaled
+        index. Returns False (emitting nothing) when the generic path is
+        needed.
+        """
+        right = self._fold(expr.right)
+        if right is not None and expr.operator == "-":
+            right = -right
+        if right is not None and -(1 << 31) <= right < (1 << 31):
+            self.generate_expression(expr.left)
+            if right:
+                self.emit(f"leaq {right}(%rax), %rax")
+            return True
+        if expr.operator != "+":
+            return False
+        left = self._fold(expr.left)
+        if left is not None and -(1 << 31) <= left < (1 << 31):
+            self.generate_expression(expr.right)
+            if left:
+                self.emit(f"leaq {left}(%rax), %rax")
+            return True
+        regs = [self._simple_operand(side) for side in (expr.left, expr.right)]
+        if all(reg and reg.startswith("%") for reg in regs):
+            self.emit(f"leaq ({regs[0]},{regs[1]},1), %rax")
+            return True
+        for index, scaled in enumerate((expr.left, expr.right)):
+            operand, scale = self._lea_index(scaled)
+            if operand is None:
+                continue
+            base = self._simple_operand(expr.left if index else expr.right)
+            reg = self._simple_operand(operand)
+            if base and reg and base.startswith("%") and reg.startswith("%"):
+                self.emit(f"leaq ({base},{reg},{scale}), %rax")
+            elif index:
+                self._generate_operands(expr.left, operand)
+                self.emit(f"leaq (%rax,%rbx,{scale}), %rax")
+            else:
+                self._generate_operands(operand, expr.right)
+                self.emit(f"leaq (%rbx,%rax,{scale}), %rax")
+            return True
+        return False
+
+    def _lea_index(self, expr):
+        """Split x * 2, 4 or 8 (either way round) into (x, scale), else (None, None)."""
+        if not isinstance(expr, BinaryExpr) or expr.operator != "*":
+            return None, None
+        for operand, factor in ((expr.left, expr.right), (expr.right, expr.left)):
+            if self._fold(factor) in (2, 4, 8):
+                return operand, self._fold(factor)
+        return None, None
+
+    # Multipliers a single leaq can apply: (%rax,%rax,scale)
+    _LEA_SCALES = {3: 2, 5: 4, 9: 8}
+
+    def _generate_by_constant(self, expr: BinaryExpr) -> bool:
+        """Emit an int *, / or % by a constant without idivq where possible.
+
+        Multiplication by 0, +-1, powers of two and 3/5/9 becomes a zeroing,
+        a move, negq, shlq or leaq, and any other 32-bit factor an imulq
+        immediate. Signed division and remainder by 2^k shift with the usual
+        round-toward-zero bias. Returns False (emitting nothing) otherwise.
+        """
+        op = expr.operator
+        const = self._fold(expr.right)
+        other = expr.left
+        if const is None and op == "*":
+            const = self._fold(expr.left)
+            other = expr.right
+        if const is None or not -(1 << 31) <= const < (1 << 31):
+            return False
+        shift = const.bit_length() - 1 if const > 0 and const & (const - 1) == 0 else None
+        if op == "*":
+            self.generate_expression(other)
+            if const == 0:
+                self._emit_zero()
+            elif const == -1:
                 self.emit("negq %rax")
-            elif expr.operator in ("!", "NOT"):
-                self.emit("cmpq $0, %rax")
-                self.emit("sete %al")
-                self.emit("movzbq %al, %rax")
+            elif shift is not None:
+                if shift:
+                    self.emit(f"shlq ${shift}, %rax")
+            elif const in self._LEA_SCALES:
+                self.emit(f"leaq (%rax,%rax,{self._LEA_SCALES[const]}), %rax")
+            else:
+                self.emit(f"imulq ${const}, %rax, %rax")
+            return True
+        if const == -1 and op == "/":
+            self.generate_expression(other)
+            self.emit("negq %rax")
+            return True
+        if shift is None:
+            return False
+        self.generate_expression(other)
+        if shift == 0:
+            if op == "%":
+                self._emit_zero()
+            return True
+        # Negative dividends get 2^k - 1 added first so the shift truncates
+        # toward zero like idivq
+        self.emit("movq %rax, %rdx")
+        self.emit("sarq $63, %rdx")
+        self.emit(f"shrq ${64 - shift}, %rdx")
+        if op == "/":
+            self.emit("addq %rdx, %rax")
+            self.emit(f"sarq ${shift}, %rax")
+        else:
+            self.emit("leaq (%rax,%rdx,1), %rcx")
+            self.emit(f"andq ${-const}, %rcx")
+            self.emit("subq %rcx, %rax")
+        return True
+
+    def generate_binary_expr(self, expr: BinaryExpr):
+        # Short-circuit logical ops
+        if expr.operator in ("&&", "||"):
+            end_lbl = self.get_label("bool_end")
+            false_lbl = self.get_label("bool_false")
+            true_lbl = self.get_label("bool_true") if expr.operator == "||" else None
+            # Evaluate left
+            self.generate_expression(expr.left)
+            self.emit("testq %rax, %rax")
+            if expr.operator == "&&":
+                self.emit(f"je {false_lbl}")
+                self.generate_expression(expr.right)
+                self.emit("testq %rax, %rax")
+                self.emit(f"je {false_lbl}")
+                self.emit("movl $1, %eax")
+                self.emit(f"jmp {end_lbl}")
+                self.emit(f"{false_lbl}:")
+                self._emit_zero()
+                self.emit(f"{end_lbl}:")
+            else:  # ||
+                self.emit(f"jne {true_lbl}")
+                self.generate_expression(expr.right)
+                self.emit("testq %rax, %rax")
+                self.emit(f"jne {true_lbl}")
+                self._emit_zero()
+                self.emit(f"jmp {end_lbl}")
+                self.emit(f"{true_lbl}:")
+                self.emit("movl $1, %eax")
+                self.emit(f"{end_lbl}:")
             return
 
-        if isinstance(expr, BinaryExpr):
-            # Short-circuit logical ops
-            if expr.operator in ("&&", "||"):
-                end_lbl = self.get_label("bool_end")
-                false_lbl = self.get_label("bool_false")
-                true_lbl = self.get_label("bool_true") if expr.operator == "||" else None
-                # Evaluate left
-                self.generate_expression(expr.left)
-                self.emit("cmpq $0, %rax")
-                if expr.operator == "&&":
-                    self.emit(f"je {false_lbl}")
-                    self.generate_expression(expr.right)
-                    self.emit("cmpq $0, %rax")
-                    self.emit(f"je {false_lbl}")
-                    self.emit("movq $1, %rax")
-                    self.emit(f"jmp {end_lbl}")
-                    self.emit(f"{false_lbl}:")
-                    self.emit("movq $0, %rax")
-                    self.emit(f"{end_lbl}:")
-                else:  # ||
-                    self.emit(f"jne {true_lbl}")
-                    self.generate_expression(expr.right)
-                    self.emit("cmpq $0, %rax")
-                    self.emit(f"jne {true_lbl}")
-                    self.emit("movq $0, %rax")
-                    self.emit(f"jmp {end_lbl}")
-                    self.emit(f"{true_lbl}:")
-                    self.emit("movq $1, %rax")
-                    self.emit(f"{end_lbl}:")
-                return
+        value = self._fold(expr)
+        if value is not None:
+            self._emit_int(value)
+            return
 
-            def _is_stringish(node):
-                if isinstance(node, Literal) and node.literal_type == "string":
-                    return True
-                if isinstance(node, FunctionCall) and node.name in ("GetArg", "Read", "SHA256"):
+        def _is_stringish(node):
+            if isinstance(node, Literal) and node.literal_type == "string":
+                return True
+            if isinstance(node, FunctionCall) and node.name in ("GetArg", "Read", "SHA256"):
+                return True
+            if isinstance(node, Identifier):
+                sym = self.get_variable_symbol(node.name)
+                if sym and sym.typ == "string":
                     return True
-                if isinstance(node, Identifier):
-                    sym = self.get_variable_symbol(node.name)
-                    if sym and sym.typ == "string":
-                        return True
-                if isinstance(node, BinaryExpr) and node.operator == "+":
-                    # Recursive check - if either side is stringish, result is stringish
-                    return _is_stringish(node.left) or _is_stringish(node.right)
-                return False
+            if isinstance(node, BinaryExpr) and node.operator == "+":
+                # Recursive check - if either side is stringish, result is stringish
+                return _is_stringish(node.left) or _is_stringish(node.right)
+            return False
 
-            left_stringy = _is_stringish(expr.left)
-            right_stringy = _is_stringish(expr.right)
-            stringy = left_stringy or right_stringy
-
-            if expr.operator == "+" and stringy:
-                # String concatenation with automatic int-to-string conversion
-                # Use callee-saved registers to preserve values across function calls
-                
-                # Helper to convert int in %rax to string, result in %rax
-                def emit_int_to_string():
-                    self.emit("movq %rax, %r14")  # save int value in callee-saved reg
-                    self.emit("movq $24, %rdi")
-                    self.emit("call vyl_alloc")
-                    self.emit("movq %rax, %r12")  # buffer in r12
-                    self.emit("movq %r12, %rdi")  # 1st arg: buffer
-                    self.emit("leaq .int_fmt(%rip), %rsi")  # 2nd arg: format
-                    self.emit("movq %r14, %rdx")  # 3rd arg: value
-                    self.emit("movq $0, %rax")  # no vector registers for sprintf
-                    self.emit("call sprintf")
-                    self.emit("movq %r12, %rax")  # result is buffer
-                
-                # Generate left, convert if needed
-                self.generate_expression(expr.left)
-                if not left_stringy:
-                    emit_int_to_string()
-                self.emit("movq %rax, %r15")  # save left string in r15 (callee-saved)
-                
-                # Generate right, convert if needed
-                self.generate_expression(expr.right)
-                if not right_stringy:
-                    emit_int_to_string()
-                self.emit("movq %rax, %rbx")  # right string in rbx
-                
-                # Now concatenate: left in r15, right in rbx
-                # Get strlen of left
-                self.emit("movq %r15, %rdi")
-                self.emit("call strlen")
-                self.emit("movq %rax, %r14")  # len_left in r14
-                
-                # Get strlen of right
-                self.emit("movq %rbx, %rdi")
-                self.emit("call strlen")
-                self.emit("addq %r14, %rax")  # total length
-                self.emit("incq %rax")  # +1 for null terminator
-                
-                # Allocate destination buffer
-                self.emit("movq %rax, %rdi")
-                self.emit("call vyl_alloc")
-                self.emit("movq %rax, %r13")  # dest buffer in r13
-                
-                # strcpy(dest, left)
-                self.emit("movq %r13, %rdi")
-                self.emit("movq %r15, %rsi")
-                self.emit("call strcpy")
-                
-                # strcat(dest, right)
-                self.emit("movq %r13, %rdi")
-                self.emit("movq %rbx, %rsi")
-                self.emit("call strcat")
-                
-                self.emit("movq %r13, %rax")  # return concatenated string
-                return
+        left_stringy = _is_stringish(expr.left)
+        right_stringy = _is_stringish(expr.right)
+        stringy = left_stringy or right_stringy
 
-            if expr.operator in ("==", "!=") and stringy:
-                self.generate_expression(expr.left)
-                self.emit("push %rax")
-                self.generate_expression(expr.right)
-                self.emit("movq %rax, %rsi")
-                self.emit("pop %rdi")
-                self.emit("call strcmp")
-                self.emit("cmpq $0, %rax")
-                self.emit("sete %al" if expr.operator == "==" else "setne %al")
-                self.emit("movzbq %al, %rax")
-                return
+        if expr.operator == "+" and stringy:
+            # String concatenation with automatic int-to-string conversion.
+            # A chain a + b + c is joined in one go rather than through an
+            # intermediate string per "+".
+            def _terms(node):
+                if isinstance(node, BinaryExpr) and node.operator == "+" and _is_stringish(node):
+                    return _terms(node.left) + _terms(node.right)
+                return [(node, _is_stringish(node))]
+
+            self._generate_concat(_terms(expr))
+            return
 
+        if expr.operator in ("==", "!=") and stringy:
             self.generate_expression(expr.left)
             self.emit("push %rax")
             self.generate_expression(expr.right)
-            self.emit("movq %rax, %rbx")
-            self.emit("pop %rax")
-
-            op = expr.operator
-            if op == "+":
-                self.emit("addq %rbx, %rax")
-            elif op == "-":
-                self.emit("subq %rbx, %rax")
-            elif op == "*":
-                self.emit("imulq %rbx, %rax")
-            elif op == "/":
-                self.emit("cqto")
-                self.emit("idivq %rbx")
-            elif op == "%":
-                self.emit("cqto")
-                self.emit("idivq %rbx")
-                self.emit("movq %rdx, %rax")
-            elif op in ("==", "!=", "<", ">", "<=", ">="):
-                self.emit("cmpq %rbx, %rax")
-                table = {
-                    "==": "sete",
-                    "!=": "setne",
-                    "<": "setl",
-                    ">": "setg",
-                    "<=": "setle",
-                    ">=": "setge",
-                }
-                self.emit(f"{table[op]} %al")
-                self.emit("movzbq %al, %rax")
-            else:
-                raise CodegenError(f"Unsupported binary operator '{op}'")
+            self.emit("movq %rax, %rsi")
+            self.emit("pop %rdi")
+            self.emit("call strcmp")
+            self.emit("testl %eax, %eax")
+            self._emit_setcc("e" if expr.operator == "==" else "ne")
             return
 
-        if isinstance(expr, SelfExpr):
-            # 'self' is a pointer to the current struct, stored in locals
-            sym = self.get_variable_symbol("self")
-            if not sym:
-                raise CodegenError("'self' used outside of a method")
-            self.emit(f"movq {self.get_variable_location(sym)}, %rax")
+        if expr.operator in ("+", "-") and self._generate_lea(expr):
             return
-
-        if isinstance(expr, NullLiteral):
-            self.emit("movq $0, %rax")
+        if expr.operator in ("*", "/", "%") and self._generate_by_constant(expr):
             return
 
-        if isinstance(expr, AddressOf):
-            # Get address of the operand
-            self.generate_address(expr.operand, dest="%rax")
-            return
+        self._generate_operands(expr.left, expr.right)
+
+        op = expr.operator
+        if op == "+":
+            self.emit("addq %rbx, %rax")
+        elif op == "-":
+            self.emit("subq %rbx, %rax")
+        elif op == "*":
+            self.emit("imulq %rbx, %rax")
+        elif op == "/":
+            self.emit("cqto")
+            self.emit("idivq %rbx")
+        elif op == "%":
+            self.emit("cqto")
+            self.emit("idivq %rbx")
+            self.emit("movq %rdx, %rax")
+        elif op in ("==", "!=", "<", ">", "<=", ">="):
+            self.emit("cmpq %rbx, %rax")
+            self._emit_setcc(self._CMP_CC[op])
+        else:
+            raise CodegenError(f"Unsupported binary operator '{op}'")
 
-        if isinstance(expr, Dereference):
-            # Load value at pointer
-            self.generate_expression(expr.operand)
-            self.emit("movq (%rax), %rax")
-            return
+    def generate_self_expr(self, expr: SelfExpr):
+        # 'self' is a pointer to the current struct, stored in locals
+        sym = self.get_variable_symbol("self")
+        if not sym:
+            raise CodegenError("'self' used outside of a method")
+        self.emit(f"movq {sym.location}, %rax")
 
-        if isinstance(expr, EnumAccess):
-            # Enums are compile-time constants
-            if expr.enum_name not in self.enum_values:
-                raise CodegenError(f"Unknown enum '{expr.enum_name}'")
-            if expr.variant not in self.enum_values[expr.enum_name]:
-                raise CodegenError(f"Unknown enum variant '{expr.enum_name}.{expr.variant}'")
-            val = self.enum_values[expr.enum_name][expr.variant]
-            self.emit(f"movq ${val}, %rax")
-            return
+    def generate_null_literal(self, expr: NullLiteral):
+        self._emit_zero()
 
-        if isinstance(expr, MethodCall):
-            self.generate_method_call(expr)
-            return
+    def generate_address_of(self, expr: AddressOf):
+        # Get address of the operand
+        self.generate_address(expr.operand, dest="%rax")
+
+    def generate_dereference(self, expr: Dereference):
+        # Load value at pointer
+        self.generate_expression(expr.operand)
+        self.emit("movq (%rax), %rax")
 
-        raise CodegenError(f"Unsupported expression type: {type(expr).__name__}")
+    def generate_enum_access(self, expr: EnumAccess):
+        # Enums are compile-time constants
+        if expr.enum_name not in self.enum_values:
+            raise CodegenError(f"Unknown enum '{expr.enum_name}'")
+        if expr.variant not in self.enum_values[expr.enum_name]:
+            raise CodegenError(f"Unknown enum variant '{expr.enum_name}.{expr.variant}'")
+        val = self.enum_values[expr.enum_name][expr.variant]
+        self.emit(f"movq ${val}, %rax")
 
     # ---------- address helpers ----------
     def generate_address(self, expr, dest: str = "%rax", want_struct_data: bool = False) -> str:
@@ -916,16 +1324,16 @@ class CodeGenerator:
                 raise CodegenError(f"Undefined variable '{expr.name}'")
             if sym.typ in self.struct_layouts:
                 # load pointer to struct storage
-                self.emit(f"movq {self.get_variable_location(sym)}, {dest}")
+                self.emit(f"movq {sym.location}, {dest}")
                 return sym.typ
-            self.emit(f"leaq {self.get_variable_location(sym)}, {dest}")
+            self.emit(f"leaq {sym.location}, {dest}")
             return sym.typ
         if isinstance(expr, SelfExpr):
             # 'self' is a pointer to the current struct
             sym = self.get_variable_symbol("self")
             if not sym:
                 raise CodegenError("'self' used outside of a method")
-            self.emit(f"movq {self.get_variable_location(sym)}, {dest}")
+            self.emit(f"movq {sym.location}, {dest}")
             return sym.typ
         if isinstance(expr, Dereference):
             # *ptr - evaluate pointer, the result is the address we want
@@ -957,9 +1365,9 @@ class CodeGenerator:
             self.emit("movq %rax, %rcx")
             self.emit("pop %rbx")
             bounds_fail = self.get_label("oob")
-            self.emit("cmpq $0, %rbx")
+            self.emit("testq %rbx, %rbx")
             self.emit(f"je {bounds_fail}")
-            self.emit("cmpq $0, %rcx")
+            self.emit("testq %rcx, %rcx")
             self.emit(f"jl {bounds_fail}")
             self.emit("movq -8(%rbx), %rdx")
             self.emit("cmpq %rdx, %rcx")
@@ -1028,7 +1436,7 @@ class CodeGenerator:
             return
         sym = self.get_variable_symbol(assign.name)
         if sym:
-            self.emit(f"movq %rax, {self.get_variable_location(sym)}")
+            self.emit(f"movq %rax, {sym.location}")
         else:
             raise CodegenError(f"Undefined variable '{assign.name}'")
 
@@ -1040,15 +1448,11 @@ class CodeGenerator:
             raise CodegenError(f"Unknown struct type '{expr.struct_name}'")
         size = layout["size"]
         
-        # Allocate memory for struct
+        # Allocate zeroed memory for struct
         self.emit(f"movq ${size}, %rdi")
-        self.emit("call vyl_alloc")
+        self.emit("call vyl_calloc")
         self.emit("movq %rax, %r12")  # save struct pointer
         
-        # Zero-initialize all fields
-        for i in range(size // 8):
-            self.emit(f"movq $0, {i * 8}(%r12)")
-        
         # Apply initializers
         for field_name, value in expr.initializers:
             field_info = layout["fields"].get(field_name)
@@ -1115,7 +1519,7 @@ class CodeGenerator:
         
         The approach is to build the string by:
         1. For each part, generate either a string literal or convert expression to string
-        2. Concatenate all parts together using vyl_strconcat
+        2. Concatenate all parts together in one _generate_concat
         """
         # Import lexer and parser for parsing embedded expressions
         try:
@@ -1129,29 +1533,9 @@ class CodeGenerator:
         
         if not parts:
             # Empty string
-            label = self.get_label(".str")
-            self.string_literals.append((label, ""))
-            self.emit(f"leaq {label}(%rip), %rax")
+            self.emit(f"leaq {self._string_label('')}(%rip), %rax")
             return
         
-        # Helper to convert int in %rax to string, result in %rax
-        # Uses rbx (callee-saved) to preserve values across calls
-        def emit_int_to_string():
-            self.emit("push %rbx")  # save rbx
-            self.emit("movq %rax, %rbx")  # save int value
-            self.emit("subq $8, %rsp")  # align stack to 16 bytes
-            self.emit("movq $24, %rdi")
-            self.emit("call vyl_alloc")
-            self.emit("push %rax")  # save buffer pointer
-            self.emit("movq %rax, %rdi")  # 1st arg: buffer
-            self.emit("leaq .int_fmt(%rip), %rsi")  # 2nd arg: format
-            self.emit("movq %rbx, %rdx")  # 3rd arg: value
-            self.emit("movq $0, %rax")  # no vector registers for sprintf
-            self.emit("call sprintf")
-            self.emit("pop %rax")  # result is buffer
-            self.emit("addq $8, %rsp")  # remove alignment padding
-            self.emit("pop %rbx")  # restore rbx
-        
         def is_stringish_expr(node):
             """Check if expression result is a string."""
             if isinstance(node, Literal) and node.literal_type == "string":
@@ -1166,51 +1550,47 @@ class CodeGenerator:
                 return True
             return False
         
-        # Generate first part
-        is_expr, value = parts[0]
-        if is_expr:
-            # Parse and generate the expression
-            tokens = tokenize(value)
-            parser = Parser(tokens)
-            ast_expr = parser.parse_expression()
-            self.generate_expression(ast_expr)
-            if not is_stringish_expr(ast_expr):
-                emit_int_to_string()
-        else:
-            # String literal
-            label = self.get_label(".str")
-            self.string_literals.append((label, value))
-            self.emit(f"leaq {label}(%rip), %rax")
-        
-        # If only one part, we're done
-        if len(parts) == 1:
-            return
-        
-        # Save result and concatenate with remaining parts
-        self.emit("push %rax")  # Save accumulated string
-        
-        for is_expr, value in parts[1:]:
-            # Generate next part
+        terms = []
+        for is_expr, value in parts:
             if is_expr:
+                # Parse the embedded expression
                 tokens = tokenize(value)
                 parser = Parser(tokens)
                 ast_expr = parser.parse_expression()
-                self.generate_expression(ast_expr)
-                if not is_stringish_expr(ast_expr):
-                    emit_int_to_string()
+                terms.append((ast_expr, is_stringish_expr(ast_expr)))
             else:
-                label = self.get_label(".str")
-                self.string_literals.append((label, value))
-                self.emit(f"leaq {label}(%rip), %rax")
-            
-            # Concatenate: pop left, right is in rax
-            self.emit("movq %rax, %rsi")  # right
-            self.emit("pop %rdi")  # left
+                terms.append((Literal(value=value, literal_type="string"), True))
+        self._generate_concat(terms)
+
+    def _generate_concat(self, terms: List[Tuple[object, bool]]):
+        """Concatenate *terms* (expression, is-string pairs) into a new string in %rax.
+
+        Non-string terms go through vyl_itoa. Two terms use vyl_strconcat;
+        longer runs are pushed in order and joined by vyl_strjoin, which
+        sizes and fills the result once instead of once per pair.
+        """
+        if len(terms) == 1:
+            node, is_string = terms[0]
+            self.generate_expression(node)
+            if not is_string:
+                self.emit("movq %rax, %rdi")
+                self.emit("call vyl_itoa")
+            return
+        for node, is_string in terms:
+            self.generate_expression(node)
+            if not is_string:
+                self.emit("movq %rax, %rdi")
+                self.emit("call vyl_itoa")
+            self.emit("push %rax")
+        if len(terms) == 2:
+            self.emit("pop %rsi")
+            self.emit("pop %rdi")
             self.emit("call vyl_strconcat")
-            self.emit("push %rax")  # Save result for next iteration
-        
-        # Final result is on stack
-        self.emit("pop %rax")
+            return
+        self.emit("movq %rsp, %rdi")
+        self.emit(f"movl ${len(terms)}, %esi")
+        self.emit("call vyl_strjoin")
+        self.emit(f"addq ${8 * len(terms)}, %rsp")
 
     def generate_try_expr(self, expr: TryExpr):
         """Generate code for error propagation: expr?
@@ -1223,7 +1603,7 @@ class CodeGenerator:
         
         # Check if result is < 0 (error condition)
         ok_label = self.get_label("try_ok")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit(f"jge {ok_label}")  # Jump if >= 0 (success)
         
         # Error path: execute deferred statements and jump to function epilogue
@@ -1247,6 +1627,15 @@ class CodeGenerator:
         if name == "Print":
             if call.arguments:
                 arg = call.arguments[0]
+                value = self._fold(arg)
+                if isinstance(arg, Literal) and arg.literal_type == "bool":
+                    value = 1 if arg.value else 0
+                if value is not None:
+                    # Known at compile time: print the preformatted text
+                    label = self._string_label(f"{value}\n")
+                    self.emit(f"leaq {label}(%rip), %rdi")
+                    self.emit("call print_string")
+                    return
                 self.generate_expression(arg)
                 stringy = isinstance(arg, Literal) and arg.literal_type == "string"
                 if isinstance(arg, InterpString):
@@ -1286,11 +1675,10 @@ class CodeGenerator:
                 raise CodegenError("Exists expects (path)")
             self.generate_expression(call.arguments[0])
             self.emit("movq %rax, %rdi")
-            self.emit("movq $0, %rsi")
+            self._emit_zero("%rsi")
             self.emit("call access")
-            self.emit("cmpq $0, %rax")
-            self.emit("sete %al")
-            self.emit("movzbq %al, %rax")
+            self.emit("testl %eax, %eax")
+            self._emit_setcc("e")
             return
             self.emit("subq $8, %rax")          # reserve length slot before data
             self.emit("movq %rbx, (%rax)")      # store length
@@ -1344,18 +1732,31 @@ class CodeGenerator:
         if name == "Write":
             if len(call.arguments) != 2:
                 raise CodegenError("Write expects (file, data)")
-            self.generate_expression(call.arguments[1])
+            data = call.arguments[1]
+            self.generate_expression(data)
             self.emit("push %rax")
             self.generate_expression(call.arguments[0])
             self.emit("movq %rax, %rdi")
             self.emit("pop %rsi")
-            self.emit("call vyl_write_all")
+            if isinstance(data, Literal) and data.literal_type == "string":
+                # The literal's length is known here; skip the strlen pass
+                size = len(data.value.split("\0", 1)[0].encode())
+                self.emit(f"movl ${size}, %edx")
+                self.emit("call vyl_write_all")
+            else:
+                self.emit("call vyl_write_str")
             return
 
         if name == "SHA256":
-            self.generate_expression(call.arguments[0])
+            data = call.arguments[0]
+            self.generate_expression(data)
             self.emit("movq %rax, %rdi")
-            self.emit("call vyl_sha256")
+            if isinstance(data, Literal) and data.literal_type == "string":
+                size = len(data.value.split("\0", 1)[0].encode())
+                self.emit(f"movl ${size}, %esi")
+                self.emit("call vyl_sha256")
+            else:
+                self.emit("call vyl_sha256_str")
             return
 
         if name == "GC":
@@ -1372,10 +1773,10 @@ class CodeGenerator:
             self.emit("leaq .mode_rb(%rip), %rsi")
             self.emit("call fopen")
             self.emit("movq %rax, %rbx")
-            self.emit(f"cmpq $0, %rbx")
+            self.emit("testq %rbx, %rbx")
             self.emit(f"je {fail_lbl}")
             self.emit("movq %rbx, %rdi")
-            self.emit("movq $0, %rsi")
+            self._emit_zero("%rsi")
             self.emit("movq $2, %rdx")
             self.emit("call fseek")
             self.emit("movq %rbx, %rdi")
@@ -1388,7 +1789,7 @@ class CodeGenerator:
             self.emit("movq %r12, %rax")
             self.emit(f"jmp {done_lbl}")
             self.emit(f"{fail_lbl}:")
-            self.emit("movq $0, %rax")
+            self._emit_zero()
             self.emit(f"{done_lbl}:")
             return
 
@@ -1397,20 +1798,27 @@ class CodeGenerator:
             return
 
         if name == "GetArg":
+            if len(call.arguments) not in (1, 2):
+                raise CodegenError("GetArg expects 1 or 2 arguments")
+            index = call.arguments[-1]
+            # A literal index folds into the load's displacement
+            if isinstance(index, Literal) and index.literal_type == "int":
+                if len(call.arguments) == 1:
+                    self.emit("movq argv_store(%rip), %rax")
+                else:
+                    self.generate_expression(call.arguments[0])
+                self.emit(f"movq {index.value * 8}(%rax), %rax")
+                return
+            self.generate_expression(index)
             if len(call.arguments) == 1:
-                self.generate_expression(call.arguments[0])
                 self.emit("movq argv_store(%rip), %rbx")
-                self.emit("movq %rax, %rcx")
-                self.emit("movq (%rbx,%rcx,8), %rax")
-                return
-            if len(call.arguments) == 2:
-                self.generate_expression(call.arguments[1])
-                self.emit("movq %rax, %rcx")
+            else:
+                self.emit("push %rax")
                 self.generate_expression(call.arguments[0])
                 self.emit("movq %rax, %rbx")
-                self.emit("movq (%rbx,%rcx,8), %rax")
-                return
-            raise CodegenError("GetArg expects 1 or 2 arguments")
+                self.emit("pop %rax")
+            self.emit("movq (%rbx,%rax,8), %rax")
+            return
 
         if name == "Exit":
             if len(call.arguments) != 1:
@@ -1418,7 +1826,7 @@ class CodeGenerator:
             self.generate_expression(call.arguments[0])
             self.emit("movq %rax, %rdi")
             self.emit("call exit")
-            self.emit("movq $0, %rax")
+            self._emit_zero()
             return
 
         if name == "Sleep":
@@ -1442,20 +1850,20 @@ class CodeGenerator:
             self.emit("imulq %rcx, %rax")   # ms->ns
             self.emit("movq %rax, 8(%rsp)") # tv_nsec
             self.emit("leaq (%rsp), %rdi")
-            self.emit("movq $0, %rsi")
+            self._emit_zero("%rsi")
             self.emit("call nanosleep")
             self.emit("addq $16, %rsp")
             self.emit("pop %rdx")
             self.emit("pop %rcx")
             self.emit("pop %rbx")
-            self.emit("movq $0, %rax")
+            self._emit_zero()
             return
 
         if name == "Now":
             if len(call.arguments) != 0:
                 raise CodegenError("Now expects ()")
             self.emit("subq $16, %rsp")
-            self.emit("movq $1, %rdi")        # CLOCK_MONOTONIC
+            self.emit("movl $1, %edi")        # CLOCK_MONOTONIC
             self.emit("leaq (%rsp), %rsi")
             self.emit("call clock_gettime")
             self.emit("movq (%rsp), %rax")    # sec
@@ -1558,14 +1966,14 @@ class CodeGenerator:
             self.emit("movq %rax, %rdi")
             self.emit("imulq $8, %rdi")         # bytes for elements
             self.emit("addq $8, %rdi")          # + header for length
-            self.emit("call vyl_alloc")
-            self.emit("cmpq $0, %rax")
+            self.emit("call vyl_calloc")
+            self.emit("testq %rax, %rax")
             self.emit(f"je {fail_lbl}")
             self.emit("movq %rbx, (%rax)")      # store length at header
             self.emit("addq $8, %rax")          # return data pointer
             self.emit(f"jmp {done_lbl}")
             self.emit(f"{fail_lbl}:")
-            self.emit("movq $0, %rax")
+            self._emit_zero()
             self.emit(f"{done_lbl}:")
             return
 
@@ -1604,11 +2012,9 @@ class CodeGenerator:
             if len(call.arguments) != 1:
                 raise CodegenError("Free expects (ptr)")
             self.generate_expression(call.arguments[0])
-            # vyl_alloc returns ptr+24, so we need to subtract 24 to get original malloc ptr
-            self.emit("subq $24, %rax")
             self.emit("movq %rax, %rdi")
-            self.emit("call free")
-            self.emit("movq $0, %rax")
+            self.emit("call vyl_free")
+            self._emit_zero()
             return
 
         if name == "Memcpy":
@@ -1694,7 +2100,7 @@ class CodeGenerator:
             self.emit("movq %rax, %rdi")
             self.emit("call getenv")
             # If NULL, return empty string
-            self.emit("cmpq $0, %rax")
+            self.emit("testq %rax, %rax")
             lbl = self.get_label("getenv")
             self.emit(f"jne {lbl}")
             self.emit("leaq .empty_str(%rip), %rax")
@@ -1727,7 +2133,11 @@ class CodeGenerator:
             self.generate_expression(call.arguments[1])
             self.emit("push %rax")
             self.generate_expression(call.arguments[0])
-            self.emit("movq %rax, %rdi")
+            self.emit("push %rax")
+            self.emit("movq 8(%rsp), %rdi")     # length of data
+            self.emit("call strlen")
+            self.emit("movq %rax, %rdx")
+            self.emit("pop %rdi")
             self.emit("pop %rsi")
             self.emit("call vyl_tcp_send")
             return
@@ -1776,9 +2186,13 @@ class CodeGenerator:
             self.generate_expression(call.arguments[1])
             self.emit("push %rax")
             self.generate_expression(call.arguments[0])
-            self.emit("movq %rax, %rdi")
-            self.emit("pop %rsi")
-            self.emit("call vyl_tls_send")
+            self.emit("push %rax")
+            self.emit("movq 8(%rsp), %rdi")     # length of data
+            self.emit("call strlen")
+            self.emit("movq %rax, %rdx")
+            self.emit("pop %rdi")
+            self.emit("pop %rsi")
+            self.emit("call vyl_tls_send")
             return
 
         if name == "TlsRecv":
@@ -1832,8 +2246,6 @@ class CodeGenerator:
             return
 
         # generic call using SysV registers for first 6 args
-        arg_regs = ["%rdi", "%rsi", "%rdx", "%rcx", "%r8", "%r9"]
-        
         # Build full argument list with defaults filled in
         full_args: List = list(call.arguments)
         if name in self.function_defs:
@@ -1844,19 +2256,7 @@ class CodeGenerator:
                 if default is not None:
                     full_args.append(default)
         
-        arg_count = len(full_args)
-        # Evaluate args right-to-left, push on stack
-        for arg in reversed(full_args):
-            self.generate_expression(arg)
-            self.emit("push %rax")
-        # Pop into registers in order
-        for idx in range(min(arg_count, len(arg_regs))):
-            self.emit(f"pop {arg_regs[idx]}")
-        # Remove any remaining stack args beyond 6 (not currently emitted separately)
-        if arg_count > len(arg_regs):
-            excess = arg_count - len(arg_regs)
-            self.emit(f"addq ${excess * 8}, %rsp")
-        self.emit(f"call {name}")
+        self._emit_call(name, full_args)
 
     def generate_method_call(self, call: MethodCall):
         """Generate code for a method call: receiver.method(args)
@@ -1877,36 +2277,214 @@ class CodeGenerator:
 
         method_name = f"{struct_name}_{call.method_name}" if struct_name else call.method_name
 
-        # SysV calling convention: rdi, rsi, rdx, rcx, r8, r9
-        arg_regs = ["%rdi", "%rsi", "%rdx", "%rcx", "%r8", "%r9"]
-
         # Total args = self + explicit args
-        all_args = [receiver] + list(call.arguments)
-        arg_count = len(all_args)
+        self._emit_call(method_name, [receiver] + list(call.arguments))
 
-        # Evaluate args right-to-left, push on stack
-        for arg in reversed(all_args):
-            self.generate_expression(arg)
+    def _emit_call(self, target: str, args: List):
+        """Marshal *args* per SysV and call *target*.
+
+        Arguments are evaluated left to right. A literal or variable is loaded
+        straight into its argument register just before the call when no
+        later argument can call out or assign; every other register argument
+        waits on the stack. Arguments past the sixth are stored into a block
+        reserved up front, padded to keep %rsp 16-byte aligned, and stay
+        there for the callee.
+        """
+        reg_args = args[:len(self._ARG_REGS)]
+        stack_args = args[len(self._ARG_REGS):]
+
+        deferred = set()
+        effects_after = False
+        for idx in reversed(range(len(args))):
+            if idx < len(reg_args) and not effects_after and self._simple_operand(args[idx]) is not None:
+                deferred.add(idx)
+            effects_after = effects_after or self._has_side_effects(args[idx])
+
+        pad = 8 if len(stack_args) % 2 else 0
+        if stack_args:
+            self.emit(f"subq ${len(stack_args) * 8 + pad}, %rsp")
+        pushed = [idx for idx in range(len(reg_args)) if idx not in deferred]
+        for idx in pushed:
+            self.generate_expression(reg_args[idx])
             self.emit("push %rax")
+        for pos, arg in enumerate(stack_args):
+            slot = f"{8 * (len(pushed) + pos) or ''}(%rsp)"
+            src = self._simple_operand(arg)
+            if src is not None and src.startswith("$") and -(1 << 31) <= int(src[1:]) < (1 << 31):
+                self.emit(f"movq {src}, {slot}")
+                continue
+            self.generate_expression(arg)
+            self.emit(f"movq %rax, {slot}")
+        for idx in reversed(pushed):
+            self.emit(f"pop {self._ARG_REGS[idx]}")
+
+        for idx in sorted(deferred):
+            src = self._simple_operand(reg_args[idx])
+            if src == "$0":
+                self._emit_zero(self._ARG_REGS[idx])
+            else:
+                self.emit(f"movq {src}, {self._ARG_REGS[idx]}")
 
-        # Pop into registers in order
-        for idx in range(min(arg_count, len(arg_regs))):
-            self.emit(f"pop {arg_regs[idx]}")
+        self.emit(f"call {target}")
+        if stack_args:
+            self.emit(f"addq ${len(stack_args) * 8 + pad}, %rsp")
 
-        # Remove any remaining stack args beyond 6
-        if arg_count > len(arg_regs):
-            excess = arg_count - len(arg_regs)
-            self.emit(f"addq ${excess * 8}, %rsp")
+    # ---------- control flow ----------
+    # Condition codes for each comparison, and the code for its negation
+    _CMP_CC = {"==": "e", "!=": "ne", "<": "l", ">": "g", "<=": "le", ">=": "ge"}
+    _CC_INVERSE = {"e": "ne", "ne": "e", "l": "ge", "ge": "l", "g": "le", "le": "g"}
 
-        self.emit(f"call {method_name}")
+    def _generate_flags(self, cond) -> str:
+        """Evaluate *cond* into the flags and return the code that means true.
+
+        Integer comparisons stop at their cmpq instead of materializing a 0/1
+        with setCC; `!` just inverts the returned code. Anything else is
+        evaluated as a value and compared against zero.
+        """
+        if isinstance(cond, UnaryExpr) and cond.operator in ("!", "NOT"):
+            return self._CC_INVERSE[self._generate_flags(cond.operand)]
+
+        if (
+            isinstance(cond, BinaryExpr)
+            and cond.operator in self._CMP_CC
+            and not self._expr_is_stringish(cond.left)
+            and not self._expr_is_stringish(cond.right)
+        ):
+            self._generate_operands(cond.left, cond.right)
+            self.emit("cmpq %rbx, %rax")
+            return self._CMP_CC[cond.operator]
+
+        self.generate_expression(cond)
+        self.emit("testq %rax, %rax")
+        return "ne"
+
+    def generate_condition(self, cond, false_label: str):
+        """Evaluate a branch condition and jump to *false_label* when it fails."""
+        cc = self._generate_flags(cond)
+        self.emit(f"j{self._CC_INVERSE[cc]} {false_label}")
+
+    _FOLD_OPS = {
+        "+": lambda a, b: a + b,
+        "-": lambda a, b: a - b,
+        "*": lambda a, b: a * b,
+        "==": lambda a, b: int(a == b),
+        "!=": lambda a, b: int(a != b),
+        "<": lambda a, b: int(a < b),
+        ">": lambda a, b: int(a > b),
+        "<=": lambda a, b: int(a <= b),
+        ">=": lambda a, b: int(a >= b),
+    }
+
+    def _fold(self, expr) -> Optional[int]:
+        """Return the value of *expr* if it is an int constant expression.
+
+        Folds int literals combined with arithmetic, comparisons and unary
+        minus, wrapping to 64 bits the way the emitted code would. Division
+        truncates toward zero like idivq; dividing by zero is left for run
+        time.
+        """
+        if isinstance(expr, Literal):
+            return expr.value if expr.literal_type == "int" else None
+        if isinstance(expr, UnaryExpr) and expr.operator == "-":
+            value = self._fold(expr.operand)
+            return None if value is None else self._wrap64(-value)
+        if not isinstance(expr, BinaryExpr):
+            return None
+        op = expr.operator
+        if op not in self._FOLD_OPS and op not in ("/", "%"):
+            return None
+        left = self._fold(expr.left)
+        if left is None:
+            return None
+        right = self._fold(expr.right)
+        if right is None:
+            return None
+        if op in ("/", "%"):
+            if right == 0:
+                return None
+            quotient = abs(left) // abs(right)
+            if (left < 0) != (right < 0):
+                quotient = -quotient
+            return self._wrap64(quotient if op == "/" else left - quotient * right)
+        return self._wrap64(self._FOLD_OPS[op](left, right))
+
+    @staticmethod
+    def _wrap64(value: int) -> int:
+        return (value + (1 << 63)) % (1 << 64) - (1 << 63)
+
+    def _simple_operand(self, expr) -> Optional[str]:
+        """Return an operand a single movq can load *expr* from, if there is one.
+
+        Covers int constants and bool literals (as immediates) and variables
+        (as their home location); anything else needs generate_expression.
+        """
+        value = self._fold(expr)
+        if value is not None:
+            return f"${value}"
+        if isinstance(expr, Literal) and expr.literal_type == "bool":
+            return f"${1 if expr.value else 0}"
+        if isinstance(expr, Identifier):
+            sym = self.get_variable_symbol(expr.name)
+            if sym:
+                return sym.location
+        return None
+
+    def _select_arm(self, stmt) -> Optional[Tuple[str, str]]:
+        """Return (variable, source operand) if *stmt* can be one arm of a cmov.
+
+        An arm qualifies when it is a block holding a single plain assignment
+        of a _simple_operand, so its value can be loaded with a movq that
+        leaves the flags intact.
+        """
+        if isinstance(stmt, Block):
+            if len(stmt.statements) != 1:
+                return None
+            stmt = stmt.statements[0]
+        if not isinstance(stmt, Assignment) or stmt.target:
+            return None
+        src = self._simple_operand(stmt.value)
+        return (stmt.name, src) if src is not None else None
+
+    def _try_generate_select(self, node: IfStmt) -> bool:
+        """Emit `if (c) { x = A; } [else { x = B; }]` as a cmov instead of branches.
+
+        Without an else arm x keeps its value, so a register-homed x takes
+        the cmov directly.
+        """
+        then_arm = self._select_arm(node.then_block)
+        if not then_arm:
+            return False
+        if node.else_block is None:
+            else_src = None
+        else:
+            else_arm = self._select_arm(node.else_block)
+            if not else_arm or else_arm[0] != then_arm[0]:
+                return False
+            else_src = else_arm[1]
+        sym = self.get_variable_symbol(then_arm[0])
+        if not sym:
+            return False
+
+        cc = self._generate_flags(node.condition)
+        src = then_arm[1]
+        if src.startswith("$"):  # cmov takes no immediate
+            self.emit(f"movq {src}, %rbx")
+            src = "%rbx"
+        if else_src is None and sym.reg:
+            self.emit(f"cmov{cc} {src}, {sym.reg}")
+            return True
+        self.emit(f"movq {else_src or sym.location}, %rax")
+        self.emit(f"cmov{cc} {src}, %rax")
+        self.emit(f"movq %rax, {sym.location}")
+        return True
 
-    # ---------- control flow ----------
     def generate_if(self, node: IfStmt, end_label: Optional[str] = None):
+        if self._try_generate_select(node):
+            return
+
         else_lbl = self.get_label("else")
         end_lbl = self.get_label("endif")
-        self.generate_expression(node.condition)
-        self.emit("cmpq $0, %rax")
-        self.emit(f"je {else_lbl}")
+        self.generate_condition(node.condition, else_lbl)
         self.generate_statement(node.then_block, end_label=end_label)
         self.emit(f"jmp {end_lbl}")
         self.emit(f"{else_lbl}:")
@@ -1924,10 +2502,8 @@ class CodeGenerator:
 
         start_lbl = self.get_label("while")
         end_lbl = self.get_label("endwhile")
-        self.emit(f"{start_lbl}:")
-        self.generate_expression(node.condition)
-        self.emit("cmpq $0, %rax")
-        self.emit(f"je {end_lbl}")
+        self._emit_aligned_label(start_lbl)
+        self.generate_condition(node.condition, end_lbl)
         self.generate_statement(node.body, end_label=end_label)
         self.emit(f"jmp {start_lbl}")
         self.emit(f"{end_lbl}:")
@@ -1984,36 +2560,44 @@ class CodeGenerator:
             return False
 
         start_lbl = self.get_label("while_fast")
-        end_lbl = self.get_label("endwhile_fast")
-
-        # Load counter and limit into registers
-        self.emit(f"movq {self.get_variable_location(sym)}, %rax")  # counter
-        self.emit(f"movq ${limit_val}, %rbx")                        # limit
-        self.emit(f"{start_lbl}:")
-
-        # Compare based on operator
-        self.emit("cmpq %rbx, %rax")
-        jmp_map = {
-            "<": "jge",
-            "<=": "jg",
-            ">": "jle",
-            ">=": "jl",
-        }
-        self.emit(f"{jmp_map[op]} {end_lbl}")
 
-        # Increment/decrement in register
         if step_val == 1:
-            self.emit("incq %rax")
+            step = "incq %rax"
         elif step_val == -1:
-            self.emit("decq %rax")
+            step = "decq %rax"
         else:
-            self.emit(f"addq ${step_val}, %rax")
-
-        self.emit(f"jmp {start_lbl}")
-        self.emit(f"{end_lbl}:")
+            step = f"addq ${step_val}, %rax"
+
+        self.emit(f"movq {sym.location}, %rax")  # counter
+
+        # Counting by one towards zero (i > 0 down, i < 0 up): the step
+        # itself sets ZF on the last iteration, so the loop is just dec/jnz.
+        if limit_val == 0 and (op, step_val) in ((">", -1), ("<", 1)):
+            end_lbl = self.get_label("endwhile_fast")
+            self.emit("testq %rax, %rax")
+            self.emit(f"{'jle' if op == '>' else 'jge'} {end_lbl}")
+            self._emit_aligned_label(start_lbl)
+            self.emit(step)
+            self.emit(f"jnz {start_lbl}")
+            self.emit(f"{end_lbl}:")
+        else:
+            # Rotated loop: test at the bottom so each iteration is the step
+            # plus one compare-and-branch, with no unconditional jump.
+            check_lbl = self.get_label("while_check")
+            if -2**31 <= limit_val < 2**31:
+                limit = f"${limit_val}"
+            else:
+                self.emit(f"movq ${limit_val}, %rbx")
+                limit = "%rbx"
+            self.emit(f"jmp {check_lbl}")
+            self._emit_aligned_label(start_lbl)
+            self.emit(step)
+            self.emit(f"{check_lbl}:")
+            self.emit(f"cmpq {limit}, %rax")
+            self.emit(f"j{self._CMP_CC[op]} {start_lbl}")
 
         # Store the final counter back to its home slot
-        self.emit(f"movq %rax, {self.get_variable_location(sym)}")
+        self.emit(f"movq %rax, {sym.location}")
         return True
 
     def generate_for(self, node: ForStmt, end_label: Optional[str] = None):
@@ -2025,44 +2609,260 @@ class CodeGenerator:
             loop_var = Symbol(node.var_name, "int", False, -offset)
             self.locals[node.var_name] = loop_var
         self.generate_expression(node.start)
-        self.emit(f"movq %rax, {self.get_variable_location(loop_var)}")
-        self.emit(f"{start_lbl}:")
-        self.emit(f"movq {self.get_variable_location(loop_var)}, %rax")
+        self.emit(f"movq %rax, {loop_var.location}")
+        self._emit_aligned_label(start_lbl)
+        self.emit(f"movq {loop_var.location}, %rax")
         self.emit("push %rax")
         self.generate_expression(node.end)
         self.emit("pop %rbx")
         self.emit("cmpq %rax, %rbx")
         self.emit(f"jg {end_lbl}")
         self.generate_statement(node.body, end_label=end_label)
-        self.emit(f"incq {self.get_variable_location(loop_var)}")
+        self.emit(f"incq {loop_var.location}")
         self.emit(f"jmp {start_lbl}")
         self.emit(f"{end_lbl}:")
 
     # ---------- built-ins ----------
     def generate_builtin_functions(self):
-        # print_int
+        """Append the main stub and the runtime support routines.
+
+        None of it depends on the program being compiled, so it is emitted
+        once per process and joined into a single chunk; every call then
+        appends that one string, keeping the final join proportional to the
+        program rather than the runtime.
+        """
+        cls = type(self)
+        if cls._runtime_text is None:
+            start = len(self.output)
+            self.generate_main_stub()
+            self._emit_runtime_functions()
+            cls._runtime_text = "\n".join(self._group_sections(self.output[start:]))
+            del self.output[start:]
+        self.output.append(cls._runtime_text)
+
+    _SECTION_ORDER = (".text", ".rodata", ".data", ".bss")
+
+    @classmethod
+    def _group_sections(cls, lines: List[str]) -> List[str]:
+        """Regroup *lines* so each section is opened once, text first.
+
+        Lines keep their relative order within a section. The text starts
+        out current, and .pushsection/.popsection pairs stay where they are,
+        inside the text.
+        """
+        groups: Dict[str, List[str]] = {name: [] for name in cls._SECTION_ORDER}
+        current = groups[".text"]
+        for line in lines:
+            if line.startswith(".section "):
+                current = groups[line.split()[1]]
+            else:
+                current.append(line)
+        grouped: List[str] = []
+        for name in cls._SECTION_ORDER:
+            if groups[name]:
+                grouped.append(f".section {name}")
+                grouped.extend(groups[name])
+        return grouped
+
+    def _emit_sha256_shani(self):
+        """Emit the SHA-NI SHA-256 path used by vyl_sha256.
+
+        vyl_sha_ni_probe checks CPUID.(EAX=7,ECX=0):EBX[29] for the SHA
+        extensions, plus SSSE3 and SSE4.1 (CPUID.1:ECX[9,19]) for the pshufb
+        and pblendw around them, and caches the answer in vyl_sha_ni (-1
+        until probed). vyl_sha256_shani(data, len,
+        out) pads the message and writes the 32-byte digest; the block
+        function follows the Intel SHA extensions reference schedule.
+        """
+        self.emit("vyl_sha_ni_probe:")
+        self.emit("push %rbx")  # cpuid clobbers %rbx
+        self._emit_zero()
+        self.emit("cpuid")
+        self.emit("cmpl $7, %eax")
+        self.emit("jb vyl_sha_ni_probe_no")
+        self.emit("movl $7, %eax")
+        self._emit_zero("%rcx")
+        self.emit("cpuid")
+        self.emit("btl $29, %ebx")
+        self.emit("jnc vyl_sha_ni_probe_no")
+        self.emit("movl $1, %eax")
+        self.emit("cpuid")
+        self.emit("andl $0x80200, %ecx")
+        self.emit("cmpl $0x80200, %ecx")
+        self.emit("jne vyl_sha_ni_probe_no")
+        self.emit("movl $1, %eax")
+        self.emit("jmp vyl_sha_ni_probe_done")
+        self.emit("vyl_sha_ni_probe_no:")
+        self._emit_zero()
+        self.emit("vyl_sha_ni_probe_done:")
+        self.emit("movl %eax, vyl_sha_ni(%rip)")
+        self.emit("pop %rbx")
+        self.emit("ret")
+
+        # vyl_sha256_shani(data, len, out)
+        self.emit("vyl_sha256_shani:")
+        self.emit("push %rbp")
+        self.emit("movq %rsp, %rbp")
+        self.emit("push %rbx")
+        self.emit("push %r12")
+        self.emit("push %r13")
+        self.emit("push %r14")
+        self.emit("movq %rdi, %rbx")  # data
+        self.emit("movq %rsi, %r12")  # len
+        self.emit("movq %rdx, %r13")  # out
+        self.emit("leaq vyl_sha_state(%rip), %rdi")
+        self.emit("movdqa .sha256_iv(%rip), %xmm0")
+        self.emit("movdqa .sha256_iv+16(%rip), %xmm1")
+        self.emit("movdqa %xmm0, (%rdi)")
+        self.emit("movdqa %xmm1, 16(%rdi)")
+        # Whole blocks straight from the input
+        self.emit("movq %rbx, %rsi")
+        self.emit("movq %r12, %rdx")
+        self.emit("shrq $6, %rdx")
+        self.emit("call vyl_sha256_blocks")
+        # Tail: copy into the zeroed pad buffer, append 0x80 and the bit length
+        self.emit("leaq vyl_sha_pad(%rip), %rdi")
+        self.emit("pxor %xmm0, %xmm0")
+        for off in range(0, 128, 16):
+            self.emit(f"movdqa %xmm0, {off}(%rdi)")
+        self.emit("movq %r12, %rsi")
+        self.emit("andq $-64, %rsi")
+        self.emit("addq %rbx, %rsi")
+        self.emit("movq %r12, %rcx")
+        self.emit("andq $63, %rcx")
+        self.emit("movq %rcx, %r14")
+        self.emit("rep movsb")
+        self.emit("movb $0x80, (%rdi)")
+        self.emit("leaq vyl_sha_pad(%rip), %rsi")
+        self.emit("movl $1, %edx")
+        self.emit("cmpq $56, %r14")
+        self.emit("jb vyl_sha256_shani_pad")
+        self.emit("movl $2, %edx")  # no room for the length: one more block
+        self.emit("vyl_sha256_shani_pad:")
+        self.emit("movq %rdx, %rax")
+        self.emit("shlq $6, %rax")
+        self.emit("movq %r12, %rcx")
+        self.emit("shlq $3, %rcx")
+        self.emit("bswapq %rcx")
+        self.emit("movq %rcx, -8(%rsi,%rax,1)")
+        self.emit("leaq vyl_sha_state(%rip), %rdi")
+        self.emit("call vyl_sha256_blocks")
+        # Digest is the state words in big-endian order
+        self.emit("movdqa .sha256_flip(%rip), %xmm2")
+        self.emit("movdqa vyl_sha_state(%rip), %xmm0")
+        self.emit("movdqa vyl_sha_state+16(%rip), %xmm1")
+        self.emit("pshufb %xmm2, %xmm0")
+        self.emit("pshufb %xmm2, %xmm1")
+        self.emit("movdqu %xmm0, (%r13)")
+        self.emit("movdqu %xmm1, 16(%r13)")
+        self._emit_epilogue("%rbx", "%r12", "%r13", "%r14")
+
+        # vyl_sha256_blocks(state, data, nblocks): state is a..h as native dwords
+        msg, state0, state1 = "%xmm0", "%xmm1", "%xmm2"
+        tmp = ["%xmm3", "%xmm4", "%xmm5", "%xmm6"]
+        tmp4, flip, abef_save, cdgh_save = "%xmm7", "%xmm8", "%xmm9", "%xmm10"
+        self.emit("vyl_sha256_blocks:")
+        self.emit("shlq $6, %rdx")
+        self.emit("jz vyl_sha256_blocks_done")
+        self.emit("addq %rsi, %rdx")  # end of data
+        # DCBA, HGFE -> ABEF, CDGH
+        self.emit(f"movdqu (%rdi), {state0}")
+        self.emit(f"movdqu 16(%rdi), {state1}")
+        self.emit(f"pshufd $0xB1, {state0}, {state0}")
+        self.emit(f"pshufd $0x1B, {state1}, {state1}")
+        self.emit(f"movdqa {state0}, {tmp4}")
+        self.emit(f"palignr $8, {state1}, {state0}")
+        self.emit(f"pblendw $0xF0, {tmp4}, {state1}")
+        self.emit(f"movdqa .sha256_flip(%rip), {flip}")
+        self.emit("leaq .sha256_k(%rip), %rax")
+        self.emit(".p2align 4")
+        self.emit("vyl_sha256_blocks_loop:")
+        self.emit(f"movdqa {state0}, {abef_save}")
+        self.emit(f"movdqa {state1}, {cdgh_save}")
+        for i in range(16):  # four rounds per step
+            cur, prev, nxt = tmp[i % 4], tmp[(i - 1) % 4], tmp[(i + 1) % 4]
+            if i < 4:
+                self.emit(f"movdqu {i * 16}(%rsi), {msg}")
+                self.emit(f"pshufb {flip}, {msg}")
+                self.emit(f"movdqa {msg}, {cur}")
+            else:
+                self.emit(f"movdqa {cur}, {msg}")
+            self.emit(f"paddd {i * 16}(%rax), {msg}")
+            self.emit(f"sha256rnds2 {state0}, {state1}")
+            if 3 <= i <= 14:
+                self.emit(f"movdqa {cur}, {tmp4}")
+                self.emit(f"palignr $4, {prev}, {tmp4}")
+                self.emit(f"paddd {tmp4}, {nxt}")
+                self.emit(f"sha256msg2 {cur}, {nxt}")
+            self.emit(f"pshufd $0x0E, {msg}, {msg}")
+            self.emit(f"sha256rnds2 {state1}, {state0}")
+            if 1 <= i <= 12:
+                self.emit(f"sha256msg1 {cur}, {prev}")
+        self.emit(f"paddd {abef_save}, {state0}")
+        self.emit(f"paddd {cdgh_save}, {state1}")
+        self.emit("addq $64, %rsi")
+        self.emit("cmpq %rdx, %rsi")
+        self.emit("jne vyl_sha256_blocks_loop")
+        # ABEF, CDGH -> DCBA, HGFE
+        self.emit(f"pshufd $0x1B, {state0}, {state0}")
+        self.emit(f"pshufd $0xB1, {state1}, {state1}")
+        self.emit(f"movdqa {state0}, {tmp4}")
+        self.emit(f"pblendw $0xF0, {state1}, {state0}")
+        self.emit(f"palignr $8, {tmp4}, {state1}")
+        self.emit(f"movdqu {state0}, (%rdi)")
+        self.emit(f"movdqu {state1}, 16(%rdi)")
+        self.emit("vyl_sha256_blocks_done:")
+        self.emit("ret")
+
+        self.emit(".section .rodata")
+        self.emit(".balign 16")
+        self.emit(".sha256_flip: .byte 3, 2, 1, 0, 7, 6, 5, 4, 11, 10, 9, 8, 15, 14, 13, 12")
+        self.emit(".hex_nibble_mask: .fill 16, 1, 0x0f")
+        self.emit(".hex_digits: .ascii \"0123456789abcdef\"")
+        self.emit(".sha256_iv:")
+        self.emit(".long " + ", ".join(f"0x{v:08x}" for v in SHA256_IV))
+        self.emit(".sha256_k:")
+        for i in range(0, len(SHA256_K), 8):
+            self.emit(".long " + ", ".join(f"0x{v:08x}" for v in SHA256_K[i:i + 8]))
+        self.emit(".section .data")
+        self.emit("vyl_sha_ni: .long -1")
+        self.emit(".section .bss")
+        self.emit(".balign 16")
+        self.emit("vyl_sha_state: .space 32")
+        self.emit("vyl_sha_pad: .space 128")
+        self.emit(".section .text")
+
+    def _emit_runtime_functions(self):
+        # print_int: format value and newline backwards into a stack buffer,
+        # then one fwrite to stdout. No printf format parsing; ordering with
+        # other stdout output is kept because it goes through the same FILE.
         self.emit(".globl print_int")
         self.emit("print_int:")
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
-        self.emit("movq %rdi, %rsi")
-        self.emit("leaq .fmt_int(%rip), %rdi")
-        self.emit("movq $0, %rax")
-        self.emit("call printf")
+        self.emit("andq $-16, %rsp")          # callers may be mid-expression, misaligned
+        self.emit("subq $32, %rsp")
+        self.emit("leaq 31(%rsp), %rsi")
+        self.emit("movb $10, (%rsi)")
+        self._emit_decimal_digits("print_int")
+        self.emit("leaq 32(%rsp), %rdx")
+        self.emit("subq %rsi, %rdx")          # length
+        self.emit("movq %rsi, %rdi")
+        self.emit("movl $1, %esi")
+        self.emit("movq stdout(%rip), %rcx")
+        self.emit("call fwrite_unlocked")
         self.emit("leave")
         self.emit("ret")
 
-        # print_string
+        # print_string: the text as is, no format parsing; a null string
+        # prints as "(null)", as printf's %s did
         self.emit(".globl print_string")
         self.emit("print_string:")
-        self.emit("push %rbp")
-        self.emit("movq %rsp, %rbp")
-        self.emit("movq %rdi, %rsi")
-        self.emit("leaq .fmt_string(%rip), %rdi")
-        self.emit("movq $0, %rax")
-        self.emit("call printf")
-        self.emit("leave")
-        self.emit("ret")
+        self.emit("leaq .null_text(%rip), %rax")
+        self.emit("testq %rdi, %rdi")
+        self.emit("cmoveq %rax, %rdi")
+        self.emit("movq stdout(%rip), %rsi")
+        self.emit("jmp fputs_unlocked")
 
         # clock (stubbed)
         self.emit(".globl clock")
@@ -2075,20 +2875,31 @@ class CodeGenerator:
         self.emit("leave")
         self.emit("ret")
 
-        self.emit(".section .data")
-        self.emit("clock_counter: .quad 1")
-        self.emit(".fmt_int: .asciz \"%ld\\n\"")
-        self.emit(".fmt_string: .asciz \"%s\"")
-        self.emit(".fmt_newline: .asciz \"\\n\"")
-        self.emit("argc_store: .quad 0")
-        self.emit("argv_store: .quad 0")
-        self.emit(".mode_rb: .asciz \"rb\"")
-        self.emit(".mode_wb: .asciz \"wb\"")
-        self.emit("vyl_head: .quad 0")
-        self.emit("stack_base: .quad 0")
-        self.emit(".section .text")
-
-        # SHA256 helper
+        self.emit_block(r"""
+            .section .rodata
+            .fmt_newline: .asciz "\n"
+            .null_text: .asciz "(null)"
+            .mode_rb: .asciz "rb"
+            .mode_wb: .asciz "wb"
+            .section .data
+            clock_counter: .quad 1
+            .section .bss
+            .balign 8
+            argc_store: .space 8
+            argv_store: .space 8
+            vyl_head: .space 8
+            vyl_live: .space 8
+            stack_base: .space 8
+            .section .text
+        """)
+
+        # SHA256 helpers: vyl_sha256_str(str) measures, vyl_sha256(data, len)
+        self.emit(".globl vyl_sha256_str")
+        self.emit("vyl_sha256_str:")
+        self.emit("push %rdi")
+        self.emit("call strlen")
+        self.emit("movq %rax, %rsi")
+        self.emit("pop %rdi")
         self.emit(".globl vyl_sha256")
         self.emit("vyl_sha256:")
         self.emit("push %rbp")
@@ -2098,35 +2909,43 @@ class CodeGenerator:
         # 2 pushes, rsp % 16 == 0. Keep aligned.
         self.emit("subq $16, %rsp")
         self.emit("movq %rdi, %rbx")
-        self.emit("movq %rbx, %rdi")
-        self.emit("call strlen")
-        self.emit("movq %rax, %r12")
-        self.emit("leaq sha256_buf(%rip), %rdi")
-        self.emit("movq %rdi, %rdx")
+        self.emit("movq %rsi, %r12")
+        # Hash with SHA-NI when the CPU has it (probed once), else OpenSSL
+        self.emit("movl vyl_sha_ni(%rip), %eax")
+        self.emit("testl %eax, %eax")
+        self.emit("jns vyl_sha256_dispatch")
+        self.emit("call vyl_sha_ni_probe")
+        self.emit("vyl_sha256_dispatch:")
+        self.emit("leaq sha256_buf(%rip), %rdx")
         self.emit("movq %rbx, %rdi")
         self.emit("movq %r12, %rsi")
+        self.emit("testl %eax, %eax")
+        self.emit("je vyl_sha256_openssl")
+        self.emit("call vyl_sha256_shani")
+        self.emit("jmp vyl_sha256_hex")
+        self.emit("vyl_sha256_openssl:")
         self.emit("call SHA256")
-        self.emit("leaq sha256_buf(%rip), %rsi")
-        self.emit("leaq sha256_hex(%rip), %rdi")
-        self.emit("leaq hex_table(%rip), %r8")
-        self.emit("movq $0, %rcx")
-        self.emit("sha256_hex_loop:")
-        self.emit("cmpq $32, %rcx")
-        self.emit("jge sha256_hex_done")
-        self.emit("movzbl (%rsi,%rcx,1), %eax")
-        self.emit("movq %rax, %rbx")
-        self.emit("shrq $4, %rbx")
-        self.emit("andq $0xF, %rbx")
-        self.emit("movzbl (%r8,%rbx,1), %ebx")
-        self.emit("movb %bl, (%rdi,%rcx,2)")
-        self.emit("movzbl %al, %ebx")
-        self.emit("andq $0xF, %rbx")
-        self.emit("movzbl (%r8,%rbx,1), %ebx")
-        self.emit("movb %bl, 1(%rdi,%rcx,2)")
-        self.emit("incq %rcx")
-        self.emit("jmp sha256_hex_loop")
-        self.emit("sha256_hex_done:")
-        self.emit("movb $0, 64(%rdi)")
+        # Hex-encode 16 digest bytes at a time: split each byte into
+        # nibbles, map them to digits with pshufb, interleave high/low
+        self.emit("vyl_sha256_hex:")
+        self.emit("movdqa .hex_nibble_mask(%rip), %xmm4")
+        self.emit("movdqa .hex_digits(%rip), %xmm5")
+        for half in (0, 16):
+            self.emit(f"movdqu sha256_buf+{half}(%rip), %xmm0")
+            self.emit("movdqa %xmm0, %xmm1")
+            self.emit("psrlw $4, %xmm1")
+            self.emit("pand %xmm4, %xmm1")  # high nibbles
+            self.emit("pand %xmm4, %xmm0")  # low nibbles
+            self.emit("movdqa %xmm5, %xmm2")
+            self.emit("pshufb %xmm1, %xmm2")
+            self.emit("movdqa %xmm5, %xmm3")
+            self.emit("pshufb %xmm0, %xmm3")
+            self.emit("movdqa %xmm2, %xmm1")
+            self.emit("punpcklbw %xmm3, %xmm1")
+            self.emit("punpckhbw %xmm3, %xmm2")
+            self.emit(f"movdqu %xmm1, sha256_hex+{half * 2}(%rip)")
+            self.emit(f"movdqu %xmm2, sha256_hex+{half * 2 + 16}(%rip)")
+        self.emit("movb $0, sha256_hex+64(%rip)")
         self.emit("leaq sha256_hex(%rip), %rax")
         self.emit("addq $16, %rsp")
         self.emit("pop %r12")
@@ -2134,48 +2953,58 @@ class CodeGenerator:
         self.emit("leave")
         self.emit("ret")
 
-        # input_line -> returns malloc'd string or 0 on EOF/error
+        self._emit_sha256_shani()
+
+        # input_line -> returns a tracked string or 0 on EOF/error. getline
+        # reads into a reusable scratch buffer that grows to fit the longest
+        # line seen; each line is then copied into an exact-size allocation.
         self.emit(".globl vyl_input")
         self.emit("vyl_input:")
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
         self.emit("push %rbx")
         self.emit("push %r12")
-        self.emit("movq $4096, %rdi")
-        self.emit("call vyl_alloc")
-        self.emit("movq %rax, %r12")
-        self.emit("cmpq $0, %r12")
-        self.emit("je vyl_input_fail")
-        self.emit("movq %r12, %rdi")
-        self.emit("movq $4096, %rsi")
+        self.emit("leaq vyl_line_buf(%rip), %rdi")
+        self.emit("leaq vyl_line_cap(%rip), %rsi")
         self.emit("movq stdin(%rip), %rdx")
-        self.emit("call fgets")
-        self.emit("cmpq $0, %rax")
-        self.emit("je vyl_input_fail")
-        # strip trailing newline if present
-        self.emit("movq %r12, %rdi")
-        self.emit("call strlen")
+        self.emit("call getline")
+        self.emit("testq %rax, %rax")
+        self.emit("jle vyl_input_fail")
         self.emit("movq %rax, %rbx")
-        self.emit("cmpq $0, %rbx")
-        self.emit("je vyl_input_done")
+        # strip trailing newline if present
+        self.emit("movq vyl_line_buf(%rip), %rax")
+        self.emit("cmpb $10, -1(%rax,%rbx,1)")
+        self.emit("jne vyl_input_copy")
         self.emit("decq %rbx")
-        self.emit("cmpb $10, (%r12,%rbx,1)")
-        self.emit("jne vyl_input_done")
+        self.emit("vyl_input_copy:")
+        self.emit("leaq 1(%rbx), %rdi")
+        self.emit("call vyl_alloc")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_input_fail")
+        self.emit("movq %rax, %r12")
+        self.emit("movq %rax, %rdi")
+        self.emit("movq vyl_line_buf(%rip), %rsi")
+        self.emit("movq %rbx, %rdx")
+        self.emit("call memcpy")
         self.emit("movb $0, (%r12,%rbx,1)")
-        self.emit("vyl_input_done:")
         self.emit("movq %r12, %rax")
         self.emit("pop %r12")
         self.emit("pop %rbx")
         self.emit("leave")
         self.emit("ret")
         self.emit("vyl_input_fail:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("pop %r12")
         self.emit("pop %rbx")
         self.emit("leave")
         self.emit("ret")
+        self.emit(".section .bss")
+        self.emit(".balign 8")
+        self.emit("vyl_line_buf: .space 8")
+        self.emit("vyl_line_cap: .space 8")
+        self.emit(".section .text")
 
-        # read_all
+        # read_all: size the file with fstat (st_size at offset 48), then one fread
         self.emit(".globl vyl_read_all")
         self.emit("vyl_read_all:")
         self.emit("push %rbp")
@@ -2183,59 +3012,57 @@ class CodeGenerator:
         self.emit("push %rbx")
         self.emit("push %r13")
         self.emit("push %r12")
+        self.emit("subq $152, %rsp")  # struct stat, keeps %rsp 16-byte aligned
         self.emit("movq %rdi, %rbx")
-        self.emit("movq %rbx, %rdi")
-        self.emit("movq $0, %rsi")
-        self.emit("movq $2, %rdx")
-        self.emit("call fseek")
-        self.emit("movq %rbx, %rdi")
-        self.emit("call ftell")
-        self.emit("movq %rax, %r12")
-        self.emit("movq %rbx, %rdi")
-        self.emit("call rewind")
-        self.emit("cmpq $0, %r12")
+        self.emit("call fileno")
+        self.emit("movl %eax, %edi")
+        self.emit("movq %rsp, %rsi")
+        self.emit("call fstat")
+        self.emit("testl %eax, %eax")
+        self.emit("jne vyl_read_all_zero")
+        self.emit("movq 48(%rsp), %r12")
+        self.emit("testq %r12, %r12")
         self.emit("jle vyl_read_all_zero")
-        self.emit("movq %r12, %rdi")
-        self.emit("incq %rdi")
+        self.emit("leaq 1(%r12), %rdi")
         self.emit("call vyl_alloc")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_read_all_zero")
         self.emit("movq %rax, %r13")
         self.emit("movq %r13, %rdi")
-        self.emit("movq $1, %rsi")
+        self.emit("movl $1, %esi")
         self.emit("movq %r12, %rdx")
         self.emit("movq %rbx, %rcx")
-        self.emit("call fread")
-        self.emit("movb $0, (%r13,%r12,1)")
+        self.emit("call fread_unlocked")
+        self.emit("movb $0, (%r13,%rax,1)")  # terminate at what was actually read
         self.emit("movq %r13, %rax")
-        self.emit("jmp vyl_read_all_done")
+        self._emit_epilogue("%rbx", "%r13", "%r12")
         self.emit("vyl_read_all_zero:")
-        self.emit("movq $0, %rax")
-        self.emit("vyl_read_all_done:")
-        self.emit("pop %r13")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self._emit_zero()
+        self._emit_epilogue("%rbx", "%r13", "%r12")
 
-        # write_all
-        self.emit(".globl vyl_write_all")
-        self.emit("vyl_write_all:")
-        self.emit("push %rbp")
-        self.emit("movq %rsp, %rbp")
+        # write_str(file, str): measure, then fall into write_all
+        self.emit(".globl vyl_write_str")
+        self.emit("vyl_write_str:")
         self.emit("push %rbx")
+        self.emit("push %r12")
+        self.emit("subq $8, %rsp")
         self.emit("movq %rdi, %rbx")
-        self.emit("movq %rsi, %r8")
-        self.emit("movq %r8, %rdi")
+        self.emit("movq %rsi, %r12")
+        self.emit("movq %rsi, %rdi")
         self.emit("call strlen")
         self.emit("movq %rax, %rdx")
-        self.emit("movq %r8, %rdi")
-        self.emit("movq $1, %rsi")
-        self.emit("movq %rdx, %rdx")
-        self.emit("movq %rbx, %rcx")
-        self.emit("call fwrite")
-        self.emit("movq %rax, %rax")
+        self.emit("movq %r12, %rsi")
+        self.emit("movq %rbx, %rdi")
+        self.emit("addq $8, %rsp")
+        self.emit("pop %r12")
         self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        # write_all(file, data, len): tail call into fwrite
+        self.emit(".globl vyl_write_all")
+        self.emit("vyl_write_all:")
+        self.emit("movq %rdi, %rcx")
+        self.emit("movq %rsi, %rdi")
+        self.emit("movl $1, %esi")
+        self.emit("jmp fwrite_unlocked")
 
         # vyl_isqrt (integer floor sqrt)
         self.emit(".globl vyl_isqrt")
@@ -2243,7 +3070,7 @@ class CodeGenerator:
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
         self.emit("push %rbx")
-        self.emit("cmpq $0, %rdi")
+        self.emit("testq %rdi, %rdi")
         self.emit("jle vyl_isqrt_zero")
         self.emit("xorq %rbx, %rbx")
         self.emit("vyl_isqrt_loop:")
@@ -2260,74 +3087,238 @@ class CodeGenerator:
         self.emit("leave")
         self.emit("ret")
         self.emit("vyl_isqrt_zero:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("pop %rbx")
         self.emit("leave")
         self.emit("ret")
 
-        # vyl_alloc (tracked malloc)
+        # vyl_alloc (tracked allocation)
+        # Header is 32 bytes: next, size, prev (the link slot pointing at the
+        # block, so Free unlinks in O(1)) and padding that keeps data 16-byte
+        # aligned. Marks live in a per-collection bitmap.
+        # vyl_live counts the blocks on the vyl_head list so vyl_collect can size
+        # its index without walking the list twice.
+        # Small requests pop a chunk off their size class's free list (classes
+        # of 16..SLAB_MAX_SIZE data bytes, refilled by bumping through an mmap'd
+        # slab shared by all classes); larger ones go to malloc. The size alone
+        # tells the two apart later.
         self.emit(".globl vyl_alloc")
         self.emit("vyl_alloc:")
+        self.emit(f"cmpq ${SLAB_MAX_SIZE}, %rdi")
+        self.emit("ja vyl_alloc_large")
+        self.emit("movq %rdi, %rcx")
+        self._emit_size_class("%rcx")
+        self.emit("leaq vyl_slab_free(%rip), %r8")
+        self.emit("movq (%r8,%rcx,8), %rax")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_slab_refill")
+        self.emit("movq (%rax), %rdx")
+        self.emit("movq %rdx, (%r8,%rcx,8)")
+        self.emit("vyl_slab_link:")
+        self.emit("movq vyl_head(%rip), %rdx")
+        self.emit("movq %rdx, (%rax)")
+        self.emit("movq %rdi, 8(%rax)")
+        self.emit("leaq vyl_head(%rip), %rcx")
+        self.emit("movq %rcx, 16(%rax)")
+        self.emit("movq %rax, vyl_head(%rip)")
+        self.emit("incq vyl_live(%rip)")
+        self.emit("testq %rdx, %rdx")
+        self.emit("je vyl_slab_linked")
+        self.emit("movq %rax, 16(%rdx)")     # old head's link slot is now ours
+        self.emit("vyl_slab_linked:")
+        self.emit("addq $32, %rax")
+        self.emit("ret")
+        # Empty class list: bump a chunk (32-byte header + 16 << class data
+        # bytes) off the current slab, mapping a new one when it runs out.
+        self.emit("vyl_slab_refill:")
+        self.emit("movl $16, %edx")
+        self.emit("shlq %cl, %rdx")
+        self.emit("addq $32, %rdx")
+        self.emit("movq vyl_slab_top(%rip), %rax")
+        self.emit("leaq (%rax,%rdx,1), %r9")
+        self.emit("cmpq vyl_slab_end(%rip), %r9")
+        self.emit("ja vyl_slab_grow")
+        self.emit("movq %r9, vyl_slab_top(%rip)")
+        self.emit("jmp vyl_slab_link")
+        self._emit_cold_begin()
+        self.emit("vyl_slab_grow:")
+        self.emit("push %rdi")
+        self.emit("push %rcx")
+        self.emit("push %rdx")
+        self._emit_zero("%rdi")
+        self.emit(f"movl ${SLAB_SIZE}, %esi")
+        self.emit("movl $3, %edx")       # PROT_READ | PROT_WRITE
+        self.emit("movl $0x22, %ecx")    # MAP_PRIVATE | MAP_ANONYMOUS
+        self.emit("movq $-1, %r8")
+        self._emit_zero("%r9")
+        self.emit("call mmap")
+        self.emit("pop %rdx")
+        self.emit("pop %rcx")
+        self.emit("pop %rdi")
+        self.emit("cmpq $-1, %rax")
+        self.emit("je vyl_slab_fail")
+        self.emit(f"leaq {SLAB_SIZE}(%rax), %r9")
+        self.emit("movq %r9, vyl_slab_end(%rip)")
+        self.emit("leaq (%rax,%rdx,1), %r9")
+        self.emit("movq %r9, vyl_slab_top(%rip)")
+        self.emit("jmp vyl_slab_link")
+        self.emit("vyl_slab_fail:")
+        self._emit_zero()
+        self.emit("ret")
+        self._emit_cold_end()
+        self.emit("vyl_alloc_large:")
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
         self.emit("push %rbx")
         self.emit("movq %rdi, %rbx")  # size
-        self.emit("addq $24, %rdi")
+        self.emit("addq $32, %rdi")
         self.emit("call malloc")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_alloc_fail")
+        self.emit("vyl_alloc_link:")
         self.emit("movq vyl_head(%rip), %rcx")
         self.emit("movq %rcx, (%rax)")      # next
         self.emit("movq %rbx, 8(%rax)")      # size
-        self.emit("movq $0, 16(%rax)")       # mark
+        self.emit("leaq vyl_head(%rip), %rdx")
+        self.emit("movq %rdx, 16(%rax)")     # prev link slot
         self.emit("movq %rax, vyl_head(%rip)")
-        self.emit("addq $24, %rax")          # return data ptr
+        self.emit("incq vyl_live(%rip)")
+        self.emit("testq %rcx, %rcx")
+        self.emit("je vyl_alloc_linked")
+        self.emit("movq %rax, 16(%rcx)")
+        self.emit("vyl_alloc_linked:")
+        self.emit("addq $32, %rax")          # return data ptr
         self.emit("pop %rbx")
         self.emit("leave")
         self.emit("ret")
 
+        # vyl_calloc(size): vyl_alloc with zeroed data. Slab chunks are cleared
+        # 16 bytes at a time (classes are multiples of 16); large blocks come
+        # from calloc, which skips the clearing for freshly mapped pages.
+        self.emit(".globl vyl_calloc")
+        self.emit("vyl_calloc:")
+        self.emit(f"cmpq ${SLAB_MAX_SIZE}, %rdi")
+        self.emit("ja vyl_calloc_large")
+        self.emit("push %rdi")
+        self.emit("call vyl_alloc")
+        self.emit("pop %rcx")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_calloc_done")
+        self.emit("addq $15, %rcx")
+        self.emit("andq $-16, %rcx")
+        self.emit("je vyl_calloc_done")
+        self.emit("pxor %xmm0, %xmm0")
+        self.emit("vyl_calloc_clear:")
+        self.emit("movaps %xmm0, -16(%rax,%rcx,1)")
+        self.emit("subq $16, %rcx")
+        self.emit("jne vyl_calloc_clear")
+        self.emit("vyl_calloc_done:")
+        self.emit("ret")
+        self.emit("vyl_calloc_large:")
+        self.emit("push %rbp")
+        self.emit("movq %rsp, %rbp")
+        self.emit("push %rbx")
+        self.emit("movq %rdi, %rbx")  # size
+        self.emit("leaq 32(%rdi), %rsi")
+        self.emit("movl $1, %edi")
+        self.emit("call calloc")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_alloc_fail")
+        self.emit("jmp vyl_alloc_link")
+
+        # vyl_release(header): return an unlinked block to its slab free list,
+        # or to malloc if it was too big for one, and drop it from vyl_live.
+        # Clearing prev marks it as no longer on the allocation list.
+        self.emit("vyl_release:")
+        self.emit("decq vyl_live(%rip)")
+        self.emit("movq $0, 16(%rdi)")
+        self.emit("movq 8(%rdi), %rcx")
+        self.emit(f"cmpq ${SLAB_MAX_SIZE}, %rcx")
+        self.emit("ja free")
+        self._emit_size_class("%rcx")
+        self.emit("leaq vyl_slab_free(%rip), %r8")
+        self.emit("movq (%r8,%rcx,8), %rdx")
+        self.emit("movq %rdx, (%rdi)")
+        self.emit("movq %rdi, (%r8,%rcx,8)")
+        self.emit("ret")
+
+        # vyl_free(ptr): explicit Free of a vyl_alloc block. Unlinks it from
+        # the allocation list through its prev link slot, so the collector
+        # never sees it again, in constant time; freeing null or an already
+        # freed block is ignored.
+        self.emit(".globl vyl_free")
+        self.emit("vyl_free:")
+        self.emit("testq %rdi, %rdi")
+        self.emit("je vyl_free_done")
+        self.emit("subq $32, %rdi")
+        self.emit("movq 16(%rdi), %rax")     # link slot pointing at the block
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_free_done")
+        self.emit("movq (%rdi), %rdx")
+        self.emit("movq %rdx, (%rax)")
+        self.emit("testq %rdx, %rdx")
+        self.emit("je vyl_release")
+        self.emit("movq %rax, 16(%rdx)")
+        self.emit("jmp vyl_release")
+        self.emit("vyl_free_done:")
+        self.emit("ret")
+        self.emit(".section .bss")
+        self.emit(".balign 8")
+        self.emit("vyl_slab_free: .space 40")  # one list head per size class
+        self.emit("vyl_slab_top: .space 8")
+        self.emit("vyl_slab_end: .space 8")
+        self.emit(".section .text")
+
+        # vyl_arena_alloc(size) -> ptr. Bump allocation for scratch data whose
+        # lifetime is one runtime call; the caller saves vyl_arena_top on entry
+        # and stores it back on exit. Falls back to vyl_alloc when full.
+        self.emit(".globl vyl_arena_alloc")
+        self.emit("vyl_arena_alloc:")
+        self.emit("addq $15, %rdi")
+        self.emit("andq $-16, %rdi")
+        self.emit("movq vyl_arena_top(%rip), %rax")
+        self.emit("leaq (%rax,%rdi,1), %rdx")
+        self.emit("leaq vyl_arena_end(%rip), %rcx")
+        self.emit("cmpq %rcx, %rdx")
+        self.emit("ja vyl_alloc")
+        self.emit("movq %rdx, vyl_arena_top(%rip)")
+        self.emit("ret")
+        self.emit(".section .bss")
+        self.emit(".balign 16")
+        self.emit(f"vyl_arena: .space {HTTP_ARENA_SIZE}")
+        self.emit("vyl_arena_end:")
+        self.emit(".section .data")
+        self.emit("vyl_arena_top: .quad vyl_arena")
+        self.emit(".section .text")
+
         # vyl_bounds_fail: abort on null/OO.B
         self.emit(".globl vyl_bounds_fail")
         self.emit("vyl_bounds_fail:")
-        self.emit("movq $1, %rdi")
+        self.emit("movl $1, %edi")
         self.emit("movq $60, %rax")
         self.emit("syscall")
         self.emit("vyl_alloc_fail:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("pop %rbx")
         self.emit("leave")
         self.emit("ret")
 
-        # vyl_mark_ptr(rdi=ptr)
-        self.emit(".globl vyl_mark_ptr")
-        self.emit("vyl_mark_ptr:")
-        self.emit("push %rbp")
-        self.emit("movq %rsp, %rbp")
-        self.emit("push %rbx")
-        self.emit("cmpq $0, %rdi")
-        self.emit("je vyl_mark_done")
-        self.emit("movq vyl_head(%rip), %rbx")
-        self.emit("vyl_mark_loop:")
-        self.emit("cmpq $0, %rbx")
-        self.emit("je vyl_mark_done")
-        self.emit("leaq 24(%rbx), %rax")
-        self.emit("cmpq %rax, %rdi")
-        self.emit("jb vyl_mark_next")
-        self.emit("movq 8(%rbx), %rcx")
-        self.emit("leaq (%rax,%rcx,1), %rdx")
-        self.emit("cmpq %rdi, %rdx")
-        self.emit("jae vyl_mark_next")
-        self.emit("movq $1, 16(%rbx)")
-        self.emit("jmp vyl_mark_done")
-        self.emit("vyl_mark_next:")
-        self.emit("movq (%rbx), %rbx")
-        self.emit("jmp vyl_mark_loop")
-        self.emit("vyl_mark_done:")
-        self.emit("pop %rbx")
-        self.emit("leave")
+        # vyl_gc_cmp: qsort comparator ordering index entries by start address
+        self.emit("vyl_gc_cmp:")
+        self.emit("movq (%rdi), %rax")
+        self.emit("xorl %ecx, %ecx")
+        self.emit("cmpq (%rsi), %rax")
+        self.emit("seta %cl")
+        self.emit("sbbl $0, %ecx")
+        self.emit("movl %ecx, %eax")
         self.emit("ret")
 
         # vyl_collect (mark-sweep)
+        # Marking first builds an index of {data start, header} pairs sorted by
+        # address, so each stack word costs a bounds check plus a binary search
+        # instead of a walk of the allocation list. Marks are bits in a bitmap
+        # parallel to the index, so headers are only written when relinked.
+        # Both are plain malloc memory, never themselves tracked or scanned.
         self.emit(".globl vyl_collect")
         self.emit("vyl_collect:")
         self.emit("push %rbp")
@@ -2335,42 +3326,184 @@ class CodeGenerator:
         self.emit("push %rbx")
         self.emit("push %r12")
         self.emit("push %r13")
+        # r14/r15 may hold live pointers (register params); spill them so the scan sees them
+        self.emit("push %r14")
+        self.emit("push %r15")
+        # 5 pushes, rsp % 16 == 8. Keep aligned for the calls.
+        self.emit("subq $8, %rsp")
+        self.emit("movq vyl_live(%rip), %r14")
+        self.emit("testq %r14, %r14")
+        self.emit("je vyl_sweep_done")
+        # N index entries followed by the (N+63)/64-qword mark bitmap
+        self.emit("leaq 63(%r14), %rdi")
+        self.emit("shrq $6, %rdi")
+        self.emit("leaq (%rdi,%r14,2), %rdi")
+        self.emit("shlq $3, %rdi")
+        self.emit("call malloc")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_sweep_done")  # no memory for the index: skip this cycle
+        self.emit("movq %rax, %r15")
+        # Fill and sort the index
+        self.emit("movq vyl_head(%rip), %rbx")
+        self.emit("movq %rax, %rdi")
+        self.emit("vyl_gc_fill:")
+        self.emit("leaq 32(%rbx), %rax")
+        self.emit("movq %rax, (%rdi)")
+        self.emit("movq %rbx, 8(%rdi)")
+        self.emit("addq $16, %rdi")
+        self.emit("movq (%rbx), %rbx")
+        self.emit("testq %rbx, %rbx")
+        self.emit("jnz vyl_gc_fill")
+        self.emit("movq %r15, %rdi")
+        self.emit("movq %r14, %rsi")
+        self.emit("movl $16, %edx")
+        self.emit("leaq vyl_gc_cmp(%rip), %rcx")
+        self.emit("call qsort")
+        # Clear the bitmap; r11 keeps its address for the scan (no calls there)
+        self.emit("movq %r14, %r11")
+        self.emit("shlq $4, %r11")
+        self.emit("addq %r15, %r11")
+        self.emit("movq %r11, %rdi")
+        self.emit("leaq 63(%r14), %rcx")
+        self.emit("shrq $6, %rcx")
+        self._emit_zero()
+        self.emit("rep stosq")
+        # Blocks never overlap, so [first start, last end) bounds every hit;
+        # r8 = first start, r9 = span, and (word - r8) < r9 is the range test
+        self.emit("movq (%r15), %r8")
+        self.emit("movq %r14, %rax")
+        self.emit("shlq $4, %rax")
+        self.emit("movq -8(%r15,%rax,1), %rcx")
+        self.emit("movq -16(%r15,%rax,1), %r9")
+        self.emit("addq 8(%rcx), %r9")
+        self.emit("subq %r8, %r9")
         self.emit("movq stack_base(%rip), %r12")
         self.emit("movq %rsp, %r13")
+        # Four stack words per step: if none is in range (the usual case)
+        # the step costs four branch-free range tests and one jump
         self.emit("vyl_mark_scan:")
         self.emit("cmpq %r12, %r13")
         self.emit("jae vyl_mark_done_scan")
-        self.emit("movq (%r13), %rdi")
-        self.emit("call vyl_mark_ptr")
-        self.emit("addq $8, %r13")
+        self.emit("leaq 32(%r13), %rbx")
+        self.emit("cmpq %r12, %rbx")
+        self.emit("ja vyl_mark_tail")
+        self.emit("xorl %edx, %edx")
+        for off in (0, 8, 16, 24):
+            self.emit(f"movq {off}(%r13), %rax")
+            self.emit("subq %r8, %rax")
+            self.emit("cmpq %r9, %rax")
+            self.emit("adcq $0, %rdx")
+        self.emit("testq %rdx, %rdx")
+        self.emit("jne vyl_mark_word")
+        self.emit("movq %rbx, %r13")
         self.emit("jmp vyl_mark_scan")
+        self.emit("vyl_mark_tail:")
+        self.emit("movq %r12, %rbx")
+        # One word at a time up to %rbx
+        self.emit("vyl_mark_word:")
+        self.emit("cmpq %rbx, %r13")
+        self.emit("jae vyl_mark_scan")
+        self.emit("movq (%r13), %r10")
+        self.emit("addq $8, %r13")
+        self.emit("movq %r10, %rax")
+        self.emit("subq %r8, %rax")
+        self.emit("cmpq %r9, %rax")
+        self.emit("jae vyl_mark_word")
+        # Find the last entry starting at or below the word, prefetching the
+        # midpoints of both halves the next step can pick
+        self.emit("movq %r15, %rsi")
+        self.emit("movq %r14, %rcx")
+        self.emit("vyl_mark_search:")
+        self.emit("cmpq $1, %rcx")
+        self.emit("jbe vyl_mark_found")
+        self.emit("movq %rcx, %rdx")
+        self.emit("shrq $1, %rdx")
+        self.emit("movq %rdx, %rax")
+        self.emit("shlq $4, %rax")
+        self.emit("addq %rsi, %rax")
+        self.emit("movq %rdx, %rdi")
+        self.emit("shrq $1, %rdi")
+        self.emit("shlq $4, %rdi")
+        self.emit("prefetcht0 (%rsi,%rdi,1)")
+        self.emit("prefetcht0 (%rax,%rdi,1)")
+        self.emit("cmpq (%rax), %r10")
+        self.emit("cmovaeq %rax, %rsi")
+        self.emit("subq %rdx, %rcx")
+        self.emit("jmp vyl_mark_search")
+        self.emit("vyl_mark_found:")
+        # (word - data) < size, unsigned
+        self.emit("movq 8(%rsi), %rax")
+        self.emit("subq (%rsi), %r10")
+        self.emit("cmpq 8(%rax), %r10")
+        self.emit("jae vyl_mark_word")
+        self.emit("subq %r15, %rsi")
+        self.emit("shrq $4, %rsi")
+        self.emit("btsq %rsi, (%r11)")
+        self.emit("jmp vyl_mark_word")
         self.emit("vyl_mark_done_scan:")
-        self.emit("movq vyl_head(%rip), %rbx")
-        self.emit("xor %rdi, %rdi")  # prev = 0
-        self.emit("vyl_sweep_loop:")
-        self.emit("cmpq $0, %rbx")
-        self.emit("je vyl_sweep_done")
-        self.emit("movq 16(%rbx), %rax")
-        self.emit("cmpq $0, %rax")
-        self.emit("jne vyl_keep")
-        self.emit("movq (%rbx), %rcx")   # next
-        self.emit("cmpq $0, %rdi")
-        self.emit("je vyl_sweep_update_head")
-        self.emit("movq %rcx, (%rdi)")
-        self.emit("jmp vyl_sweep_free")
-        self.emit("vyl_sweep_update_head:")
-        self.emit("movq %rcx, vyl_head(%rip)")
-        self.emit("vyl_sweep_free:")
-        self.emit("movq %rbx, %rdi")
+        # Sweep the index 64 entries (one bitmap word) at a time: relink the
+        # marked headers in address order behind the link slot in r12 (and
+        # point their prev at it), then release the rest. rbx = first entry
+        # of the word, r13 = dead bits.
+        self.emit("leaq vyl_head(%rip), %r12")  # link slot; next sits at offset 0
+        self._emit_zero("%rbx")
+        self.emit("vyl_sweep_word:")
+        self.emit("cmpq %r14, %rbx")
+        self.emit("jae vyl_sweep_end")
+        self.emit("movq %r14, %rax")
+        self.emit("shlq $4, %rax")
+        self.emit("addq %r15, %rax")
+        self.emit("movq %rbx, %rcx")
+        self.emit("shrq $6, %rcx")
+        self.emit("movq (%rax,%rcx,8), %rdx")  # live bits
+        self.emit("movq %rdx, %r13")
+        self.emit("notq %r13")
+        self.emit("movq %r14, %rcx")
+        self.emit("subq %rbx, %rcx")
+        self.emit("cmpq $64, %rcx")
+        self.emit("jae vyl_sweep_full")
+        self.emit("movl $1, %eax")             # last word: no entries past N
+        self.emit("shlq %cl, %rax")
+        self.emit("decq %rax")
+        self.emit("andq %rax, %r13")
+        self.emit("vyl_sweep_full:")
+        self.emit("movq %rbx, %rsi")
+        self.emit("shlq $4, %rsi")
+        self.emit("addq %r15, %rsi")
+        self.emit("vyl_sweep_live:")
+        self.emit("testq %rdx, %rdx")
+        self.emit("je vyl_sweep_dead")
+        self.emit("tzcntq %rdx, %rcx")
+        self.emit("shlq $4, %rcx")
+        self.emit("movq 8(%rsi,%rcx,1), %rax")
+        self.emit("movq %rax, (%r12)")
+        self.emit("movq %r12, 16(%rax)")
+        self.emit("movq %rax, %r12")
+        self.emit("leaq -1(%rdx), %rcx")
+        self.emit("andq %rcx, %rdx")
+        self.emit("jmp vyl_sweep_live")
+        self.emit("vyl_sweep_dead:")
+        self.emit("testq %r13, %r13")
+        self.emit("je vyl_sweep_next")
+        self.emit("tzcntq %r13, %rcx")
+        self.emit("leaq -1(%r13), %rax")
+        self.emit("andq %rax, %r13")
+        self.emit("addq %rbx, %rcx")
+        self.emit("shlq $4, %rcx")
+        self.emit("movq 8(%r15,%rcx,1), %rdi")
+        self.emit("call vyl_release")
+        self.emit("jmp vyl_sweep_dead")
+        self.emit("vyl_sweep_next:")
+        self.emit("addq $64, %rbx")
+        self.emit("jmp vyl_sweep_word")
+        self.emit("vyl_sweep_end:")
+        self.emit("movq $0, (%r12)")
+        self.emit("movq %r15, %rdi")
         self.emit("call free")
-        self.emit("movq %rcx, %rbx")
-        self.emit("jmp vyl_sweep_loop")
-        self.emit("vyl_keep:")
-        self.emit("movq $0, 16(%rbx)")
-        self.emit("movq %rbx, %rdi")
-        self.emit("movq (%rbx), %rbx")
-        self.emit("jmp vyl_sweep_loop")
         self.emit("vyl_sweep_done:")
+        self.emit("addq $8, %rsp")
+        self.emit("pop %r15")
+        self.emit("pop %r14")
         self.emit("pop %r13")
         self.emit("pop %r12")
         self.emit("pop %rbx")
@@ -2378,19 +3511,25 @@ class CodeGenerator:
         self.emit("ret")
 
         # data
-        self.emit(".section .data")
-        self.emit("sha256_buf: .space 32")
-        self.emit("sha256_hex: .space 65")
-        self.emit("hex_table: .asciz \"0123456789abcdef\"")
-        self.emit("tls_ctx: .quad 0")
-
-        # File/dir helper strings
-        self.emit(".fmt_mkdirp: .asciz \"mkdir -p %s\"")
-        self.emit(".fmt_rmrf: .asciz \"rm -rf %s\"")
-        self.emit(".fmt_unzip: .asciz \"unzip -o -q %s -d %s\"")
-
-        # Switch back to text for networking helpers
-        self.emit(".section .text")
+        # TLS session cache: 4 slots of {host hash, SSL_SESSION*}, indexed by hash & 3.
+        # vyl_cmd_buf is the command-line scratch for mkdir_p (not reentrant).
+        self.emit_block(r"""
+            .section .rodata
+            .mkdirp_prefix: .asciz "mkdir -p \""
+            .str_unzip: .asciz "unzip"
+            .str_opt_o: .asciz "-o"
+            .str_opt_q: .asciz "-q"
+            .str_opt_d: .asciz "-d"
+            .section .bss
+            .balign 8
+            tls_ctx: .space 8
+            vyl_tls_sessions: .space 64
+            sha256_buf: .space 32
+            sha256_hex: .space 65
+            .balign 16
+            vyl_cmd_buf: .space 4096
+            .section .text
+        """)
 
         # Networking helpers
         self.emit(".globl vyl_tcp_connect")
@@ -2404,38 +3543,71 @@ class CodeGenerator:
         self.emit("subq $208, %rsp")
         self.emit("movq %rdi, -24(%rbp)")  # host ptr
         self.emit("movq %rsi, -32(%rbp)")  # port int
+        self.emit("movq $0, -40(%rbp)")    # res (none yet)
+        # Probe the resolver cache: entry = vyl_dns_cache + (hash & 63) * 64
+        # {hash, stamp, family, socktype, protocol, addrlen, sockaddr[32]}
+        self.emit("call vyl_host_hash")
+        self.emit("movq %rax, -48(%rbp)")  # host hash
+        self.emit("movq %rax, %rbx")
+        self.emit("andl $63, %ebx")
+        self.emit("shlq $6, %rbx")
+        self.emit("leaq vyl_dns_cache(%rip), %rcx")
+        self.emit("addq %rcx, %rbx")
+        self.emit("cmpq %rax, (%rbx)")
+        self.emit("jne vyl_tcp_lookup")
+        self.emit("xorl %edi, %edi")
+        self.emit("call time")
+        self.emit("subq 8(%rbx), %rax")
+        self.emit(f"cmpq ${DNS_CACHE_TTL_SECONDS}, %rax")
+        self.emit("jae vyl_tcp_lookup")
+        self.emit("movl 16(%rbx), %edi")
+        self.emit("movl 20(%rbx), %esi")
+        self.emit("movl 24(%rbx), %edx")
+        self.emit("call socket")
+        self.emit("movq %rax, %r12")
+        self.emit("testq %r12, %r12")
+        self.emit("jl vyl_tcp_fail")
+        # sin_port/sin6_port both sit at offset 2, in network byte order
+        self.emit("movq -32(%rbp), %rax")
+        self.emit("rolw $8, %ax")
+        self.emit("movw %ax, 34(%rbx)")
+        self.emit("movq %r12, %rdi")
+        self.emit("leaq 32(%rbx), %rsi")
+        self.emit("movl 28(%rbx), %edx")
+        self.emit("call connect")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_tcp_ok")
+        # Cached address refused: drop the entry and resolve again
+        self.emit("movq $0, (%rbx)")
+        self.emit("movq %r12, %rdi")
+        self.emit("call close")
+        self.emit("vyl_tcp_lookup:")
         # build port string at -80..-65
         self.emit("leaq -80(%rbp), %rdi")
         self.emit("movq $16, %rsi")
         self.emit("leaq .fmt_port(%rip), %rdx")
         self.emit("movq -32(%rbp), %rcx")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("call snprintf")
-        # zero hints at -208..-96 (14 qwords)
-        self.emit("leaq -216(%rbp), %rdi")
-        self.emit("movq $0, %rax")
-        self.emit("movq $0, %rcx")
-        self.emit("movq $14, %rdx")
-        self.emit("vyl_tcp_zero_hints:")
-        self.emit("movq $0, (%rdi,%rcx,8)")
-        self.emit("incq %rcx")
-        self.emit("cmpq %rdx, %rcx")
-        self.emit("jl vyl_tcp_zero_hints")
+        # zero hints at -216..-169 (struct addrinfo, 48 bytes) with three 16-byte stores
+        self.emit("pxor %xmm0, %xmm0")
+        self.emit("movups %xmm0, -216(%rbp)")
+        self.emit("movups %xmm0, -200(%rbp)")
+        self.emit("movups %xmm0, -184(%rbp)")
         # hints.ai_socktype = SOCK_STREAM(1)
         self.emit("movl $1, -208(%rbp)")
         # res pointer storage at -40
         self.emit("leaq -40(%rbp), %r9")
-        self.emit("movq $0, -40(%rbp)")
         # call getaddrinfo(host, portstr, &hints, &res)
         self.emit("movq -24(%rbp), %rdi")
         self.emit("leaq -80(%rbp), %rsi")
         self.emit("leaq -216(%rbp), %rdx")
         self.emit("movq %r9, %rcx")
         self.emit("call getaddrinfo")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jne vyl_tcp_fail")
         self.emit("movq -40(%rbp), %rbx")
-        self.emit("cmpq $0, %rbx")
+        self.emit("testq %rbx, %rbx")
         self.emit("je vyl_tcp_fail")
         # socket(res->ai_family, ai_socktype, ai_protocol)
         self.emit("movl 4(%rbx), %edi")
@@ -2443,17 +3615,40 @@ class CodeGenerator:
         self.emit("movl 12(%rbx), %edx")
         self.emit("call socket")
         self.emit("movq %rax, %r12")
-        self.emit("cmpq $0, %r12")
+        self.emit("testq %r12, %r12")
         self.emit("jl vyl_tcp_cleanup_fail")
         # connect(fd, res->ai_addr, res->ai_addrlen)
         self.emit("movq %r12, %rdi")
         self.emit("movq 24(%rbx), %rsi")
         self.emit("movl 16(%rbx), %edx")
         self.emit("call connect")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jne vyl_tcp_cleanup_fail")
+        # Remember the working address for this host
+        self.emit("cmpl $32, 16(%rbx)")
+        self.emit("ja vyl_tcp_cached")
+        self.emit("xorl %edi, %edi")
+        self.emit("call time")
+        self.emit("movq -48(%rbp), %rcx")
+        self.emit("movq %rcx, %rdx")
+        self.emit("andl $63, %edx")
+        self.emit("shlq $6, %rdx")
+        self.emit("leaq vyl_dns_cache(%rip), %rdi")
+        self.emit("addq %rdx, %rdi")
+        self.emit("movq %rcx, (%rdi)")     # hash
+        self.emit("movq %rax, 8(%rdi)")    # stamp
+        self.emit("movq 4(%rbx), %rax")    # family, socktype
+        self.emit("movq %rax, 16(%rdi)")
+        self.emit("movq 12(%rbx), %rax")   # protocol, addrlen
+        self.emit("movq %rax, 24(%rdi)")
+        self.emit("movl 16(%rbx), %ecx")
+        self.emit("movq 24(%rbx), %rsi")
+        self.emit("addq $32, %rdi")
+        self.emit("rep movsb")
+        self.emit("vyl_tcp_cached:")
         self.emit("movq -40(%rbp), %rdi")
         self.emit("call freeaddrinfo")
+        self.emit("vyl_tcp_ok:")
         self.emit("movq %r12, %rax")
         self.emit("addq $208, %rsp")
         self.emit("pop %r12")
@@ -2465,40 +3660,22 @@ class CodeGenerator:
         self.emit("call close")
         self.emit("vyl_tcp_fail:")
         self.emit("movq -40(%rbp), %rdi")
-        self.emit("cmpq $0, %rdi")
+        self.emit("testq %rdi, %rdi")
         self.emit("je vyl_tcp_fail_ret")
         self.emit("call freeaddrinfo")
         self.emit("vyl_tcp_fail_ret:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("addq $208, %rsp")
         self.emit("pop %r12")
         self.emit("pop %rbx")
         self.emit("leave")
         self.emit("ret")
 
-        # vyl_tcp_send(fd, data)
+        # vyl_tcp_send(fd, data, len)
         self.emit(".globl vyl_tcp_send")
         self.emit("vyl_tcp_send:")
-        self.emit("push %rbp")
-        self.emit("movq %rsp, %rbp")
-        self.emit("push %rbx")
-        self.emit("push %r12")
-        # 2 pushes, rsp % 16 == 0. Need to keep aligned for calls.
-        self.emit("subq $16, %rsp")
-        self.emit("movq %rdi, %rbx")       # fd
-        self.emit("movq %rsi, %r12")       # buf ptr
-        self.emit("movq %rsi, %rdi")       # strlen(buf)
-        self.emit("call strlen")
-        self.emit("movq %rax, %rdx")       # length
-        self.emit("movq %rbx, %rdi")       # send(fd, buf, len, 0)
-        self.emit("movq %r12, %rsi")
-        self.emit("movq $0, %rcx")
-        self.emit("call send")
-        self.emit("addq $16, %rsp")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self.emit("xorl %ecx, %ecx")       # send(fd, buf, len, 0)
+        self.emit("jmp send")
 
         # vyl_tcp_recv(fd, max)
         self.emit(".globl vyl_tcp_recv")
@@ -2514,15 +3691,15 @@ class CodeGenerator:
         self.emit("movq %r12, %rdi")
         self.emit("incq %rdi")
         self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_tcp_recv_fail")
         self.emit("movq %rax, %r13")       # buf ptr
         self.emit("movq %rbx, %rdi")
         self.emit("movq %r13, %rsi")
         self.emit("movq %r12, %rdx")
-        self.emit("movq $0, %rcx")
+        self._emit_zero("%rcx")
         self.emit("call recv")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jle vyl_tcp_recv_fail")
         self.emit("movq %rax, %rdx")
         self.emit("movb $0, (%r13,%rdx,1)")
@@ -2534,7 +3711,7 @@ class CodeGenerator:
         self.emit("leave")
         self.emit("ret")
         self.emit("vyl_tcp_recv_fail:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("addq $8, %rsp")
         self.emit("pop %r13")
         self.emit("pop %r12")
@@ -2553,44 +3730,41 @@ class CodeGenerator:
         # 112 works (0 - 112 = -112, 112 % 16 = 0)
         self.emit("subq $112, %rsp")
         self.emit("movq %rdi, -24(%rbp)")  # host
-        # zero hints at -104..-24 (10 qwords)
-        self.emit("leaq -104(%rbp), %rdi")
-        self.emit("movq $0, %rax")
-        self.emit("movq $10, %rcx")
-        self.emit("vyl_tcp_resolve_zero:")
-        self.emit("movq $0, (%rdi,%rax,8)")
-        self.emit("incq %rax")
-        self.emit("cmpq %rcx, %rax")
-        self.emit("jl vyl_tcp_resolve_zero")
-        # hints.family = AF_INET(2)
-        self.emit("movl $2, -96(%rbp)")
+        # zero hints at -104..-57 (struct addrinfo, 48 bytes) with three 16-byte stores
+        self.emit("pxor %xmm0, %xmm0")
+        self.emit("movups %xmm0, -104(%rbp)")
+        self.emit("movups %xmm0, -88(%rbp)")
+        self.emit("movups %xmm0, -72(%rbp)")
+        # hints.ai_family = AF_INET(2)
+        self.emit("movl $2, -100(%rbp)")
         # res storage at -32
         self.emit("movq $0, -32(%rbp)")
         self.emit("movq -24(%rbp), %rdi")
-        self.emit("movq $0, %rsi")
+        self._emit_zero("%rsi")
         self.emit("leaq -104(%rbp), %rdx")
         self.emit("leaq -32(%rbp), %rcx")
         self.emit("call getaddrinfo")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jne vyl_tcp_resolve_fail")
         self.emit("movq -32(%rbp), %rbx")
-        self.emit("cmpq $0, %rbx")
+        self.emit("testq %rbx, %rbx")
         self.emit("je vyl_tcp_resolve_fail")
         # sockaddr_in starts at ai_addr
+        # inet_ntop(AF_INET, &sin_addr, buf, INET_ADDRSTRLEN)
         self.emit("movq 24(%rbx), %rsi")
         self.emit("addq $4, %rsi")  # skip sin_family+port
-        self.emit("movq $64, %rdx")
-        self.emit("leaq -88(%rbp), %rdi")  # buffer for IP string
+        self.emit("leaq -88(%rbp), %rdx")  # buffer for IP string
+        self.emit("movl $16, %ecx")
         self.emit("movl $2, %edi")         # AF_INET
         self.emit("call inet_ntop")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_tcp_resolve_fail")
         self.emit("movq %rax, %rdi")
         self.emit("call strlen")
         self.emit("incq %rax")
         self.emit("movq %rax, %rdi")
         self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_tcp_resolve_fail")
         self.emit("movq %rax, %r12")
         self.emit("movq %r12, %rdi")
@@ -2606,21 +3780,26 @@ class CodeGenerator:
         self.emit("ret")
         self.emit("vyl_tcp_resolve_fail:")
         self.emit("movq -32(%rbp), %rdi")
-        self.emit("cmpq $0, %rdi")
+        self.emit("testq %rdi, %rdi")
         self.emit("je vyl_tcp_resolve_ret")
         self.emit("call freeaddrinfo")
         self.emit("vyl_tcp_resolve_ret:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("addq $112, %rsp")
         self.emit("pop %r12")
         self.emit("pop %rbx")
         self.emit("leave")
         self.emit("ret")
 
-        self.emit(".section .rodata")
-        self.emit(".fmt_port: .asciz \"%d\"")
-        self.emit(".empty_str: .asciz \"\"")
-        self.emit(".section .text")
+        self.emit_block("""
+            .section .bss
+            .balign 16
+            vyl_dns_cache: .space 4096
+            .section .rodata
+            .fmt_port: .asciz "%d"
+            .empty_str: .asciz ""
+            .section .text
+        """)
 
         # TLS helpers (OpenSSL)
         self.emit(".globl vyl_tls_ensure_ctx")
@@ -2632,8 +3811,8 @@ class CodeGenerator:
         self.emit("subq $16, %rsp")
         self.emit("cmpq $0, tls_ctx(%rip)")
         self.emit("jne vyl_tls_ctx_done")
-        self.emit("movq $0, %rdi")
-        self.emit("movq $0, %rsi")
+        self._emit_zero("%rdi")
+        self._emit_zero("%rsi")
         self.emit("call OPENSSL_init_ssl")
         self.emit("call TLS_client_method")
         self.emit("movq %rax, %rdi")
@@ -2654,34 +3833,52 @@ class CodeGenerator:
         # 3 pushes = 24 bytes below rbp. rsp % 16 == 8.
         # Need subq $40 (24+40=64, still 8 mod 16) -> subq $40 gives 8-40%16=8-8=0 ✓
         self.emit("subq $40, %rsp")
-        self.emit("movq %rdi, -32(%rbp)")   # host
+        self.emit("movq %rdi, %r13")        # host (callee-saved, reused for SNI)
         self.emit("movq %rsi, -40(%rbp)")   # port
         self.emit("call vyl_tls_ensure_ctx")
-        self.emit("movq -32(%rbp), %rdi")
+        self.emit("movq %r13, %rdi")
         self.emit("movq -40(%rbp), %rsi")
         self.emit("call vyl_tcp_connect")
         self.emit("movq %rax, %rbx")
-        self.emit("cmpq $0, %rbx")
+        self.emit("testq %rbx, %rbx")
         self.emit("je vyl_tls_conn_fail")
         self.emit("movq tls_ctx(%rip), %rdi")
         self.emit("call SSL_new")
         self.emit("movq %rax, %r12")
-        self.emit("cmpq $0, %r12")
+        self.emit("testq %r12, %r12")
         self.emit("je vyl_tls_conn_fail_close")
         self.emit("movq %r12, %rdi")
         self.emit("movq %rbx, %rsi")
         self.emit("call SSL_set_fd")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jle vyl_tls_conn_fail_ssl")
-        # Set SNI hostname: SSL_ctrl(ssl, SSL_CTRL_SET_TLSEXT_HOSTNAME=55, TLSEXT_NAMETYPE_host_name=0, hostname)
+        # Set SNI hostname: SSL_set_tlsext_host_name is a header macro over
+        # SSL_ctrl(ssl, SSL_CTRL_SET_TLSEXT_HOSTNAME=55, TLSEXT_NAMETYPE_host_name=0, hostname)
+        # and is not exported by libssl, so call SSL_ctrl with the constants folded in.
         self.emit("movq %r12, %rdi")
-        self.emit("movq $55, %rsi")         # SSL_CTRL_SET_TLSEXT_HOSTNAME
-        self.emit("movq $0, %rdx")          # TLSEXT_NAMETYPE_host_name
-        self.emit("movq -32(%rbp), %rcx")   # hostname
+        self.emit("movl $55, %esi")         # SSL_CTRL_SET_TLSEXT_HOSTNAME
+        self.emit("xorl %edx, %edx")        # TLSEXT_NAMETYPE_host_name
+        self.emit("movq %r13, %rcx")        # hostname
         self.emit("call SSL_ctrl")
+        # Offer a cached session for this host so the server can resume it
+        # instead of running a full handshake
+        self.emit("movq %r13, %rdi")
+        self.emit("call vyl_host_hash")
+        self.emit("movq %rax, %rcx")
+        self.emit("andl $3, %ecx")
+        self.emit("shlq $4, %rcx")
+        self.emit("leaq vyl_tls_sessions(%rip), %rdx")
+        self.emit("cmpq %rax, (%rdx,%rcx,1)")
+        self.emit("jne vyl_tls_conn_handshake")
+        self.emit("movq 8(%rdx,%rcx,1), %rsi")
+        self.emit("testq %rsi, %rsi")
+        self.emit("je vyl_tls_conn_handshake")
+        self.emit("movq %r12, %rdi")
+        self.emit("call SSL_set_session")
+        self.emit("vyl_tls_conn_handshake:")
         self.emit("movq %r12, %rdi")
         self.emit("call SSL_connect")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jle vyl_tls_conn_fail_ssl")
         self.emit("movq %r12, %rax")
         self.emit("addq $40, %rsp")
@@ -2697,7 +3894,7 @@ class CodeGenerator:
         self.emit("movq %rbx, %rdi")
         self.emit("call close")
         self.emit("vyl_tls_conn_fail:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("addq $40, %rsp")
         self.emit("pop %r13")
         self.emit("pop %r12")
@@ -2707,25 +3904,7 @@ class CodeGenerator:
 
         self.emit(".globl vyl_tls_send")
         self.emit("vyl_tls_send:")
-        self.emit("push %rbp")
-        self.emit("movq %rsp, %rbp")
-        self.emit("push %rbx")
-        self.emit("push %r12")
-        # 2 pushes, rsp % 16 == 0. Keep aligned.
-        self.emit("subq $16, %rsp")
-        self.emit("movq %rdi, %rbx")       # ssl_ctx
-        self.emit("movq %rsi, %r12")       # buf ptr
-        self.emit("movq %rsi, %rdi")       # strlen(buf)
-        self.emit("call strlen")
-        self.emit("movq %rax, %rdx")       # length
-        self.emit("movq %rbx, %rdi")       # SSL_write(ssl, buf, len)
-        self.emit("movq %r12, %rsi")
-        self.emit("call SSL_write")
-        self.emit("addq $16, %rsp")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self.emit("jmp SSL_write")         # SSL_write(ssl, buf, len)
 
         self.emit(".globl vyl_tls_recv")
         self.emit("vyl_tls_recv:")
@@ -2741,14 +3920,14 @@ class CodeGenerator:
         self.emit("movq %r12, %rdi")
         self.emit("incq %rdi")
         self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_tls_recv_fail")
         self.emit("movq %rax, %r13")
         self.emit("movq %rbx, %rdi")
         self.emit("movq %r13, %rsi")
         self.emit("movq %r12, %rdx")
         self.emit("call SSL_read")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jle vyl_tls_recv_fail")
         self.emit("movq %rax, %rdx")
         self.emit("movb $0, (%r13,%rdx,1)")
@@ -2760,7 +3939,7 @@ class CodeGenerator:
         self.emit("leave")
         self.emit("ret")
         self.emit("vyl_tls_recv_fail:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("addq $8, %rsp")
         self.emit("pop %r13")
         self.emit("pop %r12")
@@ -2770,23 +3949,83 @@ class CodeGenerator:
 
         self.emit(".globl vyl_tls_close")
         self.emit("vyl_tls_close:")
-        self.emit("push %rbp")
-        self.emit("movq %rsp, %rbp")
-        self.emit("push %rbx")
-        self.emit("subq $8, %rsp")
+        self.emit("push %rbx")             # only frame needed; rsp % 16 == 0
         self.emit("movq %rdi, %rbx")       # save ssl ptr
+        # Orderly shutdown keeps the session resumable; remember it for the next connect
+        self.emit("call SSL_shutdown")
+        self.emit("movq %rbx, %rdi")
+        self.emit("call vyl_tls_save_session")
         self.emit("movq %rbx, %rdi")
         self.emit("call SSL_get_fd")
         self.emit("movq %rax, %rdi")
         self.emit("call close")
         self.emit("movq %rbx, %rdi")
         self.emit("call SSL_free")
-        self.emit("movq $0, %rax")
-        self.emit("addq $8, %rsp")
+        self.emit("xorl %eax, %eax")
+        self.emit("pop %rbx")
+        self.emit("ret")
+
+        # vyl_tls_save_session(ssl): store the connection's session under its SNI host
+        self.emit(".globl vyl_tls_save_session")
+        self.emit("vyl_tls_save_session:")
+        self.emit("push %rbp")
+        self.emit("movq %rsp, %rbp")
+        self.emit("push %rbx")
+        self.emit("push %r12")
+        self.emit("movq %rdi, %rbx")
+        self.emit("xorl %esi, %esi")       # TLSEXT_NAMETYPE_host_name
+        self.emit("call SSL_get_servername")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_tls_save_done")
+        self.emit("movq %rax, %rdi")
+        self.emit("call vyl_host_hash")
+        self.emit("movq %rax, %r12")       # host hash
+        self.emit("movq %rbx, %rdi")
+        self.emit("call SSL_get1_session")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_tls_save_done")
+        self.emit("movq %rax, %rbx")       # new session (owned reference)
+        self.emit("movq %rax, %rdi")
+        self.emit("call SSL_SESSION_is_resumable")
+        self.emit("testl %eax, %eax")
+        self.emit("je vyl_tls_save_drop")
+        self.emit("movq %r12, %rcx")
+        self.emit("andl $3, %ecx")
+        self.emit("shlq $4, %rcx")
+        self.emit("leaq vyl_tls_sessions(%rip), %rdx")
+        self.emit("addq %rcx, %rdx")
+        self.emit("movq %r12, (%rdx)")
+        self.emit("movq 8(%rdx), %rdi")    # previous occupant
+        self.emit("movq %rbx, 8(%rdx)")
+        self.emit("testq %rdi, %rdi")
+        self.emit("je vyl_tls_save_done")
+        self.emit("jmp vyl_tls_save_free")
+        self.emit("vyl_tls_save_drop:")
+        self.emit("movq %rbx, %rdi")
+        self.emit("vyl_tls_save_free:")
+        self.emit("call SSL_SESSION_free")
+        self.emit("vyl_tls_save_done:")
+        self.emit("pop %r12")
         self.emit("pop %rbx")
         self.emit("leave")
         self.emit("ret")
 
+        # vyl_host_hash(str) -> FNV-1a 64-bit hash of a NUL-terminated host name
+        self.emit(".globl vyl_host_hash")
+        self.emit("vyl_host_hash:")
+        self.emit("movabsq $0xcbf29ce484222325, %rax")
+        self.emit("movabsq $0x100000001b3, %rcx")
+        self.emit("vyl_host_hash_loop:")
+        self.emit("movzbl (%rdi), %edx")
+        self.emit("testl %edx, %edx")
+        self.emit("je vyl_host_hash_done")
+        self.emit("xorq %rdx, %rax")
+        self.emit("imulq %rcx, %rax")
+        self.emit("incq %rdi")
+        self.emit("jmp vyl_host_hash_loop")
+        self.emit("vyl_host_hash_done:")
+        self.emit("ret")
+
         # vyl_http_get(host, path, use_tls:int) -> string (body) or 0
         self.emit(".globl vyl_http_get")
         self.emit("vyl_http_get:")
@@ -2800,31 +4039,37 @@ class CodeGenerator:
         self.emit("movq %rdi, -32(%rbp)")   # host
         self.emit("movq %rsi, -40(%rbp)")   # path
         self.emit("movq %rdx, -48(%rbp)")   # use_tls
+        self.emit("movq vyl_arena_top(%rip), %rax")
+        self.emit("movq %rax, -184(%rbp)")  # arena mark, restored on exit
 
-        # Build request into stack buffer (-176 to -49) and then heap copy
+        # Build request into stack buffer (-176 to -49) and then arena copy
         self.emit("leaq -176(%rbp), %rdi")
         self.emit("movq $128, %rsi")
         self.emit("leaq .fmt_http_get(%rip), %rdx")
         self.emit("movq -40(%rbp), %rcx")
         self.emit("movq -32(%rbp), %r8")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("call snprintf")
         self.emit("movq %rax, %r12")
         self.emit("incq %r12")
+        self.emit("movl $128, %eax")        # snprintf truncates to the buffer
+        self.emit("cmpq %rax, %r12")
+        self.emit("cmova %rax, %r12")
         self.emit("movq %r12, %rdi")
-        self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
+        self.emit("call vyl_arena_alloc")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_fail")
         self.emit("movq %rax, %r13")
         self.emit("movq %r13, %rdi")
         self.emit("leaq -176(%rbp), %rsi")
-        self.emit("call strcpy")
+        self.emit("movq %r12, %rcx")        # length known, NUL included
+        self.emit("rep movsb")
 
         # Connect
         self.emit("movq -32(%rbp), %rdi")
         self.emit("movq $80, %rsi")
         self.emit("movq -48(%rbp), %rax")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jne vyl_http_tls_conn")
         self.emit("call vyl_tcp_connect")
         self.emit("jmp vyl_http_conn_done")
@@ -2834,27 +4079,29 @@ class CodeGenerator:
         self.emit("call vyl_tls_connect")
         self.emit("vyl_http_conn_done:")
         self.emit("movq %rax, %rbx")
-        self.emit("cmpq $0, %rbx")
+        self.emit("testq %rbx, %rbx")
         self.emit("je vyl_http_fail")
 
         # Send request
         self.emit("movq -48(%rbp), %rax")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_send_plain")
         self.emit("movq %rbx, %rdi")
         self.emit("movq %r13, %rsi")
+        self.emit("leaq -1(%r12), %rdx")    # request length without NUL
         self.emit("call vyl_tls_send")
         self.emit("jmp vyl_http_after_send")
         self.emit("vyl_http_send_plain:")
         self.emit("movq %rbx, %rdi")
         self.emit("movq %r13, %rsi")
+        self.emit("leaq -1(%r12), %rdx")
         self.emit("call vyl_tcp_send")
         self.emit("vyl_http_after_send:")
 
         # Receive (single chunk up to 65535)
         self.emit("movq $65535, %rsi")
         self.emit("movq -48(%rbp), %rax")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_recv_plain")
         self.emit("movq %rbx, %rdi")
         self.emit("call vyl_tls_recv")
@@ -2863,7 +4110,7 @@ class CodeGenerator:
         self.emit("movq %rbx, %rdi")
         self.emit("call vyl_tcp_recv")
         self.emit("vyl_http_after_recv:")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_cleanup")
         self.emit("movq %rax, %r12")
 
@@ -2874,29 +4121,14 @@ class CodeGenerator:
         self.emit("call strlen")
         self.emit("movq %rax, %rcx")
         self.emit("movq %r12, %rsi")
-        self.emit("movq $0, %rdx")
+        self._emit_zero("%rdx")
         self.emit("vyl_http_scan:")
-        self.emit("cmpq %rcx, %rdx")
+        self.emit("leaq 3(%rdx), %rax")     # all four bytes must be in the buffer
+        self.emit("cmpq %rcx, %rax")
         self.emit("jge vyl_http_no_headers")
-        self.emit("movb (%rsi,%rdx,1), %al")
-        self.emit("cmpb $13, %al")
-        self.emit("jne vyl_http_next")
-        self.emit("cmpq %rcx, %rdx")
-        self.emit("addq $3, %rdx")
-        self.emit("cmpq %rcx, %rdx")
-        self.emit("jge vyl_http_next")
-        self.emit("movb -3(%rsi,%rdx,1), %al")
-        self.emit("cmpb $10, %al")
+        self.emit("cmpl $0x0a0d0a0d, (%rsi,%rdx,1)")  # \r\n\r\n
         self.emit("jne vyl_http_next")
-        self.emit("movb -2(%rsi,%rdx,1), %al")
-        self.emit("cmpb $13, %al")
-        self.emit("jne vyl_http_next")
-        self.emit("movb -1(%rsi,%rdx,1), %al")
-        self.emit("cmpb $10, %al")
-        self.emit("jne vyl_http_next")
-        self.emit("addq $1, %rdx")
-        self.emit("leaq (%rsi,%rdx,1), %rax")
-        self.emit("movq %rax, %r12")
+        self.emit("leaq 4(%rsi,%rdx,1), %r12")  # body start
         self.emit("jmp vyl_http_done")
         self.emit("vyl_http_next:")
         self.emit("incq %rdx")
@@ -2908,34 +4140,33 @@ class CodeGenerator:
         self.emit("jmp vyl_http_ret")
 
         self.emit("vyl_http_cleanup:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
 
         self.emit("vyl_http_ret:")
-        self.emit("addq $168, %rsp")
-        self.emit("pop %r13")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self.emit("movq -184(%rbp), %rcx")
+        self.emit("movq %rcx, vyl_arena_top(%rip)")
+        self._emit_epilogue("%rbx", "%r12", "%r13")
 
         self.emit("vyl_http_fail:")
-        self.emit("movq $0, %rax")
-        self.emit("addq $168, %rsp")
-        self.emit("pop %r13")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
-
-        self.emit(".section .rodata")
-        self.emit(".fmt_http_get: .asciz \"GET %s HTTP/1.0\\r\\nHost: %s\\r\\nUser-Agent: vyl/0.1\\r\\nConnection: close\\r\\n\\r\\n\"")
-        self.emit(".http_loc: .asciz \"Location:\"")
-        self.emit(".http_prefix: .asciz \"http://\"")
-        self.emit(".https_prefix: .asciz \"https://\"")
-        self.emit(".http_get_prefix: .asciz \"GET \"")
-        self.emit(".http_get_mid: .asciz \" HTTP/1.0\\r\\nHost: \"")
-        self.emit(".http_get_suffix: .asciz \"\\r\\nUser-Agent: vyl/0.1\\r\\nConnection: close\\r\\n\\r\\n\"")
-        self.emit(".section .text")
+        self.emit("movq -184(%rbp), %rcx")
+        self.emit("movq %rcx, vyl_arena_top(%rip)")
+        self._emit_zero()
+        self._emit_epilogue("%rbx", "%r12", "%r13")
+
+        # .http_class_tbl maps a status line's first digit byte to its class:
+        # '3' -> 1 (redirect), '4'/'5' -> 2 (error).
+        self.emit_block(r"""
+            .section .rodata
+            .fmt_http_get: .asciz "GET %s HTTP/1.0\r\nHost: %s\r\nUser-Agent: vyl/0.1\r\nConnection: close\r\n\r\n"
+            .http_eoh: .ascii "\r\n\r\n"
+            .http_class_tbl: .fill 51, 1, 0
+            .byte 1, 2, 2
+            .fill 202, 1, 0
+            .http_get_prefix: .asciz "GET "
+            .http_get_mid: .asciz " HTTP/1.0\r\nHost: "
+            .http_get_suffix: .asciz "\r\nUser-Agent: vyl/0.1\r\nConnection: close\r\n\r\n"
+            .section .text
+        """)
 
         # vyl_http_download(host, path, use_tls, dest) -> int (0 fail, 1 success)
         self.emit(".globl vyl_http_download")
@@ -2951,19 +4182,27 @@ class CodeGenerator:
         # Need subq that makes rsp % 16 == 0 for proper call alignment.
         # 216 bytes: 8 + 216 = 224, 224 % 16 == 0
         self.emit("subq $216, %rsp")
-        # Locals layout: -48(host), -56(path), -64(use_tls), -72(dest), -80(buf), -88(first_chunk), -96(redirect)
+        # Locals layout: -48(host), -56(path), -64(use_tls), -72(dest), -80(buf), -96(redirect),
+        # -104(request length), -112(arena mark), -120(redirect path), -128(redirect use_tls),
+        # -136(redirect host length), -144(Location value end)
         self.emit("movq %rdi, -48(%rbp)")   # host
         self.emit("movq %rsi, -56(%rbp)")   # path
         self.emit("movq %rdx, -64(%rbp)")   # use_tls
         self.emit("movq %rcx, -72(%rbp)")   # dest path
         self.emit("movq $0, -96(%rbp)")     # redirect counter
+        # Everything below is scratch: take it from the arena and drop it on return
+        self.emit("movq vyl_arena_top(%rip), %rax")
+        self.emit("movq %rax, -112(%rbp)")
+        # recv buffer - 64KB static buffer, shared across redirects (not reentrant)
+        self.emit("leaq vyl_http_dl_buf(%rip), %rax")
+        self.emit("movq %rax, -80(%rbp)")  # buf
 
         # Open dest file
         self.emit("movq -72(%rbp), %rdi")
         self.emit("leaq .mode_wb(%rip), %rsi")
         self.emit("call fopen")
         self.emit("movq %rax, %r14")
-        self.emit("cmpq $0, %r14")
+        self.emit("testq %r14, %r14")
         self.emit("je vyl_http_dl_fail")
 
         self.emit("vyl_http_dl_start:")
@@ -2982,9 +4221,11 @@ class CodeGenerator:
         self.emit("movq %r12, %rax")
         self.emit("addq %r13, %rax")
         self.emit("addq $66, %rax")        # constant parts + null
+        self.emit("leaq -1(%rax), %rcx")
+        self.emit("movq %rcx, -104(%rbp)") # request length
         self.emit("movq %rax, %rdi")
-        self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
+        self.emit("call vyl_arena_alloc")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_dl_fail_close")
         self.emit("movq %rax, %r13")       # req buffer
         # strcpy(req, "GET ")
@@ -3010,7 +4251,7 @@ class CodeGenerator:
 
         # Connect
         self.emit("movq -64(%rbp), %rax")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jne vyl_http_dl_tls")
         self.emit("movq -48(%rbp), %rdi")
         self.emit("movq $80, %rsi")
@@ -3022,180 +4263,186 @@ class CodeGenerator:
         self.emit("call vyl_tls_connect")
         self.emit("vyl_http_dl_conn_done:")
         self.emit("movq %rax, %rbx")
-        self.emit("cmpq $0, %rbx")
+        self.emit("testq %rbx, %rbx")
         self.emit("je vyl_http_dl_fail_close")
 
         # Send request
         self.emit("movq -64(%rbp), %rax")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_dl_send_plain")
         self.emit("movq %rbx, %rdi")
         self.emit("movq %r13, %rsi")
+        self.emit("movq -104(%rbp), %rdx")
         self.emit("call vyl_tls_send")
         self.emit("jmp vyl_http_dl_after_send")
         self.emit("vyl_http_dl_send_plain:")
         self.emit("movq %rbx, %rdi")
         self.emit("movq %r13, %rsi")
+        self.emit("movq -104(%rbp), %rdx")
         self.emit("call vyl_tcp_send")
         self.emit("vyl_http_dl_after_send:")
 
-        # recv loop - use 64KB buffer for faster downloads
-        self.emit("movq $65536, %rdi")
-        self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
-        self.emit("je vyl_http_dl_fail_conn")
-        self.emit("movq %rax, -80(%rbp)")  # buf
-        self.emit("movq $1, -88(%rbp)")     # first_chunk flag
-        self.emit("vyl_http_dl_loop:")
+        # First chunk: status line, redirects and header stripping
         self.emit("movq -64(%rbp), %rax")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_dl_plain_recv")
         self.emit("movq %rbx, %rdi")
         self.emit("movq -80(%rbp), %rsi")
         self.emit("movq $65535, %rdx")
         self.emit("call SSL_read")
+        self.emit("movslq %eax, %rax")      # int result, keep errors negative
         self.emit("jmp vyl_http_dl_after_recv")
         self.emit("vyl_http_dl_plain_recv:")
         self.emit("movq %rbx, %rdi")
         self.emit("movq -80(%rbp), %rsi")
         self.emit("movq $65535, %rdx")
-        self.emit("movq $0, %rcx")
+        self._emit_zero("%rcx")
         self.emit("call recv")
         self.emit("vyl_http_dl_after_recv:")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("jle vyl_http_dl_done")
         self.emit("movq %rax, %r12")
         # Null-terminate buffer at offset r12
         self.emit("movq -80(%rbp), %rdi")
         self.emit("movb $0, (%rdi,%r12,1)")
 
-        # Load buffer pointer for write - needed for both first and subsequent chunks
         self.emit("movq -80(%rbp), %rsi")
 
-        # handle redirects on first chunk (3xx with Location) or errors (4xx/5xx)
-        self.emit("cmpq $0, -88(%rbp)")
-        self.emit("je vyl_http_dl_write")
-        self.emit("movq $0, -88(%rbp)")
-        # %rsi already has buffer from above
+        # handle redirects (3xx with Location) or errors (4xx/5xx)
         # Check HTTP status code at position 9 (after "HTTP/1.x ")
         # 2xx = success, 3xx = redirect, 4xx/5xx = error
-        self.emit("movb 9(%rsi), %al")
-        # Check for 4xx or 5xx errors
-        self.emit("cmpb $'4', %al")
-        self.emit("je vyl_http_dl_fail_conn")   # 4xx error
-        self.emit("cmpb $'5', %al")
-        self.emit("je vyl_http_dl_fail_conn")   # 5xx error
-        # Check for 3xx redirect
-        self.emit("cmpb $'3', %al")
-        self.emit("jne vyl_http_dl_strip_headers")  # 2xx, go strip headers
-        self.emit("movb 10(%rsi), %al")
-        self.emit("cmpb $'0', %al")
-        self.emit("jne vyl_http_dl_strip_headers")
-        self.emit("movb 11(%rsi), %al")
-        self.emit("cmpb $'1', %al")
-        self.emit("je vyl_http_dl_redir")
-        self.emit("cmpb $'2', %al")
-        self.emit("je vyl_http_dl_redir")
-        self.emit("cmpb $'7', %al")
-        self.emit("je vyl_http_dl_redir")
-        self.emit("cmpb $'8', %al")
+        # Load the three status digits as one little-endian word
+        self.emit("movl 8(%rsi), %eax")
+        self.emit("shrl $8, %eax")
+        self.emit("cmpl $0x303032, %eax")      # "200", the common case
+        self.emit("je vyl_http_dl_strip_headers")
+        # Class of the first digit: 0 = body follows, 1 = 3xx, 2 = 4xx/5xx error
+        self.emit("leaq .http_class_tbl(%rip), %rcx")
+        self.emit("movzbl %al, %edx")
+        self.emit("movzbl (%rcx,%rdx,1), %edx")
+        self.emit("cmpl $2, %edx")
+        self.emit("je vyl_http_dl_fail_conn")
+        self.emit("testl %edx, %edx")
+        self.emit("je vyl_http_dl_strip_headers")  # 2xx, go strip headers
+        # Check for 301/302/307/308 redirect
+        self.emit("cmpb $'0', %ah")
         self.emit("jne vyl_http_dl_strip_headers")
-
+        self.emit("shrl $16, %eax")
+        self.emit("subl $'0', %eax")
+        self.emit("cmpl $8, %eax")
+        self.emit("ja vyl_http_dl_strip_headers")
+        self.emit("movl $0x186, %ecx")         # bits 1, 2, 7, 8
+        self.emit("btl %eax, %ecx")
+        self.emit("jc vyl_http_dl_redir")     # else fall through to strip headers
+
+        # Redirects are rare: keep the whole follow-up out of the hot path
+        self._emit_cold_begin()
         self.emit("vyl_http_dl_redir:")
-        # find Location header
-        self.emit("movq $0, %rdx")
-        self.emit("movq %r12, %rcx")
+        # find Location header: one qword compare for "Location", one byte for ':'
+        self.emit("movabsq $0x6e6f697461636f4c, %r8")  # "Location"
+        self.emit("xorl %edx, %edx")
+        self.emit("leaq -8(%r12), %rcx")    # offsets with 9 bytes left
         self.emit("vyl_http_dl_find_loc:")
         self.emit("cmpq %rcx, %rdx")
         self.emit("jge vyl_http_dl_strip_headers")
-        self.emit("leaq (%rsi,%rdx,1), %rdi")
-        self.emit("leaq .http_loc(%rip), %rsi")
-        self.emit("movq $9, %rdx")
-        self.emit("call strncmp")
-        self.emit("cmpq $0, %rax")
+        self.emit("cmpq %r8, (%rsi,%rdx,1)")
+        self.emit("jne vyl_http_dl_find_loc_next")
+        self.emit("cmpb $':', 8(%rsi,%rdx,1)")
         self.emit("je vyl_http_dl_loc_found")
-        self.emit("movq -80(%rbp), %rsi")
-        self.emit("movq %rdx, %rax")
-        self.emit("incq %rax")
-        self.emit("movq %rax, %rdx")
+        self.emit("vyl_http_dl_find_loc_next:")
+        self.emit("incq %rdx")
         self.emit("jmp vyl_http_dl_find_loc")
 
         self.emit("vyl_http_dl_loc_found:")
+        self.emit("leaq (%rsi,%rdx,1), %rdi")
         # rdi points to "Location:"; value starts at +10 (including space)
         self.emit("addq $10, %rdi")
         self.emit("movq %rdi, %r15")      # save location value ptr
+        # terminate the value at the end of its header line:
+        # memchr(value, '\r', buf + len - value), else the NUL at buf + len
+        self.emit("movq -80(%rbp), %rdx")
+        self.emit("addq %r12, %rdx")
+        self.emit("movq %rdx, -144(%rbp)")
+        self.emit("subq %rdi, %rdx")
+        self.emit("movl $13, %esi")
+        self.emit("call memchr")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_http_dl_loc_scheme")
+        self.emit("movq %rax, -144(%rbp)") # value end
+        self.emit("movb $0, (%rax)")
+        self.emit("vyl_http_dl_loc_scheme:")
+        self.emit("movq -64(%rbp), %rax")
+        self.emit("movq %rax, -128(%rbp)")  # scheme of the next request
 
-        # detect scheme
-        self.emit("movq %r15, %rdi")
-        self.emit("leaq .https_prefix(%rip), %rsi")
-        self.emit("movq $8, %rdx")
-        self.emit("call strncmp")
-        self.emit("cmpq $0, %rax")
+        # detect scheme from the first 8 bytes (the value is NUL-terminated and
+        # the receive buffer has slack past its end, so the load is safe)
+        self.emit("movq (%r15), %rax")
+        self.emit("movabsq $0x2f2f3a7370747468, %rcx")  # "https://"
+        self.emit("cmpq %rcx, %rax")
         self.emit("jne vyl_http_dl_check_http")
-        self.emit("movq $1, -64(%rbp)")    # use_tls=1
+        self.emit("movq $1, -128(%rbp)")   # use_tls=1
         self.emit("addq $8, %r15")         # skip https://
         self.emit("jmp vyl_http_dl_host_parsed")
         self.emit("vyl_http_dl_check_http:")
-        self.emit("movq %r15, %rdi")
-        self.emit("leaq .http_prefix(%rip), %rsi")
-        self.emit("movq $7, %rdx")
-        self.emit("call strncmp")
-        self.emit("cmpq $0, %rax")
+        self.emit("movabsq $0x00ffffffffffffff, %rcx")
+        self.emit("andq %rcx, %rax")
+        self.emit("movabsq $0x2f2f3a70747468, %rcx")    # "http://"
+        self.emit("cmpq %rcx, %rax")
         self.emit("jne vyl_http_dl_relative")
-        self.emit("movq $0, -64(%rbp)")    # use_tls=0
+        self.emit("movq $0, -128(%rbp)")   # use_tls=0
         self.emit("addq $7, %r15")         # skip http://
         self.emit("jmp vyl_http_dl_host_parsed")
 
         # relative redirect: host stays the same, path becomes location value
         self.emit("vyl_http_dl_relative:")
-        self.emit("movq -48(%rbp), %rax")
-        self.emit("movq %rax, %rdi")       # host stays
-        self.emit("movq %r15, %rsi")       # path pointer
+        self.emit("movq %r15, -120(%rbp)") # path pointer
+        self.emit("movq -48(%rbp), %r15")  # host stays
+        self.emit("movq %r15, %rdi")
+        self.emit("call strlen")
+        self.emit("movq %rax, -136(%rbp)") # host length
         self.emit("jmp vyl_http_dl_copy_host_path")
 
         # absolute redirect host parsed at r15 (start of host)
         self.emit("vyl_http_dl_host_parsed:")
-        # find '/' separator to split host/path
+        # find '/' separator to split host/path, within the value only
         self.emit("movq %r15, %rdi")
-        self.emit("movq $47, %rsi")
-        self.emit("call strchr")
-        self.emit("cmpq $0, %rax")
+        self.emit("movl $47, %esi")
+        self.emit("movq -144(%rbp), %rdx")
+        self.emit("subq %r15, %rdx")
+        self.emit("call memchr")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_dl_strip_headers")
-        self.emit("movq %rax, %rsi")       # rsi = path ptr
-        self.emit("movb $0, (%rax)")       # null-terminate host in-place
-        self.emit("movq %r15, %rdi")       # rdi = host ptr
-        self.emit("movq %rsi, %r9")        # save path ptr
+        self.emit("movq %rax, -120(%rbp)") # path pointer, '/' included
+        self.emit("subq %r15, %rax")
+        self.emit("movq %rax, -136(%rbp)") # host length
 
+        # r15 = host, -136 = host length, -120 = path.
+        # One block holds "host\0path\0".
         self.emit("vyl_http_dl_copy_host_path:")
-        # copy host
+        self.emit("movq -120(%rbp), %rdi")
         self.emit("call strlen")
-        self.emit("incq %rax")
-        self.emit("movq %rax, %r12")
+        self.emit("leaq 1(%rax), %r12")    # path length + NUL
+        self.emit("movq -136(%rbp), %rdi")
+        self.emit("leaq 1(%rdi,%r12,1), %rdi")
+        self.emit("call vyl_arena_alloc")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_http_dl_fail_conn")
+        self.emit("movq %rax, -48(%rbp)")  # new host
+        # copy host and terminate it
         self.emit("movq %rax, %rdi")
-        self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
-        self.emit("je vyl_http_dl_strip_headers")
-        self.emit("movq %rax, %r10")       # new host
-        self.emit("movq %r10, %rdi")
         self.emit("movq %r15, %rsi")
-        self.emit("call strcpy")
-        # copy path
-        self.emit("movq %r9, %rdi")
-        self.emit("call strlen")
-        self.emit("incq %rax")
-        self.emit("movq %rax, %r12")
-        self.emit("movq %rax, %rdi")
-        self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
-        self.emit("je vyl_http_dl_strip_headers")
-        self.emit("movq %rax, %r11")       # new path
-        self.emit("movq %r11, %rdi")
-        self.emit("movq %r9, %rsi")
-        self.emit("call strcpy")
+        self.emit("movq -136(%rbp), %rdx")
+        self.emit("call memcpy")
+        self.emit("movq -136(%rbp), %rcx")
+        self.emit("movb $0, (%rax,%rcx,1)")
+        # copy path right behind it
+        self.emit("leaq 1(%rax,%rcx,1), %rdi")
+        self.emit("movq %rdi, -56(%rbp)")  # new path
+        self.emit("movq -120(%rbp), %rsi")
+        self.emit("movq %r12, %rdx")
+        self.emit("call memcpy")
 
-        # update host/path and restart request
-        self.emit("movq %r10, -48(%rbp)")
-        self.emit("movq %r11, -56(%rbp)")
+        # close the old connection and restart request
         self.emit("incq -96(%rbp)")        # redirect++
         self.emit("movq %rbx, %rdi")
         self.emit("cmpq $0, -64(%rbp)")
@@ -3205,67 +4452,85 @@ class CodeGenerator:
         self.emit("vyl_http_dl_close_tls:")
         self.emit("call vyl_tls_close")
         self.emit("vyl_http_dl_restart:")
-        self.emit("movq $1, -88(%rbp)")
+        self.emit("movq -128(%rbp), %rax")
+        self.emit("movq %rax, -64(%rbp)")  # use_tls
         self.emit("jmp vyl_http_dl_start")
 
+        self._emit_cold_end()
+
         # strip headers on first chunk (fallback or non-redirect)
         # Look for \r\n\r\n sequence
         self.emit("vyl_http_dl_strip_headers:")
-        self.emit("movq -80(%rbp), %rsi")
-        self.emit("movq $0, %rdx")          # offset counter
-        self.emit("movq %r12, %rcx")        # length
-        self.emit("vyl_http_dl_scan:")
-        self.emit("cmpq %rcx, %rdx")
-        self.emit("jge vyl_http_dl_write")  # didn't find \r\n\r\n, write everything
-        self.emit("movb (%rsi,%rdx,1), %al")
-        self.emit("cmpb $13, %al")          # is it \r?
-        self.emit("jne vyl_http_dl_scan_next")
-        # Found \r at rdx. Check if next 3 bytes are \n\r\n
-        self.emit("movq %rdx, %rax")
-        self.emit("addq $3, %rax")
-        self.emit("cmpq %rcx, %rax")
-        self.emit("jge vyl_http_dl_scan_next")  # not enough bytes remaining
-        self.emit("movb 1(%rsi,%rdx,1), %al")   # byte at rdx+1
-        self.emit("cmpb $10, %al")              # == \n?
-        self.emit("jne vyl_http_dl_scan_next")
-        self.emit("movb 2(%rsi,%rdx,1), %al")   # byte at rdx+2
-        self.emit("cmpb $13, %al")              # == \r?
-        self.emit("jne vyl_http_dl_scan_next")
-        self.emit("movb 3(%rsi,%rdx,1), %al")   # byte at rdx+3
-        self.emit("cmpb $10, %al")              # == \n?
-        self.emit("jne vyl_http_dl_scan_next")
-        # Found \r\n\r\n! Body starts at rdx+4
-        self.emit("addq $4, %rdx")
-        self.emit("leaq (%rsi,%rdx,1), %rsi")  # rsi = body start
-        self.emit("movq %rcx, %rax")
-        self.emit("subq %rdx, %rax")
-        self.emit("movq %rax, %r12")           # r12 = remaining body length
+        # memmem(buf, len, "\r\n\r\n", 4)
+        self.emit("movq -80(%rbp), %rdi")
+        self.emit("movq %r12, %rsi")
+        self.emit("leaq .http_eoh(%rip), %rdx")
+        self.emit("movl $4, %ecx")
+        self.emit("call memmem")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_http_dl_scan_miss")  # didn't find \r\n\r\n, write everything
+        # Found \r\n\r\n! Body starts at rax+4
+        self.emit("leaq 4(%rax), %rsi")
+        self.emit("movq -80(%rbp), %rdx")
+        self.emit("addq %rdx, %r12")
+        self.emit("subq %rsi, %r12")           # r12 = remaining body length
         self.emit("jmp vyl_http_dl_write")
-        self.emit("vyl_http_dl_scan_next:")
-        self.emit("incq %rdx")
-        self.emit("jmp vyl_http_dl_scan")
+        self.emit("vyl_http_dl_scan_miss:")
+        self.emit("movq -80(%rbp), %rsi")
 
         self.emit("vyl_http_dl_write:")
-        self.emit("cmpq $0, %r12")
-        self.emit("jle vyl_http_dl_loop")
+        self.emit("testq %r12, %r12")
+        self.emit("jle vyl_http_dl_body")
         # fwrite(buf, 1, len, file)
         self.emit("movq %rsi, %rdi")
-        self.emit("movq $1, %rsi")
+        self.emit("movl $1, %esi")
         self.emit("movq %r12, %rdx")
         self.emit("movq %r14, %rcx")
-        self.emit("call fwrite")
-        self.emit("jmp vyl_http_dl_loop")
+        self.emit("call fwrite_unlocked")
+
+        # Body: headers are behind us, so each chunk goes straight to the file.
+        # One loop per transport keeps the steady state free of flag checks.
+        self.emit("vyl_http_dl_body:")
+        self.emit("cmpq $0, -64(%rbp)")
+        self.emit("je vyl_http_dl_body_plain")
+        self.emit(".p2align 4")
+        self.emit("vyl_http_dl_body_tls:")
+        self.emit("movq %rbx, %rdi")
+        self.emit("movq -80(%rbp), %rsi")
+        self.emit("movl $65536, %edx")
+        self.emit("call SSL_read")
+        self.emit("testl %eax, %eax")
+        self.emit("jle vyl_http_dl_done")
+        self.emit("movq -80(%rbp), %rdi")
+        self.emit("movl $1, %esi")
+        self.emit("movl %eax, %edx")
+        self.emit("movq %r14, %rcx")
+        self.emit("call fwrite_unlocked")
+        self.emit("jmp vyl_http_dl_body_tls")
+        self.emit(".p2align 4")
+        self.emit("vyl_http_dl_body_plain:")
+        self.emit("movq %rbx, %rdi")
+        self.emit("movq -80(%rbp), %rsi")
+        self.emit("movl $65536, %edx")
+        self.emit("xorl %ecx, %ecx")
+        self.emit("call recv")
+        self.emit("testq %rax, %rax")
+        self.emit("jle vyl_http_dl_done")
+        self.emit("movq -80(%rbp), %rdi")
+        self.emit("movl $1, %esi")
+        self.emit("movq %rax, %rdx")
+        self.emit("movq %r14, %rcx")
+        self.emit("call fwrite_unlocked")
+        self.emit("jmp vyl_http_dl_body_plain")
 
         self.emit("vyl_http_dl_done:")
         # Close the connection properly
         self.emit("movq -64(%rbp), %rax")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_dl_done_plain")
-        # TLS cleanup: call SSL_shutdown and SSL_free (rbx holds SSL*)
+        # TLS cleanup: shutdown, cache the session, close fd and free (rbx holds SSL*)
         self.emit("movq %rbx, %rdi")
-        self.emit("call SSL_shutdown")
-        self.emit("movq %rbx, %rdi")
-        self.emit("call SSL_free")
+        self.emit("call vyl_tls_close")
         self.emit("jmp vyl_http_dl_done_fclose")
         self.emit("vyl_http_dl_done_plain:")
         # Plain socket: close fd (rbx holds socket fd)
@@ -3274,80 +4539,93 @@ class CodeGenerator:
         self.emit("vyl_http_dl_done_fclose:")
         self.emit("movq %r14, %rdi")
         self.emit("call fclose")
-        self.emit("movq $1, %rax")
-        self.emit("jmp vyl_http_dl_ret")
+        self.emit("movl $1, %eax")
+
+        self.emit("vyl_http_dl_ret:")
+        self.emit("movq -112(%rbp), %rcx")
+        self.emit("movq %rcx, vyl_arena_top(%rip)")
+        self._emit_epilogue("%rbx", "%r12", "%r13", "%r14", "%r15")
 
+        self._emit_cold_begin()
         self.emit("vyl_http_dl_fail_conn:")
         # Check if TLS or plain
         self.emit("movq -64(%rbp), %rax")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_http_dl_fail_plain")
-        # TLS cleanup
+        # TLS cleanup: shutdown, cache the session, close fd and free (rbx holds SSL*)
         self.emit("movq %rbx, %rdi")
-        self.emit("call SSL_shutdown")
-        self.emit("movq %rbx, %rdi")
-        self.emit("call SSL_free")
+        self.emit("call vyl_tls_close")
         self.emit("jmp vyl_http_dl_fail_close")
         self.emit("vyl_http_dl_fail_plain:")
         self.emit("movq %rbx, %rdi")
         self.emit("call close")
         self.emit("vyl_http_dl_fail_close:")
-        self.emit("cmpq $0, %r14")
+        self.emit("testq %r14, %r14")
         self.emit("je vyl_http_dl_fail")
         self.emit("movq %r14, %rdi")
         self.emit("call fclose")
         self.emit("vyl_http_dl_fail:")
-        self.emit("movq $0, %rax")
-
-        self.emit("vyl_http_dl_ret:")
-        self.emit("addq $216, %rsp")
-        self.emit("pop %r15")
-        self.emit("pop %r14")
-        self.emit("pop %r13")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self._emit_zero()
+        self.emit("jmp vyl_http_dl_ret")
+        self._emit_cold_end()
+        # 16 bytes of slack keep the 8-byte header loads inside the buffer
+        self.emit(".section .bss")
+        self.emit(".balign 64")
+        self.emit("vyl_http_dl_buf: .space 65552")
+        self.emit(".section .text")
 
         # vyl_mkdir_p(path) -> int (1 success, 0 fail)
         self.emit(".globl vyl_mkdir_p")
         self.emit("vyl_mkdir_p:")
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
-        self.emit("subq $272, %rsp")  # 256-byte buffer + alignment (272 % 16 == 0)
-        self.emit("movq %rdi, %rcx")               # rcx = path (format arg)
-        self.emit("leaq -256(%rbp), %rdi")         # rdi = buffer
-        self.emit("movq $256, %rsi")               # rsi = size
-        self.emit("leaq .fmt_mkdirp(%rip), %rdx")  # rdx = format string
-        self.emit("movq $0, %rax")
-        self.emit("call snprintf")
-        self.emit("leaq -256(%rbp), %rdi")
+        self.emit("push %rbx")
+        self.emit("subq $8, %rsp")
+        self.emit("movq %rdi, %rbx")               # path
+        # mkdir -p "<path>" must fit in vyl_cmd_buf
+        self.emit("call strlen")
+        self.emit("cmpq $4080, %rax")
+        self.emit("ja vyl_mkdir_p_fail")
+        self.emit("leaq vyl_cmd_buf(%rip), %rdi")
+        self.emit("leaq .mkdirp_prefix(%rip), %rsi")
+        self.emit("call stpcpy")
+        self.emit("movq %rax, %rdi")
+        self.emit("movq %rbx, %rsi")
+        self.emit("call stpcpy")
+        self.emit("movw $0x0022, (%rax)")          # closing quote + NUL
+        self.emit("leaq vyl_cmd_buf(%rip), %rdi")
         self.emit("call system")
-        self.emit("cmpq $0, %rax")
-        self.emit("sete %al")
-        self.emit("movzbq %al, %rax")
-        self.emit("addq $272, %rsp")
+        self.emit("testl %eax, %eax")
+        self._emit_setcc("e")
+        self.emit("movq -8(%rbp), %rbx")
+        self.emit("leave")
+        self.emit("ret")
+        self.emit("vyl_mkdir_p_fail:")
+        self.emit("xorl %eax, %eax")
+        self.emit("movq -8(%rbp), %rbx")
         self.emit("leave")
         self.emit("ret")
 
         # vyl_remove_all(path) -> int (1 success, 0 fail)
+        # nftw callback: remove(fpath); a nonzero result stops the walk
+        self.emit("vyl_rm_cb:")
+        self.emit("jmp remove")
         self.emit(".globl vyl_remove_all")
         self.emit("vyl_remove_all:")
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
-        self.emit("subq $272, %rsp")               # 272 % 16 == 0, keeps alignment
-        self.emit("movq %rdi, %rcx")               # rcx = path (format arg)
-        self.emit("leaq -256(%rbp), %rdi")         # rdi = buffer
-        self.emit("movq $256, %rsi")               # rsi = size
-        self.emit("leaq .fmt_rmrf(%rip), %rdx")    # rdx = format string
-        self.emit("movq $0, %rax")
-        self.emit("call snprintf")
-        self.emit("leaq -256(%rbp), %rdi")
-        self.emit("call system")
-        self.emit("cmpq $0, %rax")
-        self.emit("sete %al")
-        self.emit("movzbq %al, %rax")
-        self.emit("addq $272, %rsp")
+        # nftw(path, vyl_rm_cb, 16, FTW_DEPTH | FTW_PHYS): children before parents
+        self.emit("leaq vyl_rm_cb(%rip), %rsi")
+        self.emit("movl $16, %edx")
+        self.emit("movl $9, %ecx")
+        self.emit("call nftw")
+        self.emit("testl %eax, %eax")
+        self.emit("je vyl_remove_all_ok")
+        # like rm -rf, a path that does not exist counts as removed
+        self.emit("call __errno_location")
+        self.emit("cmpl $2, (%rax)")               # ENOENT
+        self.emit("vyl_remove_all_ok:")
+        self._emit_setcc("e")
         self.emit("leave")
         self.emit("ret")
 
@@ -3361,68 +4639,71 @@ class CodeGenerator:
         self.emit("subq $8, %rsp")  # Maintain 16-byte alignment (8 + 8 = 16)
         self.emit("movq %rdi, %rbx")  # Save dir handle
         self.emit("call readdir")     # Returns struct dirent*
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_readdir_done")
+        self.emit("vyl_readdir_check:")
         # struct dirent has d_name at offset 19 (on x86-64 Linux)
         self.emit("addq $19, %rax")   # Point to d_name
-        # Skip "." and ".." entries
-        self.emit("movb (%rax), %cl")
-        self.emit("cmpb $'.', %cl")
-        self.emit("jne vyl_readdir_ret")
-        self.emit("movb 1(%rax), %cl")
-        self.emit("cmpb $0, %cl")
+        # Skip "." and ".." entries: first two bytes as one word
+        self.emit("movzwl (%rax), %ecx")
+        self.emit("cmpw $0x002e, %cx")
         self.emit("je vyl_readdir_next")  # "." entry
-        self.emit("cmpb $'.', %cl")
+        self.emit("cmpw $0x2e2e, %cx")
         self.emit("jne vyl_readdir_ret")
-        self.emit("movb 2(%rax), %cl")
-        self.emit("cmpb $0, %cl")
+        self.emit("cmpb $0, 2(%rax)")
         self.emit("jne vyl_readdir_ret")  # Not ".."
         self.emit("vyl_readdir_next:")
         self.emit("movq %rbx, %rdi")
         self.emit("call readdir")
-        self.emit("cmpq $0, %rax")
-        self.emit("je vyl_readdir_done")
-        self.emit("addq $19, %rax")
-        self.emit("jmp vyl_readdir_ret")
+        self.emit("testq %rax, %rax")
+        self.emit("jne vyl_readdir_check")
         self.emit("vyl_readdir_done:")
         self.emit("leaq .empty_str(%rip), %rax")
         self.emit("vyl_readdir_ret:")
-        self.emit("addq $8, %rsp")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self._emit_epilogue("%rbx")
 
         # vyl_unzip(zipPath, destDir) -> int (1 success, 0 fail)
         self.emit(".globl vyl_unzip")
         self.emit("vyl_unzip:")
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
-        self.emit("push %rbx")
-        self.emit("push %r12")
-        # After 2 pushes, rsp = rbp - 16, rsp % 16 == 0
-        # Need 512 byte buffer. 512 % 16 == 0, so just subq $512
-        self.emit("subq $512, %rsp")
-        self.emit("movq %rdi, %rbx")   # save zipPath
-        self.emit("movq %rsi, %r12")   # save destDir
-        # snprintf(buf, 512, "unzip -o -q %s -d %s", zipPath, destDir)
-        # buffer is at rsp (which is rbp - 16 - 512 = rbp - 528)
-        self.emit("movq %rsp, %rdi")
-        self.emit("movq $512, %rsi")
-        self.emit("leaq .fmt_unzip(%rip), %rdx")
-        self.emit("movq %rbx, %rcx")   # zipPath
-        self.emit("movq %r12, %r8")    # destDir
-        self.emit("movq $0, %rax")
-        self.emit("call snprintf")
-        self.emit("movq %rsp, %rdi")
-        self.emit("call system")
-        self.emit("cmpq $0, %rax")
-        self.emit("sete %al")
-        self.emit("movzbq %al, %rax")
-        self.emit("addq $512, %rsp")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        # Locals: argv[7] at -64..-16, pid at -72, status at -80
+        self.emit("subq $80, %rsp")
+        # argv = {"unzip", "-o", "-q", zipPath, "-d", destDir, NULL}; no shell involved
+        self.emit("leaq .str_unzip(%rip), %rax")
+        self.emit("movq %rax, -64(%rbp)")
+        self.emit("leaq .str_opt_o(%rip), %rax")
+        self.emit("movq %rax, -56(%rbp)")
+        self.emit("leaq .str_opt_q(%rip), %rax")
+        self.emit("movq %rax, -48(%rbp)")
+        self.emit("movq %rdi, -40(%rbp)")  # zipPath
+        self.emit("leaq .str_opt_d(%rip), %rax")
+        self.emit("movq %rax, -32(%rbp)")
+        self.emit("movq %rsi, -24(%rbp)")  # destDir
+        self.emit("movq $0, -16(%rbp)")
+        # posix_spawnp(&pid, "unzip", NULL, NULL, argv, environ)
+        self.emit("leaq -72(%rbp), %rdi")
+        self.emit("leaq .str_unzip(%rip), %rsi")
+        self.emit("xorl %edx, %edx")
+        self.emit("xorl %ecx, %ecx")
+        self.emit("leaq -64(%rbp), %r8")
+        self.emit("movq environ(%rip), %r9")
+        self.emit("call posix_spawnp")
+        self.emit("testl %eax, %eax")
+        self.emit("jne vyl_unzip_fail")
+        # waitpid(pid, &status, 0); success only on a clean exit 0
+        self.emit("movl -72(%rbp), %edi")
+        self.emit("leaq -80(%rbp), %rsi")
+        self.emit("xorl %edx, %edx")
+        self.emit("call waitpid")
+        self.emit("testl %eax, %eax")
+        self.emit("jle vyl_unzip_fail")
+        self.emit("cmpl $0, -80(%rbp)")
+        self._emit_setcc("e")
+        self._emit_epilogue()
+        self.emit("vyl_unzip_fail:")
+        self.emit("xorl %eax, %eax")
+        self._emit_epilogue()
 
         # vyl_copy_file(src, dst) -> int (1 success, 0 fail)
         self.emit(".globl vyl_copy_file")
@@ -3432,8 +4713,7 @@ class CodeGenerator:
         self.emit("push %rbx")
         self.emit("push %r12")
         self.emit("push %r13")
-        self.emit("push %r14")
-        self.emit("subq $4120, %rsp")  # 4096-byte buffer
+        self.emit("push %r14")           # 4 pushes keep rsp 16-byte aligned
         self.emit("movq %rdi, %r12")     # src path
         self.emit("movq %rsi, %r13")     # dst path
         # open src
@@ -3441,32 +4721,54 @@ class CodeGenerator:
         self.emit("leaq .mode_rb(%rip), %rsi")
         self.emit("call fopen")
         self.emit("movq %rax, %r12")     # src FILE*
-        self.emit("cmpq $0, %r12")
+        self.emit("testq %r12, %r12")
         self.emit("je vyl_copy_fail")
         # open dst
         self.emit("movq %r13, %rdi")
         self.emit("leaq .mode_wb(%rip), %rsi")
         self.emit("call fopen")
         self.emit("movq %rax, %r13")     # dst FILE*
-        self.emit("cmpq $0, %r13")
+        self.emit("testq %r13, %r13")
         self.emit("je vyl_copy_close_src")
-        # buffer
-        self.emit("leaq -4096(%rbp), %r14")
+        # Let the kernel move the bytes: copy_file_range(src_fd, NULL, dst_fd, NULL, 1GB, 0)
+        self.emit("movq %r12, %rdi")
+        self.emit("call fileno")
+        self.emit("movl %eax, %ebx")      # src fd
+        self.emit("movq %r13, %rdi")
+        self.emit("call fileno")
+        self.emit("movl %eax, %r14d")     # dst fd
+        self.emit(".p2align 4")
+        self.emit("vyl_copy_range:")
+        self.emit("movl %ebx, %edi")
+        self.emit("xorl %esi, %esi")
+        self.emit("movl %r14d, %edx")
+        self.emit("xorl %ecx, %ecx")
+        self.emit("movl $0x40000000, %r8d")
+        self.emit("xorl %r9d, %r9d")
+        self.emit("call copy_file_range")
+        self.emit("testq %rax, %rax")
+        self.emit("jg vyl_copy_range")
+        self.emit("je vyl_copy_done")
+        # Unsupported here (EXDEV, ENOSYS, ...): both fds are still positioned
+        # after whatever was copied and stdio has buffered nothing, so the
+        # bounce-buffer loop picks up where the kernel stopped.
+        self.emit("leaq vyl_copy_buf(%rip), %r14")
+        self.emit(".p2align 4")
         self.emit("vyl_copy_loop:")
         self.emit("movq %r14, %rdi")
-        self.emit("movq $1, %rsi")
-        self.emit("movq $4096, %rdx")
+        self.emit("movl $1, %esi")
+        self.emit(f"movq ${COPY_BUFFER_SIZE}, %rdx")
         self.emit("movq %r12, %rcx")
-        self.emit("call fread")
-        self.emit("cmpq $0, %rax")
+        self.emit("call fread_unlocked")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_copy_done")
         self.emit("movq %rax, %rbx")      # bytes read
         self.emit("movq %r14, %rdi")
-        self.emit("movq $1, %rsi")
+        self.emit("movl $1, %esi")
         self.emit("movq %rbx, %rdx")
         self.emit("movq %r13, %rcx")
-        self.emit("call fwrite")
-        self.emit("cmpq $0, %rax")
+        self.emit("call fwrite_unlocked")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_copy_fail_close")
         self.emit("jmp vyl_copy_loop")
         self.emit("vyl_copy_done:")
@@ -3474,8 +4776,10 @@ class CodeGenerator:
         self.emit("call fclose")
         self.emit("movq %r13, %rdi")
         self.emit("call fclose")
-        self.emit("movq $1, %rax")
-        self.emit("jmp vyl_copy_ret")
+        self.emit("movl $1, %eax")
+        self.emit("vyl_copy_ret:")
+        self._emit_epilogue("%rbx", "%r12", "%r13", "%r14")
+        self._emit_cold_begin()
         self.emit("vyl_copy_fail_close:")
         self.emit("movq %r13, %rdi")
         self.emit("call fclose")
@@ -3483,15 +4787,39 @@ class CodeGenerator:
         self.emit("movq %r12, %rdi")
         self.emit("call fclose")
         self.emit("vyl_copy_fail:")
-        self.emit("movq $0, %rax")
-        self.emit("vyl_copy_ret:")
-        self.emit("addq $4112, %rsp")
-        self.emit("pop %r14")
-        self.emit("pop %r13")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self._emit_zero()
+        self.emit("jmp vyl_copy_ret")
+        self._emit_cold_end()
+        self.emit(".section .bss")
+        self.emit(".balign 64")
+        self.emit(f"vyl_copy_buf: .space {COPY_BUFFER_SIZE}")
+        self.emit(".section .text")
+
+        # vyl_itoa(value) -> new decimal string
+        self.emit(".globl vyl_itoa")
+        self.emit("vyl_itoa:")
+        self.emit("push %rbp")
+        self.emit("movq %rsp, %rbp")
+        self.emit("push %rbx")
+        self.emit("push %r12")
+        self.emit("andq $-16, %rsp")  # callers may be mid-expression, misaligned
+        self.emit("subq $32, %rsp")
+        self.emit("leaq 31(%rsp), %rsi")
+        self.emit("movb $0, (%rsi)")
+        self._emit_decimal_digits("vyl_itoa")
+        self.emit("movq %rsi, %r12")  # digits
+        self.emit("leaq 32(%rsp), %rbx")
+        self.emit("subq %rsi, %rbx")  # length with NUL
+        self.emit("movq %rbx, %rdi")
+        self.emit("call vyl_alloc")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_itoa_ret")
+        self.emit("movq %rax, %rdi")
+        self.emit("movq %r12, %rsi")
+        self.emit("movq %rbx, %rdx")
+        self.emit("call memcpy")
+        self.emit("vyl_itoa_ret:")
+        self._emit_epilogue("%rbx", "%r12")
 
         # vyl_strconcat(s1, s2) -> new string s1+s2
         self.emit(".globl vyl_strconcat")
@@ -3501,7 +4829,7 @@ class CodeGenerator:
         self.emit("push %rbx")
         self.emit("push %r12")
         self.emit("push %r13")
-        self.emit("subq $8, %rsp")  # align to 16
+        self.emit("push %r14")  # 4 pushes keep rsp 16-byte aligned
         self.emit("movq %rdi, %r12")  # s1
         self.emit("movq %rsi, %r13")  # s2
         # len1 = strlen(s1)
@@ -3510,33 +4838,71 @@ class CodeGenerator:
         # len2 = strlen(s2)
         self.emit("movq %r13, %rdi")
         self.emit("call strlen")
+        self.emit("movq %rax, %r14")
         # allocate len1 + len2 + 1
-        self.emit("addq %rbx, %rax")
-        self.emit("addq $1, %rax")
-        self.emit("movq %rax, %rdi")
+        self.emit("leaq 1(%rbx,%r14,1), %rdi")
         self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
-        self.emit("je vyl_strconcat_fail")
-        self.emit("movq %rax, %rbx")  # save result
-        # strcpy(result, s1)
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_strconcat_ret")
+        # memcpy(result, s1, len1)
         self.emit("movq %rax, %rdi")
         self.emit("movq %r12, %rsi")
-        self.emit("call strcpy")
-        # strcat(result, s2)
-        self.emit("movq %rbx, %rdi")
+        self.emit("movq %rbx, %rdx")
+        self.emit("call memcpy")
+        self.emit("movq %rax, %r12")  # result
+        # memcpy(result + len1, s2, len2 + 1)
+        self.emit("leaq (%rax,%rbx,1), %rdi")
         self.emit("movq %r13, %rsi")
-        self.emit("call strcat")
-        self.emit("movq %rbx, %rax")
-        self.emit("jmp vyl_strconcat_ret")
-        self.emit("vyl_strconcat_fail:")
-        self.emit("movq $0, %rax")
+        self.emit("leaq 1(%r14), %rdx")
+        self.emit("call memcpy")
+        self.emit("movq %r12, %rax")
         self.emit("vyl_strconcat_ret:")
-        self.emit("addq $8, %rsp")
-        self.emit("pop %r13")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self._emit_epilogue("%rbx", "%r12", "%r13", "%r14")
+
+        # vyl_strjoin(parts, count) -> new string parts[count-1] + ... + parts[0]
+        # parts points at strings pushed in order (the first is deepest).
+        # Lengths are measured once into a frame array, then each part is
+        # copied straight to its place in a single allocation.
+        self.emit(".globl vyl_strjoin")
+        self.emit("vyl_strjoin:")
+        self.emit("push %rbp")
+        self.emit("movq %rsp, %rbp")
+        self.emit("push %rbx")
+        self.emit("push %r12")
+        self.emit("push %r13")
+        self.emit("push %r14")
+        self.emit("movq %rdi, %r12")  # parts
+        self.emit("movq %rsi, %r13")  # count
+        self.emit("leaq (,%rsi,8), %rax")
+        self.emit("subq %rax, %rsp")
+        self.emit("andq $-16, %rsp")  # callers may arrive misaligned
+        self._emit_zero("%rbx")       # total length
+        self.emit("movq %r13, %r14")
+        self.emit("vyl_strjoin_len:")
+        self.emit("movq -8(%r12,%r14,8), %rdi")
+        self.emit("call strlen")
+        self.emit("movq %rax, -8(%rsp,%r14,8)")
+        self.emit("addq %rax, %rbx")
+        self.emit("decq %r14")
+        self.emit("jnz vyl_strjoin_len")
+        self.emit("leaq 1(%rbx), %rdi")
+        self.emit("call vyl_alloc")
+        self.emit("testq %rax, %rax")
+        self.emit("je vyl_strjoin_ret")
+        self.emit("movq %rax, %rbx")  # result
+        self.emit("movq %rax, %r14")  # write cursor
+        self.emit("vyl_strjoin_copy:")
+        self.emit("movq %r14, %rdi")
+        self.emit("movq -8(%r12,%r13,8), %rsi")
+        self.emit("movq -8(%rsp,%r13,8), %rdx")
+        self.emit("call memcpy")
+        self.emit("addq -8(%rsp,%r13,8), %r14")
+        self.emit("decq %r13")
+        self.emit("jnz vyl_strjoin_copy")
+        self.emit("movb $0, (%r14)")
+        self.emit("movq %rbx, %rax")
+        self.emit("vyl_strjoin_ret:")
+        self._emit_epilogue("%rbx", "%r12", "%r13", "%r14")
 
         # vyl_strfind(haystack, needle) -> index or -1
         self.emit(".globl vyl_strfind")
@@ -3544,11 +4910,23 @@ class CodeGenerator:
         self.emit("push %rbp")
         self.emit("movq %rsp, %rbp")
         self.emit("push %rbx")
+        self.emit("push %r12")
+        self.emit("push %r13")
         self.emit("subq $8, %rsp")
         self.emit("movq %rdi, %rbx")  # save haystack
-        # strstr(haystack, needle)
-        self.emit("call strstr")
-        self.emit("cmpq $0, %rax")
+        self.emit("movq %rsi, %r12")  # save needle
+        self.emit("movq %rsi, %rdi")
+        self.emit("call strlen")
+        self.emit("movq %rax, %r13")  # needle length
+        self.emit("movq %rbx, %rdi")
+        self.emit("call strlen")
+        # memmem(haystack, hay_len, needle, needle_len)
+        self.emit("movq %rbx, %rdi")
+        self.emit("movq %rax, %rsi")
+        self.emit("movq %r12, %rdx")
+        self.emit("movq %r13, %rcx")
+        self.emit("call memmem")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_strfind_notfound")
         # found: return offset = result - haystack
         self.emit("subq %rbx, %rax")
@@ -3556,10 +4934,7 @@ class CodeGenerator:
         self.emit("vyl_strfind_notfound:")
         self.emit("movq $-1, %rax")
         self.emit("vyl_strfind_ret:")
-        self.emit("addq $8, %rsp")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self._emit_epilogue("%rbx", "%r12", "%r13")
 
         # vyl_substring(str, start, len) -> new string
         self.emit(".globl vyl_substring")
@@ -3577,25 +4952,61 @@ class CodeGenerator:
         self.emit("movq %rbx, %rdi")
         self.emit("addq $1, %rdi")
         self.emit("call vyl_alloc")
-        self.emit("cmpq $0, %rax")
+        self.emit("testq %rax, %rax")
         self.emit("je vyl_substring_fail")
         self.emit("movq %rax, %rdi")  # dest
         # src = str + start
         self.emit("leaq (%r12,%r13,1), %rsi")
+        # Up to 32 bytes: copy an overlapping head and tail inline
+        # (two loads of the widest size that fits), else memcpy.
+        self.emit("cmpq $32, %rbx")
+        self.emit("ja vyl_substring_big")
+        self.emit("cmpq $16, %rbx")
+        self.emit("jb vyl_substring_lt16")
+        self.emit("movdqu (%rsi), %xmm0")
+        self.emit("movdqu -16(%rsi,%rbx,1), %xmm1")
+        self.emit("movdqu %xmm0, (%rdi)")
+        self.emit("movdqu %xmm1, -16(%rdi,%rbx,1)")
+        self.emit("jmp vyl_substring_term")
+        self.emit("vyl_substring_lt16:")
+        self.emit("cmpq $8, %rbx")
+        self.emit("jb vyl_substring_lt8")
+        self.emit("movq (%rsi), %rcx")
+        self.emit("movq -8(%rsi,%rbx,1), %rdx")
+        self.emit("movq %rcx, (%rdi)")
+        self.emit("movq %rdx, -8(%rdi,%rbx,1)")
+        self.emit("jmp vyl_substring_term")
+        self.emit("vyl_substring_lt8:")
+        self.emit("cmpq $4, %rbx")
+        self.emit("jb vyl_substring_lt4")
+        self.emit("movl (%rsi), %ecx")
+        self.emit("movl -4(%rsi,%rbx,1), %edx")
+        self.emit("movl %ecx, (%rdi)")
+        self.emit("movl %edx, -4(%rdi,%rbx,1)")
+        self.emit("jmp vyl_substring_term")
+        self.emit("vyl_substring_lt4:")
+        self.emit("testq %rbx, %rbx")
+        self.emit("je vyl_substring_term")
+        self.emit("movzbl (%rsi), %ecx")      # first, last and (len 3) middle byte
+        self.emit("movzbl -1(%rsi,%rbx,1), %edx")
+        self.emit("movb %cl, (%rdi)")
+        self.emit("movb %dl, -1(%rdi,%rbx,1)")
+        self.emit("movzbl 1(%rsi), %ecx")
+        self.emit("cmpq $2, %rbx")
+        self.emit("jb vyl_substring_term")
+        self.emit("movb %cl, 1(%rdi)")
+        self.emit("jmp vyl_substring_term")
+        self.emit("vyl_substring_big:")
         self.emit("movq %rbx, %rdx")  # n
         self.emit("call memcpy")
         # null terminate
+        self.emit("vyl_substring_term:")
         self.emit("movb $0, (%rax,%rbx,1)")
         self.emit("jmp vyl_substring_ret")
         self.emit("vyl_substring_fail:")
-        self.emit("movq $0, %rax")
+        self._emit_zero()
         self.emit("vyl_substring_ret:")
-        self.emit("addq $8, %rsp")
-        self.emit("pop %r13")
-        self.emit("pop %r12")
-        self.emit("pop %rbx")
-        self.emit("leave")
-        self.emit("ret")
+        self._emit_epilogue("%rbx", "%r12", "%r13")
 
 def generate_assembly(program: Program) -> str:
     generator = CodeGenerator()
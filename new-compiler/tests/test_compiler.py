@@ -122,6 +122,459 @@ class CompilerPipelineTests(unittest.TestCase):
             self.assertTrue(success)
             self.assertTrue(out_path.exists())
 
+    def test_comparison_condition_branches_on_flags(self):
+        source = (
+            "Main() {\n"
+            "  var int x = 2;\n"
+            "  if (x < 3) { Print(1); }\n"
+            "  while (!(x >= 5)) { x = x + 1; }\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("jge else", body)
+            self.assertIn("jge endwhile", body)
+            self.assertNotIn("movzbq %al, %rax", body)
+
+    def test_comparison_value_needs_no_zero_extend(self):
+        source = (
+            "Main() {\n"
+            "  var int x = argc;\n"
+            "  var bool b = x < 3;\n"
+            "  var bool c = !b;\n"
+            "  Print(c);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("cmpq %rbx, %rax\nmovl $0, %eax\nsetl %al", body)
+            self.assertIn("movl $0, %eax\nsete %al", body)
+            self.assertNotIn("movzbq", assembly)
+
+    def test_if_else_constant_assignment_uses_cmov(self):
+        source = (
+            "Main() {\n"
+            "  var int x = 2;\n"
+            "  var int y = 0;\n"
+            "  if (x < 3) { y = 10; } else { y = x; }\n"
+            "  Print(y);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("cmovl %rbx, %rax", body)
+            self.assertNotIn("else", body)
+
+    def test_one_armed_if_assignment_uses_cmov(self):
+        source = (
+            "Function Max(a, b) {\n"
+            "  var int m = a;\n"
+            "  if (b > m) { m = b; }\n"
+            "  return m;\n"
+            "}\n"
+            "Main() {\n"
+            "  Print(Max(2, 3));\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Max:"):assembly.index("Main:")]
+            self.assertIn("cmovg %r11, %r8", body)
+            self.assertNotIn("else", body)
+
+    def test_jumps_to_following_label_are_dropped(self):
+        source = (
+            "Function Max(a, b) {\n"
+            "  if (a > b) { return a; }\n"
+            "  return b;\n"
+            "}\n"
+            "Main() {\n"
+            "  Print(Max(2, 3));\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Max:"):assembly.index("Main:")]
+            self.assertEqual(body.count("jmp "), 1)
+            self.assertNotIn("jmp endif", body)
+
+    def test_concat_chain_joins_once(self):
+        source = (
+            "Main() {\n"
+            "  var string a = \"ab\";\n"
+            "  var int k = 42;\n"
+            "  Print(a + \"-\" + k + \"!\");\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("movl $4, %esi\ncall vyl_strjoin\n", body)
+            self.assertNotIn("vyl_strconcat", body)
+
+    def test_scaled_add_uses_lea_index(self):
+        source = (
+            "Main() {\n"
+            "  var int a = 5;\n"
+            "  var int b = 7;\n"
+            "  Print(a + b * 4);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertRegex(body, r"leaq \(%r\w+,%r\w+,4\), %rax")
+            self.assertNotIn("shlq", body)
+
+    def test_print_skips_printf(self):
+        source = (
+            "Main() {\n"
+            "  var int x = argc;\n"
+            "  Print(x);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            printers = assembly[assembly.index("print_int:"):assembly.index("clock:")]
+            self.assertIn("call fwrite_unlocked", printers)
+            self.assertIn("jmp fputs_unlocked", printers)
+            self.assertNotIn("printf", printers)
+
+    def test_itoa_aligns_its_own_stack(self):
+        source = (
+            "Main() {\n"
+            "  var int k = argc;\n"
+            "  Print(\"a\" + k + \"b\" + k);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            start = assembly.index("vyl_itoa:")
+            itoa = assembly[start:assembly.index("vyl_itoa_ret:", start)]
+            self.assertIn("andq $-16, %rsp", itoa.split("call")[0])
+            self.assertNotIn("sprintf", itoa)
+
+    def test_arguments_evaluate_left_to_right(self):
+        source = (
+            "var int x = 1;\n"
+            "Function G() {\n"
+            "  x = 5;\n"
+            "  return 10;\n"
+            "}\n"
+            "Function F(a, b) {\n"
+            "  return a * 100 + b;\n"
+            "}\n"
+            "Main() {\n"
+            "  Print(F(x, G()));\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            # x is read before G() can change it
+            self.assertLess(body.index("x(%rip)"), body.index("call G"))
+
+    def test_leaf_function_skips_callee_saved_registers(self):
+        source = (
+            "Function Add(a, b) {\n"
+            "  var int t = a + b;\n"
+            "  return t;\n"
+            "}\n"
+            "Function Show(a) {\n"
+            "  Print(a);\n"
+            "  return a;\n"
+            "}\n"
+            "Main() {\n"
+            "  Print(Add(1, Show(2)));\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            leaf = assembly[assembly.index("Add:"):assembly.index("Show:")]
+            self.assertIn("movq %rdi, %r10", leaf)
+            self.assertNotIn("push %r14", leaf)
+            caller = assembly[assembly.index("Show:"):assembly.index("Main:")]
+            self.assertIn("push %r14", caller)
+
+    def test_frameless_leaf_function(self):
+        source = (
+            "Function Twice(a) {\n"
+            "  return a + a;\n"
+            "}\n"
+            "Main() {\n"
+            "  Print(Twice(4));\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            leaf = assembly[assembly.index("Twice:"):assembly.index("Main:")]
+            self.assertNotIn("%rbp", leaf)
+            self.assertNotIn("leave", leaf)
+
+    def test_call_loads_simple_args_directly(self):
+        source = (
+            "Function Sum(a, b, c, d, e, f, g) {\n"
+            "  return a + g;\n"
+            "}\n"
+            "Main() {\n"
+            "  var int x = 3;\n"
+            "  Print(Sum(1, x, 0, 4, 5, 6, 7));\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("movq $1, %rdi", body)
+            self.assertIn("xorl %edx, %edx", body)
+            self.assertNotIn("pop %rdi", body)
+            # The seventh argument stays on the stack, padded to 16 bytes
+            self.assertIn("call Sum\naddq $16, %rsp", body)
+
+    def test_countdown_loop_is_dec_jnz(self):
+        source = (
+            "Main() {\n"
+            "  var int i = 10;\n"
+            "  while (i > 0) { i = i - 1; }\n"
+            "  Print(i);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            self.assertRegex(assembly, r"(while_fast\d+):\ndecq %rax\njnz \1\n")
+
+    def test_simple_right_operand_skips_stack(self):
+        source = (
+            "Main() {\n"
+            "  var int x = 2;\n"
+            "  var int y = x * 10;\n"
+            "  Print(y - x);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("imulq $10, %rax, %rax", body)
+            self.assertIn("subq %rbx, %rax", body)
+            self.assertNotIn("push %rax", body)
+
+    def test_power_of_two_arithmetic_avoids_idiv(self):
+        source = (
+            "var int G = 6 * 7;\n"
+            "Main() {\n"
+            "  var int x = argc;\n"
+            "  Print(x * 8 - x / 4 + x * 5);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("shlq $3, %rax", body)
+            self.assertIn("shrq $62, %rdx", body)
+            self.assertIn("sarq $2, %rax", body)
+            self.assertIn("leaq (%rax,%rax,4), %rax", body)
+            self.assertNotIn("idivq", body)
+            self.assertIn("G:\n.quad 42", assembly)
+
+    def test_constant_expressions_fold(self):
+        source = (
+            "Main() {\n"
+            "  var int x = (1 + 2) * 3 - -4;\n"
+            "  Print(x);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("movq $13, %rax", body)
+            self.assertNotIn("imulq", body)
+            self.assertNotIn("negq", body)
+
+    def test_add_immediate_and_register_sum_use_lea(self):
+        source = (
+            "Function Sum(a, b) {\n"
+            "  return a + b;\n"
+            "}\n"
+            "Main() {\n"
+            "  var int x = 2;\n"
+            "  var int y = x - 4;\n"
+            "  Print(Sum(y, 1));\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            self.assertIn("leaq (%r10,%r11,1), %rax", assembly[assembly.index("Sum:"):assembly.index("Main:")])
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("leaq -4(%rax), %rax", body)
+            self.assertNotIn("subq %rbx", body)
+
+    def test_identical_string_literals_share_a_label(self):
+        source = (
+            "Main() {\n"
+            '  Print("hi\\n");\n'
+            '  Print("hi\\n");\n'
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            self.assertEqual(assembly.count(".asciz \"hi\\n\""), 1)
+            self.assertIn(".section .rodata\n.str", assembly)
+
+    def test_print_constant_is_preformatted(self):
+        source = (
+            "Main() {\n"
+            "  Print(6 * 7);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("call print_string", body)
+            self.assertNotIn("call print_int", body)
+            self.assertIn('.asciz "42\\n"', assembly)
+
+    def test_function_and_loop_heads_are_aligned(self):
+        source = (
+            "Main() {\n"
+            "  var int x = 0;\n"
+            "  while (x < 10) { x = x + 1; }\n"
+            "  Print(x);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            self.assertIn(".p2align 4, 0x90\nMain:", assembly)
+            self.assertIn(".p2align 4, 0x90\nwhile_fast", assembly)
+
+    def test_hot_locals_live_in_registers(self):
+        source = (
+            "Function Sum(n) {\n"
+            "  var total = 0;\n"
+            "  var i = 0;\n"
+            "  while (i < n) { total = total + i; i = i + 1; }\n"
+            "  return total;\n"
+            "}\n"
+            "Main() {\n"
+            "  var s = 0;\n"
+            "  for k in 1..3 { s = s + Sum(k); }\n"
+            "  Print(s);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            leaf = assembly[assembly.index("Sum:"):assembly.index("Main:")]
+            self.assertNotIn("(%rbp)", leaf)
+            self.assertNotIn("push", leaf)
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            # Without parameters, Main's locals take the callee-saved registers
+            self.assertIn("push %r14", body)
+            self.assertIn("incq %r14", body)
+            self.assertNotIn("(%rbp)", body)
+
+    def test_zero_checks_use_test(self):
+        source = (
+            "Main() {\n"
+            "  var bool done = false;\n"
+            "  if (done) { Print(1); }\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("testq %rax, %rax", body)
+            self.assertNotIn("cmpq $0,", body)
+
+    def test_sha256_dispatches_to_sha_ni(self):
+        source = (
+            "Main() {\n"
+            '  Print(SHA256("abc"));\n'
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            self.assertIn("call vyl_sha_ni_probe", assembly)
+            self.assertIn("call SHA256", assembly)
+            self.assertEqual(assembly.count("sha256rnds2"), 32)
+            self.assertIn(".long 0x428a2f98, 0x71374491", assembly)
+            self.assertIn("punpcklbw %xmm3, %xmm1", assembly)
+            self.assertNotIn("sha256_hex_loop", assembly)
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("movl $3, %esi\ncall vyl_sha256\n", body)
+
     def test_include_merges_local_file(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             base_path = Path(tmpdir) / "main.vyl"
@@ -145,6 +598,126 @@ class CompilerPipelineTests(unittest.TestCase):
             self.assertTrue(out_path.exists())
             self.assertIn("z", out_path.read_text())
 
+    def test_runtime_is_shared_between_compilations(self):
+        sources = [
+            "Main() {\n  var int x = 1;\n  Print(x);\n}\n",
+            "Main() {\n  var int x = 2;\n  var int y = x;\n  Print(y);\n}\n",
+        ]
+        runtimes = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for idx, source in enumerate(sources):
+                out_path = Path(tmpdir) / f"program{idx}.s"
+                success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+                self.assertTrue(success)
+                assembly = out_path.read_text()
+                start = assembly.index(".globl print_int")
+                runtimes.append(assembly[start:])
+        self.assertIn("vyl_alloc:", runtimes[0])
+        self.assertEqual(runtimes[0], runtimes[1])
+
+    def test_download_failure_closes_tls_socket(self):
+        source = "Main() {\n  Print(1);\n}\n"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            fail = assembly[assembly.index("vyl_http_dl_fail_conn:"):assembly.index("vyl_http_dl_fail_close:")]
+            self.assertIn("call vyl_tls_close", fail)
+            self.assertNotIn("call SSL_free", fail)
+
+    def test_free_goes_through_runtime_unlink(self):
+        source = (
+            "Main() {\n"
+            "  var p = Alloc(24);\n"
+            "  Free(p);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("call vyl_free", body)
+            self.assertNotIn("call free", body)
+            self.assertIn("vyl_slab_refill:", assembly)
+            # Constant-time unlink: no jump back to a label inside vyl_free
+            start = assembly.index("vyl_free:")
+            free_lines = assembly[start:assembly.index("vyl_free_done:", start)].splitlines()
+            seen = set()
+            for line in free_lines:
+                if line.endswith(":"):
+                    seen.add(line[:-1])
+                elif line.startswith("j"):
+                    self.assertNotIn(line.split()[1], seen, line)
+            self.assertIn("subq $32, %rdi", free_lines)
+
+    def test_write_passes_literal_length(self):
+        source = (
+            "Main() {\n"
+            "  var f = Open(\"out.txt\", \"w\");\n"
+            "  Write(f, \"h\u00e9llo\\n\");\n"
+            "  var s = \"dyn\";\n"
+            "  Write(f, s);\n"
+            "  Close(f);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("movl $7, %edx\ncall vyl_write_all", body)
+            self.assertIn("call vyl_write_str", body)
+            self.assertNotIn("call strlen", body)
+
+    def test_runtime_opens_each_data_section_once(self):
+        source = "Main() {\n  var int x = 1;\n  Print(x);\n}\n"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            for section in (".rodata", ".data", ".bss"):
+                self.assertEqual(assembly.count(f".section {section}\n"), 1, section)
+            self.assertLess(assembly.index(".section .rodata"), assembly.index(".section .data"))
+
+    def test_zeroed_allocations_use_vyl_calloc(self):
+        source = (
+            "Struct P {\n"
+            "    var int x;\n"
+            "    var int y;\n"
+            "}\n"
+            "Function Main() {\n"
+            "    var P p = new P{y: 4};\n"
+            "    var a = Array(8);\n"
+            "}\n"
+        )
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            body = assembly[assembly.index("Main:"):assembly.index(".globl main")]
+            self.assertIn("call vyl_calloc", body)
+            self.assertNotIn("call vyl_alloc", body)
+            self.assertNotIn("movq $0, 0(%r12)", body)
+
+    def test_collect_marks_in_bitmap(self):
+        source = "Main() {\n  var p = Alloc(24);\n  GC();\n}\n"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_path = Path(tmpdir) / "program.s"
+            success = self.main_mod.compile_vyl(source, str(out_path), generate_assembly_only=True)
+            self.assertTrue(success)
+            assembly = out_path.read_text()
+            collect = assembly[assembly.index("vyl_collect:"):assembly.index("vyl_sweep_done:")]
+            self.assertIn("btsq %rsi, (%r11)", collect)
+            self.assertIn("tzcntq %r13, %rcx", collect)
+            self.assertNotIn("orq $1", collect)
+            self.assertNotIn("andq $-2", collect)
+
     def test_keystone_emits_bin_when_available(self):
         try:
             import keystone  # type: ignore  # noqa: F401